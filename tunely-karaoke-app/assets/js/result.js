@@ -1,19 +1,203 @@
 document.addEventListener('DOMContentLoaded', () => {
     const video = document.getElementById('karaoke-video');
+    const audio = document.getElementById('karaoke-audio');
+    const videoContainer = document.getElementById('video-container');
+    const lyricsContainer = document.getElementById('lyrics-container');
+    const lyricsDisplay = document.getElementById('lyrics-display');
     const playPauseBtn = document.getElementById('play-pause-btn');
     const downloadBtn = document.getElementById('download-btn');
     const resultTitle = document.querySelector('.result-title');
 
+    const API_BASE = 'http://127.0.0.1:5000';
+    const POLL_INTERVAL_MS = 3000;
+
     // --- Get video URL from the page's query parameter ---
     const params = new URLSearchParams(window.location.search);
     const videoUrlPath = params.get('video');
+    const jobId = params.get('job');
+    const lyricsUrlPath = params.get('lyrics');
+    const audioUrlPath = params.get('audio');
+
+    // The element the play button controls: the video, or the audio in lyrics mode.
+    let media = video;
+
+    // Swaps the preview for the full-quality video, keeping the playback position.
+    function showFullVideo(videoUrl) {
+        const position = video.currentTime;
+        const wasPlaying = !video.paused && !video.ended;
+        video.src = `${API_BASE}${videoUrl}`;
+        video.addEventListener('loadedmetadata', () => {
+            video.currentTime = Math.min(position, video.duration || position);
+            if (wasPlaying) {
+                video.play();
+            }
+        }, { once: true });
+        downloadBtn.href = `${API_BASE}${videoUrl}`;
+        downloadBtn.classList.remove('disabled');
+        resultTitle.textContent = "Your Video is Ready!";
+    }
+
+    async function waitForFullVideo() {
+        try {
+            const response = await fetch(`${API_BASE}/api/jobs/${encodeURIComponent(jobId)}`);
+            const job = await response.json();
+            if (response.ok && job.ready === 'full') {
+                showFullVideo(job.video_url);
+                return;
+            }
+            if (!response.ok || job.status === 'failed') {
+                resultTitle.textContent = "Preview only - the full-quality video failed.";
+                return;
+            }
+        } catch (error) {
+            console.error('Error:', error);
+        }
+        setTimeout(waitForFullVideo, POLL_INTERVAL_MS);
+    }
+
+    // --- Lyrics mode: highlight the timed lyrics in sync with the audio ---
+    // Document layout: see backend/processing/lyrics_exporter.py
+    let lines = [];
+    let lineElements = [];
+    let shownLine = -1;
 
-    if (videoUrlPath) {
+    function buildLines(lyrics) {
+        lines = lyrics.lines;
+        lineElements = lines.map(line => {
+            const element = document.createElement('div');
+            element.className = `lyrics-line speaker-${line.speaker % 2}`;
+            line.words.forEach(([text], i) => {
+                const word = document.createElement('span');
+                word.className = 'lyrics-word';
+                word.textContent = i > 0 ? ` ${text}` : text;
+                element.appendChild(word);
+            });
+            return element;
+        });
+    }
+
+    // Index of the last line starting at or before the time (binary search).
+    function findLine(time) {
+        let low = 0;
+        let high = lines.length - 1;
+        let found = 0;
+        while (low <= high) {
+            const middle = (low + high) >> 1;
+            if (lines[middle].start <= time) {
+                found = middle;
+                low = middle + 1;
+            } else {
+                high = middle - 1;
+            }
+        }
+        return found;
+    }
+
+    function updateLyrics() {
+        if (lines.length === 0) {
+            return;
+        }
+        const time = audio.currentTime;
+        const index = findLine(time);
+        if (index !== shownLine) {
+            // Show the current line with the next one below it.
+            lyricsDisplay.replaceChildren(...lineElements.slice(index, index + 2));
+            shownLine = index;
+        }
+        const line = lines[index];
+        const element = lineElements[index];
+        element.classList.toggle('active', time >= line.start);
+        line.words.forEach(([, start], i) => {
+            element.children[i].classList.toggle('sung', time >= start);
+        });
+    }
+
+    function animateLyrics() {
+        updateLyrics();
+        if (!audio.paused && !audio.ended) {
+            requestAnimationFrame(animateLyrics);
+        }
+    }
+
+    async function loadLyrics() {
+        try {
+            const response = await fetch(`${API_BASE}${lyricsUrlPath}`);
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
+            }
+            buildLines(await response.json());
+            updateLyrics();
+        } catch (error) {
+            console.error('Error:', error);
+            resultTitle.textContent = "Could not load the lyrics.";
+        }
+    }
+
+    // The video is only rendered when the user asks to download it.
+    async function renderVideo() {
+        downloadBtn.classList.add('disabled');
+        downloadBtn.textContent = 'Rendering Video...';
+        try {
+            const response = await fetch(`${API_BASE}/api/jobs/${encodeURIComponent(jobId)}/render`, { method: 'POST' });
+            const result = await response.json();
+            if (!response.ok) {
+                throw new Error(result.error || 'Failed to start rendering.');
+            }
+            while (true) {
+                const statusResponse = await fetch(`${API_BASE}${result.status_url}`);
+                const job = await statusResponse.json();
+                if (statusResponse.ok && job.ready === 'full') {
+                    downloadBtn.href = `${API_BASE}${job.video_url}`;
+                    downloadBtn.textContent = 'Download Video';
+                    downloadBtn.classList.remove('disabled');
+                    return;
+                }
+                if (!statusResponse.ok || job.status === 'failed') {
+                    throw new Error(job.error || 'Failed to render the video.');
+                }
+                await new Promise(resolve => setTimeout(resolve, POLL_INTERVAL_MS));
+            }
+        } catch (error) {
+            console.error('Error:', error);
+            downloadBtn.textContent = 'Render Video';
+            downloadBtn.classList.remove('disabled');
+            alert(`Rendering failed: ${error.message}`);
+        }
+    }
+
+    if (lyricsUrlPath && audioUrlPath) {
+        media = audio;
+        videoContainer.hidden = true;
+        lyricsContainer.hidden = false;
+        audio.src = `${API_BASE}${audioUrlPath}`;
+        resultTitle.textContent = "Your Karaoke is Ready!";
+        audio.addEventListener('play', () => requestAnimationFrame(animateLyrics));
+        audio.addEventListener('seeked', updateLyrics);
+        loadLyrics();
+
+        downloadBtn.textContent = 'Render Video';
+        downloadBtn.removeAttribute('href');
+        downloadBtn.addEventListener('click', (event) => {
+            if (!downloadBtn.href) {
+                event.preventDefault();
+                if (jobId && !downloadBtn.classList.contains('disabled')) {
+                    renderVideo();
+                }
+            }
+        });
+    } else if (videoUrlPath) {
         // Construct the full URL to the backend server
-        const fullVideoUrl = `http://127.0.0.1:5000${videoUrlPath}`;
+        const fullVideoUrl = `${API_BASE}${videoUrlPath}`;
         
         video.src = fullVideoUrl;
         downloadBtn.href = fullVideoUrl;
+
+        if (jobId && videoUrlPath.endsWith('_preview.mp4')) {
+            // Playing the quick preview; the full-quality encode is still running.
+            resultTitle.textContent = "Preview ready - full quality on the way...";
+            downloadBtn.classList.add('disabled');
+            waitForFullVideo();
+        }
     } else {
         resultTitle.textContent = "Could not find video.";
         playPauseBtn.disabled = true;
@@ -22,24 +206,24 @@ document.addEventListener('DOMContentLoaded', () => {
 
 
     function togglePlay() {
-        if (video.paused || video.ended) {
-            video.play();
+        if (media.paused || media.ended) {
+            media.play();
         } else {
-            video.pause();
+            media.pause();
         }
     }
 
     playPauseBtn.addEventListener('click', togglePlay);
 
-    video.addEventListener('play', () => {
+    media.addEventListener('play', () => {
         playPauseBtn.textContent = 'Pause';
     });
 
-    video.addEventListener('pause', () => {
+    media.addEventListener('pause', () => {
         playPauseBtn.textContent = 'Play';
     });
     
-    video.addEventListener('ended', () => {
+    media.addEventListener('ended', () => {
         playPauseBtn.textContent = 'Replay';
     });
 });
@@ -1,107 +1,369 @@
-import os
-from flask import Flask, request, jsonify, send_file
-from werkzeug.utils import secure_filename
-import uuid # To generate unique filenames
-
-# --- Configuration ---
-UPLOAD_FOLDER = 'uploads'
-OUTPUT_FOLDER = 'outputs'
-ALLOWED_EXTENSIONS = {'mp3', 'wav', 'm4a', 'flac'}
-
-app = Flask(__name__)
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['OUTPUT_FOLDER'] = OUTPUT_FOLDER
-
-# --- Helper Functions ---
-def allowed_file(filename):
-    """Checks if the uploaded file has an allowed extension."""
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
-
-def create_folders():
-    """Creates necessary folders if they don't exist."""
-    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-    os.makedirs(OUTPUT_FOLDER, exist_ok=True)
-
-# --- Main API Endpoint ---
-@app.route('/api/process-karaoke', methods=['POST'])
-def process_karaoke():
-    """
-    The main endpoint to handle audio upload and karaoke video generation.
-    """
-    # 1. --- Handle File Upload ---
-    if 'file' not in request.files:
-        return jsonify({"error": "No file part in the request"}), 400
-    
-    file = request.files['file']
-
-    if file.filename == '':
-        return jsonify({"error": "No file selected"}), 400
-
-    if file and allowed_file(file.filename):
-        # Generate a unique ID for this request to prevent filename conflicts
-        request_id = str(uuid.uuid4())
-        original_filename = secure_filename(file.filename)
-        input_audio_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{request_id}_{original_filename}")
-        file.save(input_audio_path)
-        
-        print(f"File saved to: {input_audio_path}")
-
-        try:
-            # --- PROCESSING PIPELINE ---
-            
-            # 2. --- Audio Separation (Vocals & Instrumental) ---
-            # TODO: Implement logic from processing/audio_separator.py
-            # This function should take `input_audio_path` and return two paths:
-            # `vocal_track_path` and `instrumental_track_path`
-            print("Step 2: Separating audio...")
-            # instrumental_track_path, vocal_track_path = separate_audio(input_audio_path)
-            
-            # 3. --- Transcription (Word-level Timestamps) ---
-            # TODO: Implement logic from processing/transcriber.py
-            # This function should take `vocal_track_path` and return a data structure
-            # with words, start times, and end times.
-            print("Step 3: Transcribing vocals...")
-            # transcription_data = transcribe_vocals(vocal_track_path)
-
-            # 4. --- Speaker Diarization (Optional but required for color-coding) ---
-            # TODO: Implement speaker detection on `vocal_track_path`
-            # This would update `transcription_data` with speaker labels (e.g., 'SPEAKER_00', 'SPEAKER_01')
-            print("Step 4: Detecting speakers...")
-            # transcription_data_with_speakers = detect_speakers(vocal_track_path, transcription_data)
-
-            # 5. --- Generate .ass Subtitle File ---
-            # TODO: Implement logic from processing/subtitle_generator.py
-            # This function takes the final transcription data and creates a .ass file.
-            print("Step 5: Generating karaoke subtitles...")
-            # ass_subtitle_path = generate_ass_file(transcription_data_with_speakers, request_id)
-
-            # 6. --- Burn Subtitles into Video using FFmpeg ---
-            # TODO: Implement logic from processing/video_creator.py
-            # This function combines a background, the instrumental track, and the .ass subtitles.
-            print("Step 6: Creating final video...")
-            output_video_path = os.path.join(app.config['OUTPUT_FOLDER'], f"{request_id}.mp4")
-            # create_video(instrumental_track_path, ass_subtitle_path, output_video_path)
-            
-            # --- For Demo Purposes: We'll just return a success message for now ---
-            # In the real implementation, you would return the path to the video
-            return jsonify({
-                "message": "Processing complete!",
-                "video_url": f"/outputs/{request_id}.mp4" # URL the frontend can use
-            }), 200
-
-        except Exception as e:
-            # Basic error handling
-            print(f"An error occurred: {e}")
-            return jsonify({"error": "Failed to process the audio file. Please try again."}), 500
-    else:
-        return jsonify({"error": "File type not allowed"}), 400
-
-@app.route('/outputs/<filename>')
-def get_output_video(filename):
-    """Serves the generated video file to the user."""
-    return send_file(os.path.join(app.config['OUTPUT_FOLDER'], filename))
-
-if __name__ == '__main__':
-    create_folders()
-    app.run(debug=True, port=5000) # Runs on http://127.0.0.1:5000
+import os
+import mimetypes
+from flask import Flask, Request, Response, request, jsonify, send_from_directory, abort, make_response
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+from werkzeug.utils import secure_filename
+import uuid # To generate unique filenames
+import threading
+from job_queue import JobQueue
+from processing.audio_separator import CHUNK_OVERLAP_SECONDS
+from processing.pipeline import OUTPUT_TARGETS
+from processing.scheduler import SHORT_TRACK_SECONDS, parse_budgets
+from processing.subtitle_generator import SUBTITLE_STYLES
+from processing.upload_ingest import UploadIngest
+
+# --- Configuration ---
+UPLOAD_FOLDER = 'uploads'
+OUTPUT_FOLDER = 'outputs'
+WORK_FOLDER = 'work' # Intermediate files (stems, subtitles) per request
+CACHE_FOLDER = 'cache' # Stage outputs keyed by audio content hash
+BACKGROUND_FOLDER = 'backgrounds' # Background videos users can pick from
+BACKGROUND_CACHE_FOLDER = 'background_cache' # Backgrounds transcoded to the output formats, by content hash
+CHECKPOINT_FOLDER = 'checkpoints' # Completed stages per request, to retry or resume a job from
+MAX_UPLOAD_BYTES = int(os.environ.get('TUNELY_MAX_UPLOAD_MB', 200)) * 1024 * 1024 # Larger uploads get a 413
+CACHE_MAX_BYTES = int(os.environ.get('TUNELY_CACHE_MAX_MB', 10 * 1024)) * 1024 * 1024
+CHECKPOINT_MAX_BYTES = int(os.environ.get('TUNELY_CHECKPOINT_MAX_MB', 5 * 1024)) * 1024 * 1024
+CHECKPOINT_MAX_AGE = int(os.environ.get('TUNELY_CHECKPOINT_MAX_AGE_HOURS', 24)) * 3600 # Then checkpoints are removed
+MAX_WORKERS = int(os.environ.get('TUNELY_MAX_WORKERS', 2)) # Size of the processing pool
+PRELOAD_MODELS = os.environ.get('TUNELY_PRELOAD_MODELS', '0') == '1' # Load models when a worker starts
+PRELOAD_BACKGROUNDS = os.environ.get('TUNELY_PRELOAD_BACKGROUNDS', '1') == '1' # Normalize backgrounds when a worker starts
+MIN_AVAILABLE_MB = int(os.environ.get('TUNELY_MIN_AVAILABLE_MB', 1024)) # Evict models below this much free RAM
+MODEL_IDLE_SECONDS = int(os.environ.get('TUNELY_MODEL_IDLE_SECONDS', 0)) or None # Evict models unused this long
+# Cores the CPU-heavy stages of all workers share, and per stage kind how many run at once
+# and with how many threads, e.g. 'separation=1x4,render=3x2' (see processing/scheduler.py).
+CPU_CORES = int(os.environ.get('TUNELY_CPU_CORES', 0)) or os.cpu_count() or 1
+STAGE_BUDGETS = parse_budgets(os.environ.get('TUNELY_STAGE_BUDGETS'), CPU_CORES)
+# Tracks up to this long are scheduled ahead of longer ones.
+SHORT_TRACK_SECONDS = float(os.environ.get('TUNELY_SHORT_TRACK_SECONDS', SHORT_TRACK_SECONDS))
+MAX_QUEUED_JOBS = int(os.environ.get('TUNELY_MAX_QUEUED_JOBS', 20)) # Then uploads get a 429 (0 = no limit)
+RENDER_WORKERS = int(os.environ.get('TUNELY_RENDER_WORKERS', 1)) # Parallel FFmpeg segment renders per video
+# Separate long tracks in chunks of this many seconds to bound memory (0 = whole file at once)
+SEPARATION_CHUNK_SECONDS = float(os.environ.get('TUNELY_SEPARATION_CHUNK_SECONDS', 0)) or None
+if SEPARATION_CHUNK_SECONDS and SEPARATION_CHUNK_SECONDS <= CHUNK_OVERLAP_SECONDS:
+    raise ValueError(f"TUNELY_SEPARATION_CHUNK_SECONDS must be more than the {CHUNK_OVERLAP_SECONDS}s chunk overlap")
+SEPARATION_WORKERS = int(os.environ.get('TUNELY_SEPARATION_WORKERS', 1)) # Chunks separated in parallel per job
+# One shared Whisper process decoding the windows of all running jobs in batches.
+BATCH_TRANSCRIPTION = os.environ.get('TUNELY_BATCH_TRANSCRIPTION', '0') == '1'
+TRANSCRIPTION_BATCH_SIZE = int(os.environ.get('TUNELY_TRANSCRIPTION_BATCH_SIZE', 8)) # Most windows per batch
+TRANSCRIPTION_MAX_WAIT_MS = int(os.environ.get('TUNELY_TRANSCRIPTION_MAX_WAIT_MS', 200)) # Wait for a batch to fill
+OUTPUT_MAX_AGE = int(os.environ.get('TUNELY_OUTPUT_MAX_AGE', 3600)) # Browser cache lifetime of /outputs/ files
+# Let the front proxy send /outputs/ files: '1' makes Flask set X-Sendfile (Apache, lighttpd),
+# and an internal location prefix (e.g. '/protected-outputs/') sets nginx's X-Accel-Redirect instead.
+USE_X_SENDFILE = os.environ.get('TUNELY_X_SENDFILE', '0') == '1'
+X_ACCEL_PREFIX = os.environ.get('TUNELY_X_ACCEL_PREFIX') or None
+ALLOWED_EXTENSIONS = {'mp3', 'wav', 'm4a', 'flac'}
+
+class UploadRequest(Request):
+    """
+    Streams the song upload into processing.upload_ingest, which checks and
+    decodes it while it arrives, instead of spooling it to a temporary file.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.endpoint != 'process_karaoke' or not (filename and allowed_file(filename)):
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+        return UploadIngest(app.config['UPLOAD_FOLDER'], filename, max_bytes=app.config['MAX_CONTENT_LENGTH'])
+
+app = Flask(__name__)
+app.request_class = UploadRequest
+app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES # Checked by Flask and again while streaming
+app.config['OUTPUT_FOLDER'] = OUTPUT_FOLDER
+app.config['WORK_FOLDER'] = WORK_FOLDER
+app.config['CACHE_FOLDER'] = CACHE_FOLDER
+app.config['BACKGROUND_FOLDER'] = BACKGROUND_FOLDER
+app.config['BACKGROUND_CACHE_FOLDER'] = BACKGROUND_CACHE_FOLDER
+app.config['CHECKPOINT_FOLDER'] = CHECKPOINT_FOLDER
+app.config['CACHE_MAX_BYTES'] = CACHE_MAX_BYTES
+app.config['CHECKPOINT_MAX_BYTES'] = CHECKPOINT_MAX_BYTES
+app.config['CHECKPOINT_MAX_AGE'] = CHECKPOINT_MAX_AGE
+app.config['MAX_WORKERS'] = MAX_WORKERS
+app.config['PRELOAD_MODELS'] = PRELOAD_MODELS
+app.config['PRELOAD_BACKGROUNDS'] = PRELOAD_BACKGROUNDS
+app.config['MIN_AVAILABLE_MB'] = MIN_AVAILABLE_MB
+app.config['MODEL_IDLE_SECONDS'] = MODEL_IDLE_SECONDS
+app.config['CPU_CORES'] = CPU_CORES
+app.config['STAGE_BUDGETS'] = STAGE_BUDGETS
+app.config['SHORT_TRACK_SECONDS'] = SHORT_TRACK_SECONDS
+app.config['MAX_QUEUED_JOBS'] = MAX_QUEUED_JOBS
+app.config['RENDER_WORKERS'] = RENDER_WORKERS
+app.config['SEPARATION_CHUNK_SECONDS'] = SEPARATION_CHUNK_SECONDS
+app.config['SEPARATION_WORKERS'] = SEPARATION_WORKERS
+app.config['BATCH_TRANSCRIPTION'] = BATCH_TRANSCRIPTION
+app.config['TRANSCRIPTION_BATCH_SIZE'] = TRANSCRIPTION_BATCH_SIZE
+app.config['TRANSCRIPTION_MAX_WAIT_MS'] = TRANSCRIPTION_MAX_WAIT_MS
+app.config['OUTPUT_MAX_AGE'] = OUTPUT_MAX_AGE
+app.config['USE_X_SENDFILE'] = USE_X_SENDFILE
+app.config['X_ACCEL_PREFIX'] = X_ACCEL_PREFIX
+
+job_queue = None # Created at startup or on first use, so the worker pool is not started on import
+job_queue_lock = threading.Lock()
+
+# --- Helper Functions ---
+def allowed_file(filename):
+    """Checks if the uploaded file has an allowed extension."""
+    return '.' in filename and \
+           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+def create_folders():
+    """Creates necessary folders if they don't exist."""
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+    os.makedirs(WORK_FOLDER, exist_ok=True)
+    os.makedirs(CACHE_FOLDER, exist_ok=True)
+    os.makedirs(BACKGROUND_FOLDER, exist_ok=True)
+    os.makedirs(BACKGROUND_CACHE_FOLDER, exist_ok=True)
+    os.makedirs(CHECKPOINT_FOLDER, exist_ok=True)
+
+def parse_options(form):
+    """
+    Reads the optional pipeline settings from the upload form.
+
+    Returns:
+        tuple: (options, error). options is a dict for the pipeline, error is
+               a message if a setting is invalid, else None.
+    """
+    options = {
+        'render_workers': app.config['RENDER_WORKERS'],
+        'separation_chunk_seconds': app.config['SEPARATION_CHUNK_SECONDS'],
+        'separation_workers': app.config['SEPARATION_WORKERS'],
+    }
+
+    language = form.get('language', '').strip().lower()
+    if language:
+        # 'auto' lets Whisper detect the language itself.
+        options['language'] = None if language == 'auto' else language
+
+    words_per_line = form.get('words_per_line', '').strip()
+    if words_per_line:
+        if not words_per_line.isdigit() or not 1 <= int(words_per_line) <= 20:
+            return None, "words_per_line must be a number between 1 and 20"
+        options['words_per_line'] = int(words_per_line)
+
+    style = form.get('style', '').strip()
+    if style:
+        if style not in SUBTITLE_STYLES:
+            return None, f"Unknown style. Choose one of: {', '.join(SUBTITLE_STYLES)}"
+        options['style'] = style
+
+    output_mode = form.get('output_mode', '').strip()
+    if output_mode:
+        # 'lyrics' skips the video encode; the result page highlights the lyrics itself.
+        if output_mode not in OUTPUT_TARGETS:
+            return None, f"Unknown output mode. Choose one of: {', '.join(OUTPUT_TARGETS)}"
+        options['output_mode'] = output_mode
+
+    background = form.get('background', '').strip()
+    if background:
+        background_path = os.path.join(app.config['BACKGROUND_FOLDER'], secure_filename(background))
+        if not os.path.isfile(background_path):
+            return None, "Unknown background video"
+        options['background_video_path'] = background_path
+
+    return options, None
+
+def get_job_queue():
+    """Returns the shared job queue, starting the worker pool on first use."""
+    global job_queue
+    with job_queue_lock:
+        if job_queue is None:
+            create_folders()
+            job_queue = JobQueue(
+                output_dir=app.config['OUTPUT_FOLDER'],
+                work_dir=app.config['WORK_FOLDER'],
+                max_workers=app.config['MAX_WORKERS'],
+                preload_models=app.config['PRELOAD_MODELS'],
+                min_available_mb=app.config['MIN_AVAILABLE_MB'],
+                max_idle_seconds=app.config['MODEL_IDLE_SECONDS'],
+                cache_dir=app.config['CACHE_FOLDER'],
+                cache_max_bytes=app.config['CACHE_MAX_BYTES'],
+                batch_transcription=app.config['BATCH_TRANSCRIPTION'],
+                transcription_batch_size=app.config['TRANSCRIPTION_BATCH_SIZE'],
+                transcription_max_wait=app.config['TRANSCRIPTION_MAX_WAIT_MS'] / 1000,
+                background_cache_dir=app.config['BACKGROUND_CACHE_FOLDER'],
+                background_dir=app.config['BACKGROUND_FOLDER'],
+                preload_backgrounds=app.config['PRELOAD_BACKGROUNDS'],
+                checkpoint_dir=app.config['CHECKPOINT_FOLDER'],
+                checkpoint_max_bytes=app.config['CHECKPOINT_MAX_BYTES'],
+                checkpoint_max_age=app.config['CHECKPOINT_MAX_AGE'],
+                stage_budgets=app.config['STAGE_BUDGETS'],
+                cpu_cores=app.config['CPU_CORES'],
+                short_track_seconds=app.config['SHORT_TRACK_SECONDS'],
+                max_queued_jobs=app.config['MAX_QUEUED_JOBS']
+            )
+    return job_queue
+
+@app.errorhandler(RequestEntityTooLarge)
+@app.errorhandler(UnsupportedMediaType)
+def upload_rejected(e):
+    """Answers rejected uploads (too large, not audio) in the API's JSON format."""
+    return jsonify({"error": e.description}), e.code
+
+# --- Main API Endpoint ---
+@app.route('/api/process-karaoke', methods=['POST'])
+def process_karaoke():
+    """
+    The main endpoint to handle audio upload. The karaoke pipeline runs in a
+    background worker; this only queues the job and returns its ID.
+    """
+    # 0. --- Backpressure ---
+    # Checked before the upload is read, so a busy server doesn't take it in first.
+    retry_after = get_job_queue().retry_after()
+    if retry_after:
+        response = jsonify({
+            "error": f"The server is busy. Please try again in {retry_after} seconds.",
+            "retry_after": retry_after
+        })
+        response.headers['Retry-After'] = str(retry_after)
+        return response, 429
+
+    # 1. --- Handle File Upload ---
+    if 'file' not in request.files:
+        return jsonify({"error": "No file part in the request"}), 400
+    
+    file = request.files['file']
+
+    if file.filename == '':
+        return jsonify({"error": "No file selected"}), 400
+
+    options, error = parse_options(request.form)
+    if error:
+        return jsonify({"error": error}), 400
+
+    if file and allowed_file(file.filename):
+        # Generate a unique ID for this request to prevent filename conflicts
+        request_id = str(uuid.uuid4())
+        original_filename = secure_filename(file.filename)
+        name = os.path.splitext(original_filename)[0]
+        input_audio_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{request_id}_{name}.wav")
+        # The upload was checked and decoded while it arrived (see UploadRequest);
+        # this waits for the decoder and moves the result into place.
+        file.stream.finish(input_audio_path)
+
+        print(f"File decoded to: {input_audio_path}")
+
+        # 2. --- Queue the Processing Pipeline ---
+        # Separation -> transcription -> diarization -> subtitles -> video
+        # all run in a worker process (see processing/pipeline.py).
+        try:
+            get_job_queue().submit(request_id, input_audio_path, options)
+        except Exception as e:
+            print(f"An error occurred while queueing the job: {e}")
+            return jsonify({"error": "Failed to queue the audio file. Please try again."}), 500
+
+        return jsonify({
+            "message": "Processing started.",
+            "job_id": request_id,
+            "status_url": f"/api/jobs/{request_id}" # URL the frontend polls for progress
+        }), 202
+    else:
+        return jsonify({"error": "File type not allowed"}), 400
+
+@app.route('/api/jobs/<job_id>')
+def get_job_status(job_id):
+    """Reports the status, per-stage progress and (when done) the video URL of a job."""
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job), 200
+
+@app.route('/api/jobs/<job_id>/render', methods=['POST'])
+def render_job_video(job_id):
+    """
+    Queues the video render for a job processed in the 'lyrics' output mode,
+    e.g. when the user wants to download the karaoke video after all.
+    """
+    render_job_id = get_job_queue().submit_render(job_id)
+    if render_job_id is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify({
+        "message": "Rendering started.",
+        "job_id": render_job_id,
+        "status_url": f"/api/jobs/{render_job_id}"
+    }), 202
+
+@app.route('/api/jobs/<job_id>/retry', methods=['POST'])
+def retry_job(job_id):
+    """
+    Runs a failed job again, resuming from the last stage it completed, so
+    the user doesn't have to upload the song again.
+    """
+    retried_job_id = get_job_queue().retry(job_id)
+    if retried_job_id is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify({
+        "message": "Processing resumed.",
+        "job_id": retried_job_id,
+        "status_url": f"/api/jobs/{retried_job_id}"
+    }), 202
+
+@app.route('/api/cache/stats')
+def get_cache_stats():
+    """Reports the size of the result cache and its per-stage hit/miss counters."""
+    return jsonify(get_job_queue().cache_stats() or {}), 200
+
+@app.route('/api/checkpoints/stats')
+def get_checkpoint_stats():
+    """Reports how many requests are checkpointed, by job status, and the checkpoints' total size."""
+    return jsonify(get_job_queue().checkpoint_stats() or {}), 200
+
+@app.route('/api/scheduler/stats')
+def get_scheduler_stats():
+    """Reports the CPU budget per stage kind and how many stages are running and waiting for a slot."""
+    return jsonify(get_job_queue().scheduler_stats()), 200
+
+@app.route('/api/transcriber/stats')
+def get_transcriber_stats():
+    """Reports the batch transcriber's throughput in songs/minute, batch sizes and counters."""
+    return jsonify(get_job_queue().transcriber_stats() or {}), 200
+
+@app.route('/metrics')
+def get_metrics():
+    """
+    Prometheus scrape endpoint: per-stage and per-model histograms of wall
+    time, CPU time, peak memory and real-time factor, model load times and
+    FFmpeg encode fps/speed, recorded by all worker processes.
+    """
+    return Response(get_job_queue().metrics_text(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/outputs/<filename>')
+def get_output_video(filename):
+    """
+    Serves a generated file (video, lyrics, audio) to the user.
+
+    Range requests are answered with 206 so the player can seek without
+    downloading the whole video, and ETag/Last-Modified let browsers
+    revalidate instead of downloading again. The file body is handed to the
+    WSGI server's file wrapper (sendfile under e.g. gunicorn), or to the
+    front proxy when X-Sendfile / X-Accel-Redirect is configured.
+    """
+    # Files still being written are published under a hidden '.part' name.
+    if filename.startswith('.'):
+        abort(404)
+
+    if app.config['X_ACCEL_PREFIX']:
+        filename = secure_filename(filename)
+        if not os.path.isfile(os.path.join(app.config['OUTPUT_FOLDER'], filename)):
+            abort(404)
+        # nginx serves the file itself, including ranges and caching headers.
+        response = make_response('')
+        response.headers['X-Accel-Redirect'] = app.config['X_ACCEL_PREFIX'].rstrip('/') + '/' + filename
+        response.headers['Content-Type'] = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        return response
+
+    return send_from_directory(
+        os.path.abspath(app.config['OUTPUT_FOLDER']), filename,
+        conditional=True, # Range, If-None-Match and If-Modified-Since support
+        etag=True,
+        max_age=app.config['OUTPUT_MAX_AGE']
+    )
+
+if __name__ == '__main__':
+    create_folders()
+    # Start the workers now, so jobs cut short by a restart resume without
+    # waiting for a request. The reloader runs this file in a watcher process
+    # too; only the process serving requests gets a queue.
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        get_job_queue()
+    app.run(debug=True, port=5000) # Runs on http://127.0.0.1:5000
@@ -0,0 +1,94 @@
+"""
+Measures the bytes written for the intermediate audio of one job.
+
+Compares the old layout (float32 WAV stems, which Whisper and pyannote
+each decode and resample again) with the current one (FLAC stems plus the
+single 16 kHz mono vocal track both models share, see processing/vad.py)
+on a synthetic song with an intro, a solo and an outro without vocals.
+
+Needs FFmpeg on the PATH. Run from the backend folder:
+    python -m benchmarks.bench_intermediate_bytes --seconds 240
+"""
+import argparse
+import os
+import subprocess
+import tempfile
+import wave
+
+import numpy as np
+
+from processing.vad import trim_silence
+
+SAMPLE_RATE = 44100
+
+def make_stems(seconds, seed=0):
+    """Builds a stereo instrumental and a vocal stem that is silent in the intro, a solo and the outro."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    chords = sum(0.1 * np.sin(2 * np.pi * f * t) for f in (110.0, 164.8, 220.0))
+    instrumental = chords + 0.02 * rng.standard_normal(len(t))
+
+    melody = 0.3 * np.sin(2 * np.pi * (330 + 20 * np.sin(2 * np.pi * 0.5 * t)) * t)
+    sung = (t > seconds * 0.1) & ~((t > seconds * 0.45) & (t < seconds * 0.6)) & (t < seconds * 0.9)
+    vocals = melody * sung + 0.001 * rng.standard_normal(len(t))
+
+    def stereo(x):
+        return np.stack([x, x * 0.9], axis=1).astype(np.float32)
+    return stereo(instrumental), stereo(vocals)
+
+def write_float_wav(path, samples):
+    # WAVE_FORMAT_IEEE_FLOAT isn't supported by the wave module, so go through FFmpeg.
+    subprocess.run([
+        'ffmpeg', '-v', 'error', '-f', 'f32le', '-ar', str(SAMPLE_RATE), '-ac', '2', '-i', '-',
+        '-c:a', 'pcm_f32le', '-y', path
+    ], input=samples.tobytes(), check=True)
+
+def write_flac(path, samples):
+    subprocess.run([
+        'ffmpeg', '-v', 'error', '-f', 'f32le', '-ar', str(SAMPLE_RATE), '-ac', '2', '-i', '-',
+        '-c:a', 'flac', '-y', path
+    ], input=samples.tobytes(), check=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=240.0, help="Song length in seconds")
+    args = parser.parse_args()
+
+    instrumental, vocals = make_stems(args.seconds)
+    with tempfile.TemporaryDirectory() as work_dir:
+        def path(name):
+            return os.path.join(work_dir, name)
+
+        # Before: two float WAV stems; both models decode the vocals in memory.
+        write_float_wav(path('instrumental.wav'), instrumental)
+        write_float_wav(path('vocals.wav'), vocals)
+        before = {name: os.path.getsize(path(name)) for name in ('instrumental.wav', 'vocals.wav')}
+
+        # After: FLAC stems and the shared 16 kHz vocal track, with and without trimming.
+        write_flac(path('instrumental.flac'), instrumental)
+        write_flac(path('vocals.flac'), vocals)
+        trim_silence(path('vocals.flac'), path('vocals_16k_untrimmed.wav'), trim=False)
+        trim_silence(path('vocals.flac'), path('vocals_16k.wav'))
+        after = {name: os.path.getsize(path(name)) for name in ('instrumental.flac', 'vocals.flac', 'vocals_16k.wav')}
+        untrimmed = os.path.getsize(path('vocals_16k_untrimmed.wav'))
+
+        with wave.open(path('vocals_16k.wav')) as trimmed:
+            trimmed_seconds = trimmed.getnframes() / trimmed.getframerate()
+
+    def megabytes(size):
+        return f"{size / 1024**2:8.1f} MB"
+
+    print(f"{args.seconds:.0f}s song, {trimmed_seconds:.0f}s of vocals left after trimming")
+    print("  before:")
+    for name, size in before.items():
+        print(f"    {name:<20} {megabytes(size)}")
+    print(f"    {'total':<20} {megabytes(sum(before.values()))}")
+    print("  after:")
+    for name, size in after.items():
+        print(f"    {name:<20} {megabytes(size)}")
+    print(f"    {'total':<20} {megabytes(sum(after.values()))}"
+          f"  ({sum(before.values()) / sum(after.values()):.1f}x less)")
+    print(f"  (untrimmed 16 kHz vocals would be {megabytes(untrimmed).strip()})")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,324 @@
+"""
+End-to-end benchmark of the karaoke pipeline on synthetic songs, with the
+ML models replaced by lightweight stand-ins (see benchmarks/stubs.py), so
+it runs offline and gives comparable numbers across commits.
+
+It times every function in processing/ on one song (median of --repeats
+runs), then pushes jobs through the real Flask app and job queue
+(POST /api/process-karaoke, polling /api/jobs/<id>) at each --concurrency
+level, and writes a JSON report.
+
+Needs FFmpeg on the PATH. Run from the backend folder:
+    python -m benchmarks.bench_pipeline --seconds 60 --output bench.json
+    python -m benchmarks.bench_pipeline --compare old.json bench.json
+
+Compare mode prints the change of every timing and exits with status 1
+if any got slower than --threshold (default 15%).
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import stubs
+from benchmarks.synthetic import write_song
+
+REPORT_VERSION = 1
+
+# Timings that differ by less than this are noise, whatever the ratio.
+MIN_DIFFERENCE_SECONDS = 0.05
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=stubs.BACKEND_DIR,
+            check=True, capture_output=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _summarize(seconds):
+    return {
+        'median_seconds': round(statistics.median(seconds), 4),
+        'min_seconds': round(min(seconds), 4),
+        'runs': len(seconds),
+    }
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+# --- Per-function timings ---
+
+def time_functions(song_path, seconds, work_dir, repeats, render_workers):
+    """
+    Runs each processing function on the output of the one before, like
+    the pipeline does, `repeats` times.
+
+    Returns:
+        dict: Function name -> timing summary ({'failed': True} if it failed).
+    """
+    from processing.audio_separator import separate_audio, separate_audio_chunked
+    from processing.lyrics_exporter import generate_lyrics_file
+    from processing.speaker_diarizer import assign_speakers, diarize
+    from processing.subtitle_generator import generate_ass_file
+    from processing.transcriber import transcribe_vocals, transcribe_vocals_streaming
+    from processing.vad import trim_silence
+    from processing.video_creator import create_preview, create_video, create_video_parallel, transcode_audio
+
+    def path(name):
+        return os.path.join(work_dir, name)
+
+    state = {}
+    steps = [
+        ('separate_audio', lambda: separate_audio(song_path, work_dir), 'stems'),
+        ('separate_audio_chunked', lambda: separate_audio_chunked(
+            song_path, path('chunked'), chunk_seconds=max(10.0, seconds / 3)
+        ), None),
+        ('trim_silence', lambda: trim_silence(state['stems'][1], path('vocals_16k.wav')), 'vad'),
+        ('transcribe_vocals', lambda: transcribe_vocals(state['vad'][0]), None),
+        ('transcribe_vocals_streaming', lambda: list(transcribe_vocals_streaming(state['vad'][0])), 'words'),
+        ('diarize', lambda: diarize(state['vad'][0]), 'turns'),
+        ('assign_speakers', lambda: assign_speakers([dict(word) for word in state['words']], state['turns']), 'speakers'),
+        ('generate_ass_file', lambda: generate_ass_file(state['speakers'], work_dir, 'bench'), 'ass'),
+        ('generate_lyrics_file', lambda: generate_lyrics_file(state['speakers'], work_dir, 'bench'), None),
+        ('transcode_audio', lambda: transcode_audio(state['stems'][0], path('audio.m4a')), None),
+        ('create_preview', lambda: create_preview(state['stems'][0], state['ass'], path('preview.mp4')), None),
+        ('create_video', lambda: create_video(state['stems'][0], state['ass'], path('video.mp4')), None),
+        ('create_video_parallel', lambda: create_video_parallel(
+            state['stems'][0], state['ass'], path('video_parallel.mp4'), workers=render_workers
+        ), None),
+    ]
+    os.makedirs(path('chunked'), exist_ok=True)
+
+    results = {}
+    for name, call, keep in steps:
+        timings = []
+        result = None
+        for _ in range(repeats):
+            start = time.perf_counter()
+            result = call()
+            timings.append(time.perf_counter() - start)
+        if result is None or result is False or (isinstance(result, tuple) and None in result):
+            print(f"  {name:<30} FAILED")
+            results[name] = {'failed': True}
+            if keep:
+                raise RuntimeError(f"{name} failed; the functions after it need its output.")
+            continue
+        if keep:
+            state[keep] = result
+        results[name] = _summarize(timings)
+        print(f"  {name:<30} {results[name]['median_seconds']:8.3f}s")
+    return results
+
+# --- End to end through the Flask app ---
+
+def run_jobs(client_factory, songs, form, poll_seconds):
+    """
+    Uploads every song at once and polls until all jobs are finished.
+
+    Returns:
+        dict: Wall time, throughput and latency percentiles for the batch.
+    """
+    def run_one(song_path):
+        client = client_factory()
+        start = time.perf_counter()
+        with open(song_path, 'rb') as f:
+            response = client.post(
+                '/api/process-karaoke', data={**form, 'file': (f, os.path.basename(song_path))},
+                content_type='multipart/form-data'
+            )
+        if response.status_code != 202:
+            return {'failed': True, 'error': response.get_json()}
+        status_url = response.get_json()['status_url']
+        accepted = time.perf_counter() - start
+        playable = None
+        while True:
+            job = client.get(status_url).get_json()
+            if playable is None and job.get('ready'):
+                playable = time.perf_counter() - start
+            if job['status'] in ('done', 'failed'):
+                break
+            time.sleep(poll_seconds)
+        return {
+            'failed': job['status'] == 'failed',
+            'upload_seconds': accepted,
+            'first_playable_seconds': playable,
+            'latency_seconds': time.perf_counter() - start,
+        }
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(songs)) as executor:
+        jobs = list(executor.map(run_one, songs))
+    wall_seconds = time.perf_counter() - start
+
+    done = [job for job in jobs if not job['failed']]
+    latencies = [job['latency_seconds'] for job in done]
+    playable = [job['first_playable_seconds'] for job in done if job['first_playable_seconds'] is not None]
+    summary = {
+        'jobs': len(jobs),
+        'failed': len(jobs) - len(done),
+        'wall_seconds': round(wall_seconds, 3),
+        'jobs_per_minute': round(len(done) * 60 / wall_seconds, 2),
+    }
+    if done:
+        summary.update({
+            'upload_p50_seconds': round(statistics.median(job['upload_seconds'] for job in done), 4),
+            'latency_p50_seconds': round(statistics.median(latencies), 3),
+            'latency_p95_seconds': round(_percentile(latencies, 0.95), 3),
+            'latency_max_seconds': round(max(latencies), 3),
+        })
+    if playable:
+        summary['first_playable_p50_seconds'] = round(statistics.median(playable), 3)
+    return summary
+
+def time_end_to_end(song_dir, seconds, words_per_minute, levels, workers, output_mode, poll_seconds):
+    """
+    Runs batches of concurrent jobs through the Flask app. Every job gets
+    its own song, so no job is answered from another job's cache entries.
+
+    Returns:
+        dict: Concurrency level (as a string) -> run_jobs() summary.
+    """
+    os.environ['TUNELY_MAX_WORKERS'] = str(workers)
+    # The app keeps its folders relative to the working directory.
+    os.chdir(song_dir)
+    import app as tunely_app
+    tunely_app.create_folders()
+
+    form = {'output_mode': output_mode}
+    results = {}
+    seed = 1000
+    try:
+        for level in levels:
+            songs = []
+            for _ in range(level):
+                seed += 1
+                song_path = os.path.join(song_dir, f"song_{seed}.wav")
+                write_song(song_path, seconds, words_per_minute, seed=seed)
+                songs.append(song_path)
+            print(f"  {level} concurrent job(s)...")
+            results[str(level)] = run_jobs(tunely_app.app.test_client, songs, form, poll_seconds)
+            print(f"    {json.dumps(results[str(level)])}")
+    finally:
+        if tunely_app.job_queue is not None:
+            tunely_app.job_queue.shutdown()
+    return results
+
+# --- Compare mode ---
+
+def flatten_timings(report):
+    """Returns {'functions.separate_audio': seconds, 'end_to_end.4.latency_p50_seconds': ...}."""
+    timings = {}
+    for name, result in report.get('functions', {}).items():
+        if 'median_seconds' in result:
+            timings[f"functions.{name}"] = result['median_seconds']
+    for level, result in report.get('end_to_end', {}).items():
+        for key in ('wall_seconds', 'latency_p50_seconds', 'latency_p95_seconds', 'first_playable_p50_seconds'):
+            if key in result:
+                timings[f"end_to_end.{level}.{key}"] = result[key]
+    return timings
+
+def compare_reports(old, new, threshold):
+    """
+    Prints how every timing changed between two reports.
+
+    Returns:
+        list: Names of the timings that got slower by more than threshold.
+    """
+    if old.get('settings') != new.get('settings'):
+        print("Warning: the reports were made with different settings.")
+    old_timings, new_timings = flatten_timings(old), flatten_timings(new)
+    regressions = []
+    print(f"{'':<52} {old.get('commit') or 'old':>10} {new.get('commit') or 'new':>10}  change")
+    for name in sorted(set(old_timings) & set(new_timings)):
+        before, after = old_timings[name], new_timings[name]
+        change = (after - before) / before if before else 0.0
+        slower = change > threshold and after - before > MIN_DIFFERENCE_SECONDS
+        if slower:
+            regressions.append(name)
+        print(f"{name:<52} {before:10.3f} {after:10.3f}  {change:+7.1%}{'  REGRESSION' if slower else ''}")
+    for name in sorted(set(old_timings) ^ set(new_timings)):
+        print(f"{name:<52} only in the {'old' if name in old_timings else 'new'} report")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=60.0, help="Length of each synthetic song")
+    parser.add_argument('--words-per-minute', type=float, default=120.0, help="Lyric density of the verses")
+    parser.add_argument('--repeats', type=int, default=3, help="Runs per function timing (median is reported)")
+    parser.add_argument('--concurrency', type=int, nargs='*', default=[1, 4, 16],
+                        help="Concurrent jobs per end-to-end batch (none skips them)")
+    parser.add_argument('--workers', type=int, default=2, help="Size of the job queue's worker pool")
+    parser.add_argument('--render-workers', type=int, default=2, help="Workers for create_video_parallel")
+    parser.add_argument('--output-mode', default='video', choices=['video', 'lyrics'])
+    parser.add_argument('--model-rtf', type=float, default=0.0,
+                        help="Seconds the stand-in models sleep per second of audio")
+    parser.add_argument('--poll-seconds', type=float, default=0.1)
+    parser.add_argument('--output', help="Write the JSON report here")
+    parser.add_argument('--compare', nargs='+', metavar='REPORT',
+                        help="Compare a saved report with a second one, or with this run")
+    parser.add_argument('--threshold', type=float, default=0.15, help="Slowdown that counts as a regression")
+    args = parser.parse_args()
+
+    if args.compare and len(args.compare) == 2:
+        with open(args.compare[0]) as f_old, open(args.compare[1]) as f_new:
+            regressions = compare_reports(json.load(f_old), json.load(f_new), args.threshold)
+        sys.exit(1 if regressions else 0)
+
+    stubs.install(model_rtf=args.model_rtf)
+    report = {
+        'version': REPORT_VERSION,
+        'commit': _git_commit(),
+        'created_at': time.time(),
+        'machine': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()},
+        'settings': {
+            key: getattr(args, key) for key in (
+                'seconds', 'words_per_minute', 'repeats', 'concurrency', 'workers',
+                'render_workers', 'output_mode', 'model_rtf'
+            )
+        },
+    }
+    output_path = os.path.abspath(args.output) if args.output else None
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        song_path = os.path.join(work_dir, 'song.wav')
+        words = write_song(song_path, args.seconds, args.words_per_minute)
+        print(f"Synthetic song: {args.seconds:.0f}s, {len(words)} words")
+
+        print("Per-function timings:")
+        function_dir = os.path.join(work_dir, 'functions')
+        os.makedirs(function_dir)
+        report['functions'] = time_functions(song_path, args.seconds, function_dir, args.repeats, args.render_workers)
+
+        if args.concurrency:
+            print("End to end:")
+            app_dir = os.path.join(work_dir, 'app')
+            os.makedirs(app_dir)
+            cwd = os.getcwd()
+            try:
+                report['end_to_end'] = time_end_to_end(
+                    app_dir, args.seconds, args.words_per_minute, args.concurrency,
+                    args.workers, args.output_mode, args.poll_seconds
+                )
+            finally:
+                os.chdir(cwd)
+
+    if output_path:
+        with open(output_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {output_path}")
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            regressions = compare_reports(json.load(f), report, args.threshold)
+        sys.exit(1 if regressions else 0)
+
+if __name__ == '__main__':
+    main()
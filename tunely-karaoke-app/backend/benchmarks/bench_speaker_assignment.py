@@ -0,0 +1,83 @@
+"""
+Micro-benchmark for mapping words to speakers.
+
+Compares the old per-word scan over all speaker turns with the
+searchsorted-based assign_speakers() on synthetic data.
+
+Run from the backend folder:
+    python -m benchmarks.bench_speaker_assignment --words 10000 --turns 2000
+"""
+import argparse
+import random
+import time
+
+from processing.speaker_diarizer import assign_speakers
+
+def make_turns(count, duration, speakers=3, seed=0):
+    """Builds `count` speaker turns spread over `duration` seconds, with small gaps between them."""
+    rng = random.Random(seed)
+    slot = duration / count
+    turns = []
+    for i in range(count):
+        start = i * slot + rng.uniform(0, slot * 0.1)
+        end = (i + 1) * slot - rng.uniform(0, slot * 0.2)
+        turns.append({'start': start, 'end': end, 'speaker': f"SPEAKER_{rng.randrange(speakers):02d}"})
+    return turns
+
+def make_words(count, duration, seed=1):
+    """Builds `count` evenly spread words over `duration` seconds."""
+    rng = random.Random(seed)
+    slot = duration / count
+    words = []
+    for i in range(count):
+        start = i * slot + rng.uniform(0, slot * 0.2)
+        words.append({'text': f"w{i}", 'start': start, 'end': start + slot * 0.7})
+    return words
+
+def assign_speakers_loop(transcription_data, turns):
+    """The previous implementation: scan every turn for every word."""
+    for word in transcription_data:
+        word_center = word['start'] + (word['end'] - word['start']) / 2
+        word['speaker'] = 'UNKNOWN'
+        for turn in turns:
+            if turn['start'] <= word_center < turn['end']:
+                word['speaker'] = turn['speaker']
+                break
+    return transcription_data
+
+def best_of(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--words', type=int, default=10000)
+    parser.add_argument('--turns', type=int, default=2000)
+    parser.add_argument('--duration', type=float, default=600.0, help="Song length in seconds")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    turns = make_turns(args.turns, args.duration)
+    words = make_words(args.words, args.duration)
+
+    loop_time = best_of(lambda: assign_speakers_loop([dict(w) for w in words], turns), args.repeat)
+    indexed_time = best_of(lambda: assign_speakers([dict(w) for w in words], turns), args.repeat)
+
+    # Both must agree wherever the old loop found a speaker.
+    old = assign_speakers_loop([dict(w) for w in words], turns)
+    new = assign_speakers([dict(w) for w in words], turns)
+    mismatches = sum(1 for a, b in zip(old, new) if a['speaker'] != 'UNKNOWN' and a['speaker'] != b['speaker'])
+    unknown_before = sum(1 for w in old if w['speaker'] == 'UNKNOWN')
+    unknown_after = sum(1 for w in new if w['speaker'] == 'UNKNOWN')
+
+    print(f"{args.words} words, {args.turns} turns, {args.duration:.0f}s")
+    print(f"  per-word loop:   {loop_time * 1000:9.2f} ms")
+    print(f"  interval index:  {indexed_time * 1000:9.2f} ms  ({loop_time / indexed_time:.0f}x faster)")
+    print(f"  mismatches: {mismatches}, UNKNOWN words: {unknown_before} -> {unknown_after}")
+
+if __name__ == '__main__':
+    main()
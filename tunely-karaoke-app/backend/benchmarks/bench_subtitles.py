@@ -0,0 +1,60 @@
+"""
+Micro-benchmark for subtitle generation on very long transcripts.
+
+Times the line breaker, the streaming .ass writer and the timed-lyrics
+document on synthetic words with pauses and speaker changes, and reports
+the peak memory the writer allocates on top of the words themselves.
+
+Run from the backend folder:
+    python -m benchmarks.bench_subtitles --words 50000
+"""
+import argparse
+import random
+import tempfile
+import time
+import tracemalloc
+
+from processing.lyrics_exporter import build_lyrics_document
+from processing.subtitle_generator import generate_ass_file, iter_lines, max_line_chars
+
+def make_words(count, seed=0):
+    """Builds `count` words with a pause every phrase and a new speaker every few phrases."""
+    rng = random.Random(seed)
+    words = []
+    t = 0.0
+    for i in range(count):
+        t += rng.uniform(0.2, 0.5) + (1.0 if i % 9 == 0 else 0.0)
+        words.append({
+            'text': "".join(rng.choice("aeiklmnorst") for _ in range(rng.randint(2, 9))),
+            'start': t,
+            'end': t + rng.uniform(0.15, 0.3),
+            'speaker': f"SPEAKER_{i // 45 % 2:02d}",
+        })
+    return words
+
+def timed(label, call):
+    start = time.perf_counter()
+    result = call()
+    print(f"  {label:<24} {(time.perf_counter() - start) * 1000:8.1f} ms")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--words', type=int, default=50000, help="Number of words in the transcript")
+    args = parser.parse_args()
+
+    words = make_words(args.words)
+    print(f"{args.words} words:")
+    lines = timed("iter_lines", lambda: sum(1 for _ in iter_lines(words, max_chars=max_line_chars())))
+    with tempfile.TemporaryDirectory() as output_dir:
+        timed("generate_ass_file", lambda: generate_ass_file(words, output_dir, 'bench'))
+        # Measured in a second run, tracing slows the writer down a lot.
+        tracemalloc.start()
+        generate_ass_file(words, output_dir, 'bench')
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    timed("build_lyrics_document", lambda: build_lyrics_document(words))
+    print(f"  {lines} lines, .ass writer peak allocation {peak / 1024:.0f} KB")
+
+if __name__ == '__main__':
+    main()
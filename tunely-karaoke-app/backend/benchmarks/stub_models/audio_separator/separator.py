@@ -0,0 +1,44 @@
+import os
+import subprocess
+import time
+
+from benchmarks.synthetic import VOCAL_CUTOFF_HZ
+
+def model_delay(seconds):
+    """Sleeps for the configured model cost of `seconds` of audio."""
+    realtime_factor = float(os.environ.get('TUNELY_BENCH_MODEL_RTF', 0))
+    if realtime_factor > 0:
+        time.sleep(seconds * realtime_factor)
+
+def _duration(path):
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'csv=p=0', path],
+        check=True, capture_output=True, text=True
+    )
+    return float(result.stdout.strip())
+
+class Separator:
+    """Stand-in for audio_separator's Separator: a low/high-pass split of the mix."""
+
+    def __init__(self, output_dir=None, model_name='stub', output_format='FLAC'):
+        self.output_dir = output_dir
+        self.model_name = model_name
+        self.extension = output_format.lower()
+        self.model_instance = None
+
+    def separate(self, input_audio_path):
+        base = os.path.splitext(os.path.basename(input_audio_path))[0]
+        output_dir = self.output_dir or os.path.dirname(input_audio_path)
+        instrumental = os.path.join(output_dir, f"{base}_(Instrumental)_{self.model_name}.{self.extension}")
+        vocals = os.path.join(output_dir, f"{base}_(Vocals)_{self.model_name}.{self.extension}")
+        # Three passes make the high-pass steep enough that the bass doesn't
+        # leak into the vocals, which would hide the vocal-free parts.
+        highpass = ','.join([f"highpass=f={VOCAL_CUTOFF_HZ}"] * 3)
+        subprocess.run([
+            'ffmpeg', '-v', 'error', '-i', input_audio_path,
+            '-filter_complex', f"[0:a]asplit[a][b];[a]lowpass=f={VOCAL_CUTOFF_HZ}[i];[b]{highpass}[v]",
+            '-map', '[i]', '-y', instrumental,
+            '-map', '[v]', '-y', vocals,
+        ], check=True, capture_output=True)
+        model_delay(_duration(input_audio_path))
+        return [instrumental, vocals]
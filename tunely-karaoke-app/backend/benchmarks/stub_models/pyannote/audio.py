@@ -0,0 +1,48 @@
+import numpy as np
+
+from audio_separator.separator import model_delay
+from benchmarks.synthetic import voiced_runs
+from processing.audio_io import MODEL_SAMPLE_RATE, decode_audio, to_float32
+
+# Bursts closer than this belong to the same phrase, and so to one turn.
+PHRASE_GAP_SECONDS = 0.5
+
+class Segment:
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+
+class Annotation:
+    def __init__(self, turns):
+        self.turns = turns
+
+    def itertracks(self, yield_label=False):
+        for i, (start, end, speaker) in enumerate(self.turns):
+            yield (Segment(start, end), i, speaker) if yield_label else (Segment(start, end), i)
+
+class StubDiarizationPipeline:
+    """Stand-in for a pyannote pipeline: one turn per phrase, two alternating speakers."""
+
+    def to(self, device):
+        return self
+
+    def __call__(self, audio):
+        if isinstance(audio, dict):
+            samples = np.asarray(audio['waveform'], dtype=np.float32).T
+            sample_rate = audio['sample_rate']
+        else:
+            samples, sample_rate = to_float32(decode_audio(audio, MODEL_SAMPLE_RATE, 1)), MODEL_SAMPLE_RATE
+        model_delay(len(samples) / sample_rate)
+
+        turns = []
+        for start, end in voiced_runs(samples, sample_rate):
+            if turns and start - turns[-1][1] < PHRASE_GAP_SECONDS:
+                turns[-1][1] = end
+            else:
+                turns.append([start, end, f"SPEAKER_{len(turns) % 2:02d}"])
+        return Annotation([tuple(turn) for turn in turns])
+
+class Pipeline:
+    @staticmethod
+    def from_pretrained(name, use_auth_token=None):
+        return StubDiarizationPipeline()
@@ -0,0 +1,29 @@
+import types
+
+import numpy as np
+
+# Only what the processing modules touch outside of the (stubbed) models.
+cuda = types.SimpleNamespace(is_available=lambda: False, empty_cache=lambda: None)
+
+def device(name):
+    return name
+
+def from_numpy(array):
+    return np.asarray(array)
+
+class _Batch(list):
+    # The batched Whisper stand-in takes the windows as they are, whatever their length.
+    def to(self, device):
+        return self
+
+def stack(tensors):
+    return _Batch(tensors)
+
+_num_threads = 1
+
+def get_num_threads():
+    return _num_threads
+
+def set_num_threads(count):
+    global _num_threads
+    _num_threads = count
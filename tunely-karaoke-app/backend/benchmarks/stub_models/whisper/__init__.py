@@ -0,0 +1,27 @@
+import types
+
+from audio_separator.separator import model_delay
+from benchmarks.synthetic import voiced_runs
+from processing.audio_io import MODEL_SAMPLE_RATE
+
+from whisper.tokenizer import EOT
+
+# The openai-whisper entry points processing/batch_transcriber.py decodes
+# windows with. The "mel spectrograms" are the windows' samples (see
+# whisper.audio), and every burst of vocal energy is one token.
+
+def DecodingOptions(**options):
+    return types.SimpleNamespace(**options)
+
+def decode(model, mels, options):
+    results = []
+    for mel in mels:
+        model_delay(len(mel) / MODEL_SAMPLE_RATE)
+        words = voiced_runs(mel, MODEL_SAMPLE_RATE)
+        results.append(types.SimpleNamespace(
+            language=options.language or 'hi',
+            tokens=list(range(len(words))) + [EOT],
+            no_speech_prob=0.1 if words else 0.9,
+            avg_logprob=-0.2 if words else -2.0,
+        ))
+    return results
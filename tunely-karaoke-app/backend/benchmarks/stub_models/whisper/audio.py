@@ -0,0 +1,9 @@
+HOP_LENGTH = 160
+N_FRAMES = 3000
+
+def log_mel_spectrogram(audio, n_mels=80):
+    # The samples stand in for the spectrogram, so alignment can find the words in them.
+    return audio
+
+def pad_or_trim(array, length=N_FRAMES):
+    return array
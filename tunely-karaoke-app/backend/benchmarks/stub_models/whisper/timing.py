@@ -0,0 +1,14 @@
+import types
+
+from benchmarks.synthetic import voiced_runs
+from processing.audio_io import MODEL_SAMPLE_RATE
+
+from whisper.audio import HOP_LENGTH
+
+def find_alignment(model, tokenizer, text_tokens, mel, num_frames):
+    """One timed word per burst of vocal energy, like the stand-in whisper_timestamped."""
+    runs = voiced_runs(mel[:num_frames * HOP_LENGTH], MODEL_SAMPLE_RATE)
+    return [
+        types.SimpleNamespace(word=f" la{i}", start=round(start, 2), end=round(end, 2))
+        for i, (start, end) in enumerate(runs[:len(text_tokens)])
+    ]
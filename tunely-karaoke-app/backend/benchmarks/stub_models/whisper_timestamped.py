@@ -0,0 +1,36 @@
+import types
+
+import numpy as np
+
+from audio_separator.separator import model_delay
+from benchmarks.synthetic import voiced_runs
+from processing.audio_io import MODEL_SAMPLE_RATE, decode_audio, to_float32
+
+class StubWhisperModel:
+    def __init__(self, name):
+        self.name = name
+        # What the batched decode (see the whisper stand-in) reads off the model.
+        self.dims = types.SimpleNamespace(n_mels=80)
+        self.device = 'cpu'
+        self.is_multilingual = True
+        self.num_languages = 99
+
+def load_model(name, device='cpu'):
+    return StubWhisperModel(name)
+
+def load_audio(path):
+    return to_float32(decode_audio(path, MODEL_SAMPLE_RATE, 1))[:, 0]
+
+def transcribe(model, audio, language=None):
+    """Every burst of vocal energy becomes one word, in whisper_timestamped's result layout."""
+    audio = np.asarray(audio, dtype=np.float32)
+    model_delay(len(audio) / MODEL_SAMPLE_RATE)
+    words = [
+        {'text': f" la{i}", 'start': round(start, 2), 'end': round(end, 2), 'confidence': 0.9}
+        for i, (start, end) in enumerate(voiced_runs(audio, MODEL_SAMPLE_RATE))
+    ]
+    return {
+        'text': "".join(word['text'] for word in words),
+        'language': language or 'hi',
+        'segments': [{'start': words[0]['start'], 'end': words[-1]['end'], 'words': words}] if words else [],
+    }
@@ -0,0 +1,46 @@
+"""
+Lightweight stand-ins for the ML libraries, so the benchmarks run offline
+and without a GPU. They live in benchmarks/stub_models as importable
+packages, which install() puts first on the module path:
+
+- audio_separator.separator.Separator splits the mix with FFmpeg filters at
+  the synthetic songs' vocal cutoff and writes FLAC stems.
+- whisper_timestamped turns every burst of vocal energy into a word, and
+  whisper does the same for the batched decode of the batch transcriber.
+- pyannote.audio.Pipeline turns every phrase into a speaker turn,
+  alternating between two speakers.
+- torch provides the few attributes the processing modules touch.
+
+TUNELY_BENCH_MODEL_RTF makes the stand-ins sleep that many seconds per
+second of audio, to mimic the models' cost in end-to-end runs.
+"""
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUB_DIR = os.path.join(BACKEND_DIR, 'benchmarks', 'stub_models')
+
+STUBBED_MODULES = ('audio_separator', 'whisper_timestamped', 'whisper', 'pyannote', 'torch')
+
+def install(model_rtf=None):
+    """
+    Makes the stand-ins importable in this process and in every process it
+    starts (pool workers, the separation pool's forkserver).
+
+    Must run before anything from `processing` is imported.
+
+    Args:
+        model_rtf (float, optional): Seconds the stand-ins sleep per second of audio.
+    """
+    loaded = [name for name in STUBBED_MODULES if name in sys.modules]
+    if loaded or 'processing' in sys.modules:
+        raise RuntimeError(f"Install the stand-in models before importing processing ({', '.join(loaded)})")
+    for path in (STUB_DIR, BACKEND_DIR):
+        if path in sys.path:
+            sys.path.remove(path)
+    sys.path[:0] = [STUB_DIR, BACKEND_DIR]
+    os.environ['PYTHONPATH'] = os.pathsep.join(
+        [STUB_DIR, BACKEND_DIR] + ([os.environ['PYTHONPATH']] if os.environ.get('PYTHONPATH') else [])
+    )
+    if model_rtf is not None:
+        os.environ['TUNELY_BENCH_MODEL_RTF'] = str(model_rtf)
@@ -0,0 +1,126 @@
+"""
+Synthetic songs for the benchmarks: a chord pad with a sung "word" (a short
+tone burst above 400 Hz) at a configurable density, plus a vocal-free
+intro, solo and outro. The stand-in models in benchmarks/stub_models find
+the words again from the audio's energy, so every stage gets realistic input.
+"""
+import wave
+
+import numpy as np
+
+SAMPLE_RATE = 44100
+
+# Everything below this is instrumental, everything above it vocals; the
+# stand-in separator splits the mix there.
+VOCAL_CUTOFF_HZ = 250
+
+# Frame size and threshold the stand-in models detect words with.
+FRAME_SECONDS = 0.02
+VOICED_THRESHOLD_DB = -24.0
+
+# Song parts without vocals, as fractions of the length.
+INTRO = 0.08
+SOLO = (0.45, 0.55)
+OUTRO = 0.92
+
+BLOCK_SECONDS = 30.0
+
+def plan_words(seconds, words_per_minute, seed=0):
+    """
+    Places the sung words of a song.
+
+    Returns:
+        list: {'text', 'start', 'end', 'pitch'} dicts, sorted by start.
+    """
+    rng = np.random.default_rng(seed)
+    slot = 60.0 / words_per_minute
+    words = []
+    t = seconds * INTRO
+    while t + slot < seconds * OUTRO:
+        if SOLO[0] * seconds <= t < SOLO[1] * seconds:
+            t = SOLO[1] * seconds
+            continue
+        length = slot * rng.uniform(0.45, 0.7)
+        words.append({
+            'text': f"la{len(words)}",
+            'start': round(t, 3),
+            'end': round(t + length, 3),
+            'pitch': float(rng.choice([440.0, 493.9, 523.3, 587.3, 659.3, 784.0])),
+        })
+        # Every eighth word ends a phrase with a breath.
+        t += slot * (2.0 if len(words) % 8 == 0 else 1.0)
+    return words
+
+def write_song(path, seconds, words_per_minute=120, seed=0):
+    """
+    Writes a stereo 16-bit 44.1 kHz WAV song, block by block.
+
+    Args:
+        path (str): The output path.
+        seconds (float): The length of the song.
+        words_per_minute (float): How densely the verses are sung.
+        seed (int): Varies the melody and noise, so songs don't share cache entries.
+
+    Returns:
+        list: The sung words, see plan_words().
+    """
+    words = plan_words(seconds, words_per_minute, seed)
+    rng = np.random.default_rng(seed + 1)
+    total = int(seconds * SAMPLE_RATE)
+    block = int(BLOCK_SECONDS * SAMPLE_RATE)
+    word_index = 0
+
+    with wave.open(path, 'wb') as out:
+        out.setnchannels(2)
+        out.setsampwidth(2)
+        out.setframerate(SAMPLE_RATE)
+        for block_start in range(0, total, block):
+            length = min(block, total - block_start)
+            t = (block_start + np.arange(length)) / SAMPLE_RATE
+            mix = sum(0.08 * np.sin(2 * np.pi * f * t) for f in (55.0, 82.4, 110.0))
+            mix += 0.003 * rng.standard_normal(length)
+
+            block_end_seconds = (block_start + length) / SAMPLE_RATE
+            while word_index < len(words) and words[word_index]['end'] <= t[0]:
+                word_index += 1
+            i = word_index
+            while i < len(words) and words[i]['start'] < block_end_seconds:
+                word = words[i]
+                first = max(int(word['start'] * SAMPLE_RATE) - block_start, 0)
+                last = min(int(word['end'] * SAMPLE_RATE) - block_start, length)
+                if last > first:
+                    span = t[first:last]
+                    envelope = np.sin(np.pi * (span - word['start']) / (word['end'] - word['start']))
+                    mix[first:last] += 0.3 * envelope * np.sin(2 * np.pi * word['pitch'] * span)
+                i += 1
+
+            pcm = (np.clip(mix, -1.0, 1.0) * 32767).astype('<i2')
+            out.writeframes(np.stack([pcm, pcm], axis=1).tobytes())
+
+    return [{key: word[key] for key in ('text', 'start', 'end')} for word in words]
+
+def voiced_runs(samples, sample_rate, frame_seconds=FRAME_SECONDS, threshold_db=VOICED_THRESHOLD_DB):
+    """
+    Finds the sung words in a vocal track by frame energy; what the
+    stand-in Whisper and pyannote models "hear".
+
+    Args:
+        samples (np.ndarray): Float samples of shape (frames,) or (frames, channels).
+
+    Returns:
+        list: (start, end) tuples in seconds.
+    """
+    samples = np.asarray(samples, dtype=np.float32)
+    if samples.ndim == 2:
+        samples = samples.mean(axis=1)
+    frame_length = max(1, int(frame_seconds * sample_rate))
+    frames = len(samples) // frame_length
+    if frames == 0:
+        return []
+    power = np.square(samples[:frames * frame_length].reshape(frames, frame_length)).mean(axis=1)
+    with np.errstate(divide='ignore'):
+        voiced = 10 * np.log10(power) > threshold_db
+    edges = np.diff(np.concatenate(([0], voiced.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1) * frame_seconds
+    ends = np.flatnonzero(edges == -1) * frame_seconds
+    return [(float(start), float(end)) for start, end in zip(starts, ends)]
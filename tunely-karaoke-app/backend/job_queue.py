@@ -0,0 +1,517 @@
+import collections
+import math
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+from multiprocessing import Manager
+
+from processing.background_assets import backgrounds
+from processing.batch_transcriber import (
+    DEFAULT_BATCH_SIZE, DEFAULT_MAX_WAIT_SECONDS, BatchTranscriberClient, serve_transcription_batches, throughput
+)
+from processing.checkpoints import CheckpointStore
+from processing.metrics import metrics
+from processing.model_registry import registry
+from processing.pipeline import STAGES, STAGE_WEIGHTS, run_pipeline
+from processing.result_cache import ResultCache
+from processing.scheduler import SHORT_TRACK_SECONDS, scheduler
+from processing.transcriber import DEFAULT_WHISPER_MODEL
+
+# The job state field each published pipeline output's URL is stored in.
+PUBLISHED_URL_FIELDS = {
+    'preview': 'preview_url',
+    'video': 'video_url',
+    'lyrics': 'lyrics_url',
+    'audio': 'audio_url',
+}
+
+# Assumed length of a job for the Retry-After estimate, until one has finished.
+DEFAULT_JOB_SECONDS = 120
+# The longest Retry-After asked of a client.
+MAX_RETRY_AFTER_SECONDS = 600
+# How many recently finished jobs the Retry-After estimate averages.
+RECENT_JOBS = 20
+
+# How often a job that never started is submitted again after the worker
+# pool broke, before it fails (the pool may be unable to start at all).
+MAX_POOL_RETRIES = 2
+
+# Finished jobs are forgotten after this long, checked every PRUNE_EVERY_JOBS submissions.
+JOB_MAX_AGE_SECONDS = 24 * 3600
+PRUNE_EVERY_JOBS = 50
+
+# Settings of the current worker process, set by _init_worker.
+_worker_settings = {}
+
+def _init_worker(preload_models, min_available_mb, max_idle_seconds, cache_settings, transcriber_settings=None,
+                 metrics_settings=None, background_settings=None, checkpoint_settings=None, scheduler_settings=None,
+                 queued_jobs=None):
+    """Runs once in every new worker process, optionally warming up the models."""
+    if metrics_settings:
+        # Record stage timings into the histograms the web process serves.
+        metrics.attach(**metrics_settings)
+    if scheduler_settings:
+        # One CPU budget for the stages of all workers.
+        scheduler.attach(**scheduler_settings)
+    if background_settings:
+        backgrounds.configure(background_settings['cache_dir'])
+        if background_settings.get('preload_dir'):
+            # Normalize the backgrounds on the side, so the worker can take jobs
+            # right away; a job needing one that isn't ready waits for it.
+            threading.Thread(
+                target=backgrounds.preload, args=(background_settings['preload_dir'],), daemon=True
+            ).start()
+    _worker_settings['min_available_mb'] = min_available_mb
+    _worker_settings['max_idle_seconds'] = max_idle_seconds
+    _worker_settings['cache'] = ResultCache(**cache_settings) if cache_settings else None
+    _worker_settings['checkpoints'] = CheckpointStore(**checkpoint_settings) if checkpoint_settings else None
+    _worker_settings['queued_jobs'] = queued_jobs
+    # The batch transcriber's request queue can only be handed over here,
+    # when the process starts; see JobQueue.
+    _worker_settings['transcriber'] = transcriber_settings
+    if preload_models:
+        registry.preload()
+
+def _release_models():
+    """Drops idle models, and more if the machine is running low on memory."""
+    if _worker_settings.get('max_idle_seconds'):
+        registry.evict_idle(_worker_settings['max_idle_seconds'])
+    if _worker_settings.get('min_available_mb'):
+        registry.evict_under_pressure(_worker_settings['min_available_mb'])
+
+def _new_job_state(job_id, pool_retries=0):
+    """Builds the initial status dictionary for a freshly queued job."""
+    return {
+        'job_id': job_id,
+        'status': 'queued', # queued -> running -> done | failed
+        'stage': None,
+        'progress': 0.0,
+        'stages': {stage: {'status': 'pending', 'progress': 0.0} for stage in STAGES},
+        'preview_url': None, # Fast low-resolution video, available before video_url
+        'video_url': None,
+        'lyrics_url': None, # Timed lyrics for in-browser playback (lyrics output mode)
+        'audio_url': None, # The encoded instrumental to play them along with
+        'ready': None, # What can be played: None, 'preview', 'full' or 'lyrics'
+        'lyrics_preview': None, # The latest transcribed words, while transcribing
+        'bytes_written': 0, # Size of the intermediate and output files written so far
+        'error': None,
+        'pool_retries': pool_retries, # Times it was queued again because the worker pool broke
+        'created_at': time.time(),
+        'started_at': None,
+        'finished_at': None,
+    }
+
+def _update_job(jobs, job_id, **changes):
+    # Nested values of a Manager dict are copies, so the whole job state
+    # has to be read, modified and written back.
+    job = jobs[job_id]
+    job.update(changes)
+    jobs[job_id] = job
+
+def _run_job(jobs, job_id, input_audio_path, options, output_dir, work_dir, replies=None):
+    """
+    Runs the pipeline for one job inside a worker process and keeps the
+    shared job state up to date. Must stay a module-level function so it
+    can be pickled for the process pool.
+    """
+    # Stages running in parallel threads report at the same time.
+    report_lock = threading.Lock()
+
+    def report(stage, status, progress=0.0, published=None, **details):
+        with report_lock:
+            job = jobs[job_id]
+            if published:
+                job[PUBLISHED_URL_FIELDS[stage]] = f"/outputs/{published}"
+                if stage == 'video':
+                    job['ready'] = 'full'
+                elif stage == 'preview':
+                    job['ready'] = job['ready'] or 'preview'
+                elif job['lyrics_url'] and job['audio_url']:
+                    job['ready'] = 'lyrics'
+            job['stages'][stage] = {'status': status, 'progress': progress}
+            job['stage'] = stage
+            job['progress'] = round(sum(
+                STAGE_WEIGHTS[name] * state['progress'] for name, state in job['stages'].items()
+            ) * 100, 1)
+            job.update(details)
+            jobs[job_id] = job
+
+    transcriber = None
+    if _worker_settings.get('transcriber') and replies is not None:
+        transcriber = BatchTranscriberClient(replies=replies, **_worker_settings['transcriber'])
+    checkpoints = _worker_settings.get('checkpoints')
+
+    _update_job(jobs, job_id, status='running', started_at=time.time())
+    if _worker_settings.get('queued_jobs') is not None:
+        _worker_settings['queued_jobs'].pop(job_id, None)
+    if checkpoints:
+        checkpoints.mark(job_id, 'running')
+    try:
+        run_pipeline(
+            input_audio_path, job_id, output_dir, work_dir,
+            options=options,
+            report=report,
+            cache=_worker_settings.get('cache'),
+            transcriber=transcriber,
+            checkpoints=checkpoints
+        )
+        _update_job(jobs, job_id, status='done', progress=100.0, finished_at=time.time())
+        if checkpoints:
+            checkpoints.mark(job_id, 'done')
+    except Exception as e:
+        print(f"Job {job_id} failed: {e}")
+        traceback.print_exc()
+        _update_job(jobs, job_id, status='failed', error=str(e), finished_at=time.time())
+        if checkpoints:
+            # The completed stages stay checkpointed for a retry.
+            checkpoints.mark(job_id, 'failed', str(e))
+    finally:
+        _release_models()
+        if checkpoints:
+            checkpoints.collect_garbage()
+
+class JobQueue:
+    """
+    A bounded pool of worker processes running karaoke jobs in the background.
+
+    Job states live in a Manager dict so the worker processes can report
+    per-stage progress that the web process can read back at any time.
+    Each worker keeps its models resident between jobs (see model_registry).
+
+    With batch_transcription, one extra process runs the Whisper model for
+    all jobs and decodes their windows in batches (see batch_transcriber).
+
+    The CPU-heavy stages of all workers share one budget of cores (see
+    processing/scheduler.py), and uploads are turned away with a Retry-After
+    once max_queued_jobs are waiting for a worker (see retry_after).
+
+    With a checkpoint_dir, every job's completed stages are checkpointed
+    (see processing/checkpoints.py): a failed job can be retried from where
+    it stopped, and jobs cut short by a restart resume when the queue starts.
+    """
+
+    def __init__(self, output_dir, work_dir, max_workers=2, preload_models=False,
+                 min_available_mb=1024, max_idle_seconds=None, cache_dir=None, cache_max_bytes=10 * 1024**3,
+                 batch_transcription=False, transcription_batch_size=DEFAULT_BATCH_SIZE,
+                 transcription_max_wait=DEFAULT_MAX_WAIT_SECONDS, whisper_model=DEFAULT_WHISPER_MODEL,
+                 background_cache_dir=None, background_dir=None, preload_backgrounds=False,
+                 checkpoint_dir=None, checkpoint_max_bytes=5 * 1024**3, checkpoint_max_age=24 * 3600,
+                 stage_budgets=None, cpu_cores=None, short_track_seconds=SHORT_TRACK_SECONDS, max_queued_jobs=None):
+        self.output_dir = output_dir
+        self.work_dir = work_dir
+        self.max_workers = max_workers
+        self.max_queued_jobs = max_queued_jobs
+        self._manager = Manager()
+        self._jobs = self._manager.dict()
+        # Job ID -> (input_audio_path, options), to render a video for a
+        # lyrics-mode job later on. Only used in this (the web) process.
+        self._inputs = {}
+        # Held while checking whether a job has to be submitted again (renders, retries).
+        self._resubmit_lock = threading.Lock()
+        self._submitted = 0
+        # IDs of the jobs waiting for a worker, so admission control doesn't
+        # have to read every job state; workers remove a job when it starts.
+        self._queued = self._manager.dict()
+        # Run times of the latest finished jobs, for the Retry-After estimate.
+        self._job_seconds = collections.deque(maxlen=RECENT_JOBS)
+
+        # Stage timing histograms, recorded by the workers and served at /metrics.
+        metrics_settings = {'values': self._manager.dict(), 'lock': self._manager.Lock()}
+        metrics.attach(**metrics_settings)
+
+        # The result cache is shared on disk; its hit/miss counters are
+        # shared through the manager so all workers add to the same totals.
+        self._cache = None
+        cache_settings = None
+        if cache_dir:
+            cache_settings = {
+                'root': cache_dir,
+                'max_bytes': cache_max_bytes,
+                'counters': self._manager.dict(),
+                'counters_lock': self._manager.Lock(),
+            }
+            self._cache = ResultCache(**cache_settings)
+
+        # Workers are started on demand, possibly while an upload is being
+        # decoded (see upload_ingest); forked ones would inherit the decoder's
+        # input pipe and keep it from ever seeing end of input. The queues
+        # handed to the workers must come from the same context.
+        context = multiprocessing.get_context(
+            'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else None
+        )
+
+        # Windows go to the service over a plain process queue (they are
+        # large arrays); answers come back on a small Manager queue per job.
+        self._transcriber = None
+        self._transcriber_stats = None
+        transcriber_settings = None
+        if batch_transcription:
+            self._transcription_requests = context.Queue()
+            self._transcriber_stats = self._manager.dict()
+            self._transcriber = context.Process(
+                target=serve_transcription_batches,
+                args=(self._transcription_requests, whisper_model, transcription_batch_size,
+                      transcription_max_wait, self._transcriber_stats),
+                daemon=True
+            )
+            self._transcriber.start()
+            transcriber_settings = {
+                'requests': self._transcription_requests,
+                'model_name': whisper_model,
+                'max_in_flight': transcription_batch_size,
+            }
+
+        # Backgrounds are normalized once into a folder all workers share.
+        background_settings = None
+        if background_cache_dir:
+            background_settings = {
+                'cache_dir': background_cache_dir,
+                'preload_dir': background_dir if preload_backgrounds else None,
+            }
+
+        self._checkpoints = None
+        checkpoint_settings = None
+        if checkpoint_dir:
+            checkpoint_settings = {
+                'root': checkpoint_dir,
+                'max_bytes': checkpoint_max_bytes,
+                'max_age_seconds': checkpoint_max_age,
+            }
+            self._checkpoints = CheckpointStore(**checkpoint_settings)
+
+        # Stage slots and thread budgets, shared by all workers (see processing/scheduler.py).
+        scheduler_settings = None
+        if stage_budgets:
+            scheduler_settings = {
+                'budgets': stage_budgets,
+                'cores': cpu_cores,
+                'state': self._manager.dict(),
+                'condition': self._manager.Condition(),
+                'short_track_seconds': short_track_seconds,
+            }
+            scheduler.attach(**scheduler_settings)
+
+        self._pool_settings = {
+            'max_workers': max_workers,
+            'mp_context': context,
+            'initializer': _init_worker,
+            'initargs': (preload_models, min_available_mb, max_idle_seconds, cache_settings, transcriber_settings,
+                         metrics_settings, background_settings, checkpoint_settings, scheduler_settings,
+                         self._queued),
+        }
+        self._pool_lock = threading.Lock()
+        self._executor = ProcessPoolExecutor(**self._pool_settings)
+
+        if self._checkpoints:
+            self._resume_incomplete()
+
+    def _resume_incomplete(self):
+        # Jobs that were queued or running when the server stopped.
+        self._checkpoints.collect_garbage()
+        for manifest in self._checkpoints.incomplete():
+            job_id = manifest['request_id']
+            if not os.path.exists(manifest['input_audio_path']):
+                self._checkpoints.mark(job_id, 'failed', "The uploaded audio file is gone.")
+                continue
+            print(f"Resuming job {job_id} ({len(manifest['stages'])} stages checkpointed)...")
+            self.submit(job_id, manifest['input_audio_path'], manifest['options'])
+
+    def _submit_to_pool(self, *args):
+        # A worker that dies (e.g. killed when out of memory) breaks the whole
+        # pool; the next submission starts a new one.
+        with self._pool_lock:
+            try:
+                return self._executor.submit(*args)
+            except BrokenProcessPool:
+                print("The worker pool is broken, starting a new one...")
+                self._executor.shutdown(wait=False)
+                self._executor = ProcessPoolExecutor(**self._pool_settings)
+                return self._executor.submit(*args)
+
+    def _on_job_exit(self, job_id, future):
+        # Keeps the run times of finished jobs. _run_job catches the pipeline's
+        # own errors, so an exception here means the worker process died and
+        # the job state was never finalized.
+        if future.cancelled():
+            return
+        try:
+            self._queued.pop(job_id, None)
+            job = self._jobs.get(job_id)
+            if future.exception() is None:
+                if job is not None and job['status'] == 'done' and job.get('started_at'):
+                    self._job_seconds.append(job['finished_at'] - job['started_at'])
+                return
+            error = f"The worker stopped unexpectedly ({type(future.exception()).__name__})."
+            if job is not None and job['status'] == 'queued':
+                # It never started, so it can't be what broke the pool: run it
+                # again, unless the pool keeps breaking before it gets to start.
+                if job['pool_retries'] < MAX_POOL_RETRIES:
+                    threading.Thread(
+                        target=self._submit, args=(job_id, *self._inputs[job_id]),
+                        kwargs={'pool_retries': job['pool_retries'] + 1}, daemon=True
+                    ).start()
+                    return
+                error = f"The worker pool failed {job['pool_retries'] + 1} times before the job could start."
+            _update_job(self._jobs, job_id, status='failed', error=error, finished_at=time.time())
+            if self._checkpoints:
+                self._checkpoints.mark(job_id, 'failed', error)
+        except Exception as e:
+            # The manager is gone when the queue is shutting down.
+            print(f"Could not record the exit of job {job_id}: {e}")
+
+    def submit(self, job_id, input_audio_path, options=None):
+        """
+        Queues a new job and returns immediately.
+
+        Args:
+            job_id (str): The unique ID for the job (also used as request ID).
+            input_audio_path (str): The path to the uploaded audio file.
+            options (dict, optional): Pipeline options, see processing.pipeline.DEFAULT_OPTIONS.
+
+        Returns:
+            str: The job ID.
+        """
+        return self._submit(job_id, input_audio_path, options)
+
+    def _submit(self, job_id, input_audio_path, options=None, pool_retries=0):
+        self._jobs[job_id] = _new_job_state(job_id, pool_retries)
+        self._inputs[job_id] = (input_audio_path, options)
+        self._queued[job_id] = True
+        if self._checkpoints:
+            self._checkpoints.begin(job_id, input_audio_path, options)
+        replies = self._manager.Queue() if self._transcriber else None
+        future = self._submit_to_pool(
+            _run_job, self._jobs, job_id, input_audio_path, options, self.output_dir, self.work_dir, replies
+        )
+        future.add_done_callback(lambda future: self._on_job_exit(job_id, future))
+        self._submitted += 1
+        if self._submitted % PRUNE_EVERY_JOBS == 0:
+            self.prune()
+        return job_id
+
+    def _job_input(self, job_id):
+        # (input_audio_path, options) of a job submitted before, also from
+        # before a restart if it was checkpointed.
+        if job_id in self._inputs:
+            return self._inputs[job_id]
+        manifest = self._checkpoints.manifest(job_id) if self._checkpoints else None
+        if manifest is None:
+            return None
+        return manifest['input_audio_path'], manifest['options']
+
+    def submit_render(self, job_id):
+        """
+        Queues the video render for a job that ran in the 'lyrics' output mode,
+        for when the user asks to download a video. Stage outputs of the
+        original job come from the result cache, so only the encode runs.
+        Asking again while the render is queued or done returns the same job.
+
+        Args:
+            job_id (str): The ID of the original job.
+
+        Returns:
+            str: The ID of the render job, or None if the job is unknown.
+        """
+        job_input = self._job_input(job_id)
+        if job_input is None:
+            return None
+        render_job_id = f"{job_id}-video"
+        with self._resubmit_lock:
+            render_job = self._jobs.get(render_job_id)
+            if render_job is not None and render_job['status'] != 'failed':
+                return render_job_id
+            input_audio_path, options = job_input
+            # The download is the full-quality video only, there is already a player.
+            options = {**(options or {}), 'output_mode': 'video', 'preview': False}
+            return self.submit(render_job_id, input_audio_path, options)
+
+    def retry_after(self):
+        """
+        Admission control for new uploads: once max_queued_jobs jobs are
+        waiting for a worker, new ones are turned away instead of piling up.
+
+        Returns:
+            int: Seconds to ask the client to wait before trying again (for
+                 a 429 with Retry-After), or None if the job can be queued.
+        """
+        if not self.max_queued_jobs:
+            return None
+        queued = len(self._queued)
+        if queued < self.max_queued_jobs:
+            return None
+        durations = list(self._job_seconds)
+        job_seconds = sum(durations) / len(durations) if durations else DEFAULT_JOB_SECONDS
+        # Roughly when a place in the queue frees up.
+        wait = (queued - self.max_queued_jobs + 1) * job_seconds / self.max_workers
+        return max(1, min(MAX_RETRY_AFTER_SECONDS, math.ceil(wait)))
+
+    def retry(self, job_id):
+        """
+        Runs a failed job again under the same ID. With checkpoints, it
+        resumes from the stages it completed; this also works for jobs from
+        before a restart. Retrying a job that is queued, running or done
+        returns it as it is.
+
+        Args:
+            job_id (str): The ID of the job.
+
+        Returns:
+            str: The job ID, or None if the job or its uploaded audio is unknown.
+        """
+        with self._resubmit_lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job['status'] != 'failed':
+                return job_id
+            job_input = self._job_input(job_id)
+            if job_input is None or not os.path.exists(job_input[0]):
+                return None
+            input_audio_path, options = job_input
+            return self.submit(job_id, input_audio_path, options)
+
+    def get(self, job_id):
+        """Returns a copy of the job's status dictionary, or None if it is unknown."""
+        return self._jobs.get(job_id)
+
+    def cache_stats(self):
+        """Returns the result cache's size and hit/miss counters, or None without a cache."""
+        return self._cache.stats() if self._cache else None
+
+    def transcriber_stats(self):
+        """Returns the batch transcriber's throughput (songs/minute etc.), or None without one."""
+        return throughput(self._transcriber_stats) if self._transcriber else None
+
+    def checkpoint_stats(self):
+        """Returns the checkpointed requests by status and the store's size, or None without checkpoints."""
+        return self._checkpoints.stats() if self._checkpoints else None
+
+    def scheduler_stats(self):
+        """Returns the stage budgets and the stages running and waiting for a slot, by kind."""
+        return scheduler.stats()
+
+    def metrics_text(self):
+        """Returns the stage, model and FFmpeg histograms in the Prometheus text format."""
+        return metrics.render()
+
+    def prune(self, max_age_seconds=JOB_MAX_AGE_SECONDS):
+        """
+        Forgets finished jobs older than max_age_seconds, so the job states
+        don't grow for as long as the server runs. Called from submit().
+        Checkpointed jobs can still be retried or rendered after this.
+        """
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job['finished_at'] and now - job['finished_at'] > max_age_seconds:
+                # Submissions from other threads may prune at the same time.
+                self._jobs.pop(job_id, None)
+                self._inputs.pop(job_id, None)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._transcriber:
+            self._transcription_requests.put(None)
+            self._transcriber.join(timeout=5)
+        self._manager.shutdown()
@@ -0,0 +1,137 @@
+import os
+import struct
+import subprocess
+import numpy as np
+
+# Whisper and pyannote both work on 16 kHz mono audio.
+MODEL_SAMPLE_RATE = 16000
+
+_WAVE_FORMAT_PCM = 0x0001
+_WAVE_FORMAT_IEEE_FLOAT = 0x0003
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+_PCM_DTYPES = {16: '<i2', 32: '<i4'}
+_FLOAT_DTYPES = {32: '<f4', 64: '<f8'}
+
+def open_wav(path):
+    """
+    Memory-maps the samples of a WAV file without reading them into RAM.
+
+    Args:
+        path (str): The path to a 16/32-bit PCM or 32/64-bit float WAV file.
+
+    Returns:
+        tuple: (samples, sample_rate). samples is a read-only np.memmap of
+               shape (frames, channels); slicing it only reads those frames.
+
+    Raises:
+        ValueError: If the file is not a WAV file in a supported sample format.
+    """
+    with open(path, 'rb') as f:
+        header = f.read(12)
+        if len(header) < 12:
+            raise ValueError(f"Not a WAV file: {path}")
+        riff, _, wave = struct.unpack('<4sI4s', header)
+        if riff != b'RIFF' or wave != b'WAVE':
+            raise ValueError(f"Not a WAV file: {path}")
+
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"No audio data found in: {path}")
+            chunk_id, chunk_size = struct.unpack('<4sI', header)
+            if chunk_id == b'fmt ':
+                fmt = f.read(chunk_size)
+                if chunk_size % 2:
+                    f.read(1)
+            elif chunk_id == b'data':
+                data_offset = f.tell()
+                break
+            else:
+                # Chunks are padded to an even size.
+                f.seek(chunk_size + chunk_size % 2, 1)
+
+    if fmt is None:
+        raise ValueError(f"Missing format chunk in: {path}")
+    format_tag, channels, sample_rate, _, _, bits = struct.unpack('<HHIIHH', fmt[:16])
+    if format_tag == _WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+        format_tag = struct.unpack('<H', fmt[24:26])[0]
+
+    if format_tag == _WAVE_FORMAT_PCM and bits in _PCM_DTYPES:
+        dtype = np.dtype(_PCM_DTYPES[bits])
+    elif format_tag == _WAVE_FORMAT_IEEE_FLOAT and bits in _FLOAT_DTYPES:
+        dtype = np.dtype(_FLOAT_DTYPES[bits])
+    else:
+        raise ValueError(f"Unsupported WAV sample format ({format_tag}, {bits} bits) in: {path}")
+
+    # Streamed WAVs may carry a bogus data size, so trust the file size instead.
+    frame_size = dtype.itemsize * channels
+    frames = (os.path.getsize(path) - data_offset) // frame_size
+    samples = np.memmap(path, dtype=dtype, mode='r', offset=data_offset, shape=(frames, channels))
+    return samples, sample_rate
+
+def to_float32(samples):
+    """Converts integer PCM samples to float32 in [-1, 1]."""
+    if samples.dtype.kind == 'i':
+        return samples.astype(np.float32) / np.float32(np.iinfo(samples.dtype).max + 1)
+    return samples.astype(np.float32, copy=False)
+
+def _lowpass_kernel(cutoff, taps=63):
+    # Windowed-sinc low-pass filter; cutoff is a fraction of the sample rate.
+    n = np.arange(taps) - (taps - 1) / 2
+    kernel = np.sinc(2 * cutoff * n) * np.hamming(taps)
+    return (kernel / kernel.sum()).astype(np.float32)
+
+def to_model_audio(samples, sample_rate):
+    """
+    Converts a block of samples to the 16 kHz mono float32 audio the models expect.
+
+    Args:
+        samples (np.ndarray): Samples of shape (frames, channels) or (frames,).
+        sample_rate (int): The sample rate of the samples.
+
+    Returns:
+        np.ndarray: 1-D float32 array at MODEL_SAMPLE_RATE.
+    """
+    audio = to_float32(np.asarray(samples))
+    if audio.ndim == 2:
+        audio = audio.mean(axis=1)
+    if sample_rate == MODEL_SAMPLE_RATE or len(audio) == 0:
+        return np.ascontiguousarray(audio, dtype=np.float32)
+
+    if sample_rate > MODEL_SAMPLE_RATE:
+        # Remove everything above the new Nyquist frequency before decimating.
+        audio = np.convolve(audio, _lowpass_kernel(0.5 * MODEL_SAMPLE_RATE / sample_rate * 0.95), mode='same')
+    target_length = int(round(len(audio) * MODEL_SAMPLE_RATE / sample_rate))
+    positions = np.arange(target_length, dtype=np.float64) * (sample_rate / MODEL_SAMPLE_RATE)
+    return np.interp(positions, np.arange(len(audio)), audio).astype(np.float32)
+
+def decode_audio(path, sample_rate, channels):
+    """
+    Decodes any audio file (e.g. a FLAC stem) with FFmpeg.
+
+    Returns:
+        np.ndarray: int16 samples of shape (frames, channels) at sample_rate.
+    """
+    command = [
+        'ffmpeg', '-v', 'error', '-i', path, '-vn',
+        '-ac', str(channels), '-ar', str(sample_rate), '-f', 's16le', '-'
+    ]
+    output = subprocess.run(command, check=True, capture_output=True).stdout
+    return np.frombuffer(output, dtype='<i2').reshape(-1, channels)
+
+def write_model_wav(path, output_path):
+    """
+    Converts any audio file to the 16 kHz mono 16-bit PCM WAV both models
+    read, with FFmpeg's resampler and without loading it into memory.
+
+    Returns:
+        str: output_path.
+    """
+    command = [
+        'ffmpeg', '-v', 'error', '-i', path, '-vn',
+        '-ac', '1', '-ar', str(MODEL_SAMPLE_RATE), '-c:a', 'pcm_s16le', '-y', output_path
+    ]
+    subprocess.run(command, check=True, capture_output=True, text=True)
+    return output_path
@@ -1,5 +1,36 @@
 import os
+import multiprocessing
+import shutil
+import subprocess
+import wave
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 from audio_separator.separator import Separator
+from processing.audio_io import decode_audio, open_wav, to_float32
+from processing.model_registry import registry
+
+# 'UVR-MDX-NET-Inst-HQ-3' is a high-quality model for instrumentals.
+SEPARATOR_MODEL = 'UVR-MDX-NET-Inst-HQ-3'
+
+# Chunked separation: the length of each chunk and how much consecutive
+# chunks overlap. The overlap is cross-faded so the seams are inaudible.
+DEFAULT_CHUNK_SECONDS = 120.0
+CHUNK_OVERLAP_SECONDS = 4.0
+# The sample rate the chunks and the joined stems are written at.
+CHUNK_SAMPLE_RATE = 44100
+
+def _load_separator():
+    return Separator(
+        output_dir=None, # Set per call, see separate_audio
+        model_name=SEPARATOR_MODEL,
+        # Lossless at about half the size of WAV. Only FFmpeg reads the
+        # stems; the models read the 16 kHz view made from them (see vad).
+        output_format='FLAC'
+    )
+
+# The Separator carries the output directory as state, so it is handed to
+# one thread at a time.
+registry.register('separator', _load_separator, exclusive=True)
 
 def separate_audio(input_audio_path, output_dir):
     """
@@ -17,17 +48,15 @@ def separate_audio(input_audio_path, output_dir):
     print(f"Starting audio separation for: {input_audio_path}")
     
     try:
-        # Initialize the separator with a specific model.
-        # 'UVR-MDX-NET-Inst-HQ-3' is a high-quality model for instrumentals.
-        separator = Separator(
-            output_dir=output_dir,
-            model_name='UVR-MDX-NET-Inst-HQ-3',
-            output_format='wav' # WAV is best for further processing
-        )
+        # The separator is loaded once per worker and reused across requests.
+        with registry.acquire('separator') as separator:
+            separator.output_dir = output_dir
+            if getattr(separator, 'model_instance', None) is not None:
+                separator.model_instance.output_dir = output_dir
 
-        # The library automatically separates into primary and secondary stems.
-        # For this model, primary is instrumental, secondary is vocals.
-        output_paths = separator.separate(input_audio_path)
+            # The library automatically separates into primary and secondary stems.
+            # For this model, primary is instrumental, secondary is vocals.
+            output_paths = separator.separate(input_audio_path)
 
         print(f"Separation complete. Output files: {output_paths}")
 
@@ -51,6 +80,193 @@ def separate_audio(input_audio_path, output_dir):
         print(f"Error during audio separation: {e}")
         return None, None
 
+# --- Chunked separation ---
+# Pool of separator processes, kept for the life of the worker so each keeps
+# its model loaded between jobs.
+_chunk_pool = None
+_chunk_pool_workers = 0
+
+def _get_chunk_pool(workers):
+    global _chunk_pool, _chunk_pool_workers
+    if _chunk_pool is None or _chunk_pool_workers != workers:
+        if _chunk_pool is not None:
+            _chunk_pool.shutdown()
+        # Forked workers would inherit the pipes of the running FLAC encoders
+        # (see _StemJoiner) and keep them from ever seeing end of input.
+        context = multiprocessing.get_context('forkserver') if 'forkserver' in multiprocessing.get_all_start_methods() else None
+        _chunk_pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+        _chunk_pool_workers = workers
+    return _chunk_pool
+
+def _is_pcm16_wav(path, sample_rate=CHUNK_SAMPLE_RATE):
+    # Uploads are already decoded to this format (see upload_ingest), so they need no second pass.
+    try:
+        with wave.open(path, 'rb') as wav:
+            return wav.getsampwidth() == 2 and wav.getnchannels() == 2 and wav.getframerate() == sample_rate
+    except (OSError, wave.Error, EOFError):
+        return False
+
+def decode_to_wav(input_audio_path, output_path, sample_rate=CHUNK_SAMPLE_RATE):
+    """Decodes any audio file to 16-bit stereo PCM with FFmpeg, without loading it into memory."""
+    command = [
+        'ffmpeg', '-i', input_audio_path,
+        '-vn', '-ac', '2', '-ar', str(sample_rate), '-c:a', 'pcm_s16le',
+        '-y', output_path
+    ]
+    subprocess.run(command, check=True, capture_output=True, text=True)
+    return output_path
+
+def _write_wav_chunk(samples, sample_rate, output_path):
+    with wave.open(output_path, 'wb') as out:
+        out.setnchannels(samples.shape[1])
+        out.setsampwidth(2)
+        out.setframerate(sample_rate)
+        out.writeframes(np.ascontiguousarray(samples, dtype='<i2').tobytes())
+
+def _to_pcm16(samples):
+    return (np.clip(samples, -1.0, 1.0) * 32767).astype('<i2')
+
+class _StemJoiner:
+    """
+    Joins separated chunks into one FLAC stem, cross-fading each chunk's
+    head with the previous chunk's tail. The joined audio is piped into an
+    FLAC encoder as it is produced; only one overlap is kept in memory.
+    """
+
+    def __init__(self, output_path, sample_rate, channels, overlap):
+        self.encoder = subprocess.Popen([
+            'ffmpeg', '-v', 'error',
+            '-f', 's16le', '-ar', str(sample_rate), '-ac', str(channels), '-i', '-',
+            '-c:a', 'flac', '-y', output_path
+        ], stdin=subprocess.PIPE)
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.overlap = overlap
+        self.tail = None
+
+    def _write(self, audio):
+        self.encoder.stdin.write(_to_pcm16(audio).tobytes())
+
+    def add(self, stem_path, is_last):
+        audio = to_float32(decode_audio(stem_path, self.sample_rate, self.channels))
+
+        if self.tail is not None:
+            overlap = min(len(self.tail), len(audio))
+            fade_in = np.linspace(0.0, 1.0, overlap, dtype=np.float32)[:, None]
+            self._write(self.tail[:overlap] * (1.0 - fade_in) + audio[:overlap] * fade_in)
+            audio = audio[overlap:]
+
+        if is_last or self.overlap == 0:
+            # Without an overlap, chunks are simply written one after another.
+            self._write(audio)
+            self.tail = None
+        else:
+            self._write(audio[:-self.overlap])
+            self.tail = audio[-self.overlap:].copy()
+
+    def close(self):
+        self.encoder.stdin.close()
+        if self.encoder.wait() != 0:
+            raise RuntimeError("FLAC encoding of the joined stem failed.")
+
+def separate_audio_chunked(input_audio_path, output_dir, chunk_seconds=DEFAULT_CHUNK_SECONDS,
+                           overlap_seconds=CHUNK_OVERLAP_SECONDS, workers=1):
+    """
+    Separates an audio file chunk by chunk, so memory use does not grow with
+    the length of the track.
+
+    The input is decoded to PCM once and cut into overlapping chunks, which
+    are separated in a pool of `workers` processes (each with its own model)
+    or in this process for a single worker. The separated chunks are joined
+    back in order with a linear cross-fade over each overlap and written to
+    the stems as they come in.
+
+    Args:
+        input_audio_path (str): The full path to the input audio file.
+        output_dir (str): The directory to save the separated audio files.
+        chunk_seconds (float): The length of each chunk.
+        overlap_seconds (float): How much consecutive chunks overlap.
+        workers (int): The number of chunks separated at the same time.
+
+    Returns:
+        tuple: The paths to the instrumental and vocal files, as FLAC,
+               or (None, None) if separation fails.
+
+    Raises:
+        ValueError: If the chunks are not longer than their overlap.
+    """
+    if chunk_seconds <= overlap_seconds:
+        raise ValueError(
+            f"Separation chunks ({chunk_seconds}s) must be longer than their overlap ({overlap_seconds}s)."
+        )
+    print(f"Starting chunked audio separation for: {input_audio_path} ({workers} workers)")
+    chunk_dir = os.path.join(output_dir, 'separation_chunks')
+    os.makedirs(chunk_dir, exist_ok=True)
+
+    try:
+        if _is_pcm16_wav(input_audio_path):
+            decoded_path = input_audio_path
+        else:
+            decoded_path = decode_to_wav(input_audio_path, os.path.join(chunk_dir, 'input.wav'))
+        samples, sample_rate = open_wav(decoded_path)
+        chunk_length = int(chunk_seconds * sample_rate)
+        overlap = int(overlap_seconds * sample_rate)
+        starts = list(range(0, max(len(samples) - overlap, 1), chunk_length - overlap))
+
+        def write_chunk(index):
+            start = starts[index]
+            chunk_path = os.path.join(chunk_dir, f"chunk_{index:03d}.wav")
+            _write_wav_chunk(samples[start:start + chunk_length], sample_rate, chunk_path)
+            chunk_output_dir = os.path.join(chunk_dir, f"chunk_{index:03d}")
+            os.makedirs(chunk_output_dir, exist_ok=True)
+            return chunk_path, chunk_output_dir
+
+        name = os.path.splitext(os.path.basename(input_audio_path))[0]
+        instrumental_path = os.path.join(output_dir, f"{name}_(Instrumental)_{SEPARATOR_MODEL}.flac")
+        vocal_path = os.path.join(output_dir, f"{name}_(Vocals)_{SEPARATOR_MODEL}.flac")
+        joiners = [
+            _StemJoiner(instrumental_path, sample_rate, samples.shape[1], overlap),
+            _StemJoiner(vocal_path, sample_rate, samples.shape[1], overlap),
+        ]
+
+        try:
+            if workers > 1:
+                # Keep only a few chunks ahead of the join on disk.
+                pool = _get_chunk_pool(workers)
+                pending = {}
+                next_to_submit = 0
+                for index in range(len(starts)):
+                    while next_to_submit < len(starts) and next_to_submit < index + 2 * workers:
+                        pending[next_to_submit] = pool.submit(separate_audio, *write_chunk(next_to_submit))
+                        next_to_submit += 1
+                    stems = pending.pop(index).result()
+                    _join_chunk(joiners, stems, index, index == len(starts) - 1, chunk_dir)
+            else:
+                for index in range(len(starts)):
+                    stems = separate_audio(*write_chunk(index))
+                    _join_chunk(joiners, stems, index, index == len(starts) - 1, chunk_dir)
+        finally:
+            for joiner in joiners:
+                joiner.close()
+
+        print(f"Chunked separation complete ({len(starts)} chunks).")
+        return instrumental_path, vocal_path
+
+    except Exception as e:
+        print(f"Error during chunked audio separation: {e}")
+        return None, None
+    finally:
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+
+def _join_chunk(joiners, stems, index, is_last, chunk_dir):
+    if not all(stems):
+        raise RuntimeError(f"Separation of chunk {index} failed.")
+    for joiner, stem_path in zip(joiners, stems):
+        joiner.add(stem_path, is_last)
+    # The chunk and its stems are no longer needed once joined.
+    os.remove(os.path.join(chunk_dir, f"chunk_{index:03d}.wav"))
+    shutil.rmtree(os.path.join(chunk_dir, f"chunk_{index:03d}"), ignore_errors=True)
+
 if __name__ == '__main__':
     # This is for testing the module directly
     # Create a dummy test file or replace with a real audio file path
@@ -0,0 +1,204 @@
+import os
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+
+from processing.metrics import log_event
+from processing.result_cache import cache_key, file_sha256
+from processing.video_creator import (
+    FRAME_RATE, PREVIEW_FRAME_RATE, PREVIEW_HEIGHT, PREVIEW_WIDTH, VIDEO_SIZE, run_ffmpeg
+)
+
+try:
+    import fcntl
+except ImportError: # Windows: workers may then normalize the same background twice
+    fcntl = None
+
+# Bump when the normalization command changes, so old assets are not reused.
+ASSET_VERSION = 1
+
+_VIDEO_WIDTH, _VIDEO_HEIGHT = (int(n) for n in VIDEO_SIZE.split('x'))
+
+# Render kind -> the format its background is normalized to: exactly what
+# the encode outputs, so no scale or fps filter runs per job.
+VARIANTS = {
+    'video': {'width': _VIDEO_WIDTH, 'height': _VIDEO_HEIGHT, 'frame_rate': FRAME_RATE},
+    'preview': {'width': PREVIEW_WIDTH, 'height': PREVIEW_HEIGHT, 'frame_rate': PREVIEW_FRAME_RATE},
+}
+
+BACKGROUND_EXTENSIONS = {'.mp4', '.mov', '.mkv', '.webm', '.avi'}
+
+@contextmanager
+def _file_lock(path):
+    # Serializes normalizing one asset across worker processes.
+    if fcntl is None:
+        yield
+        return
+    with open(path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def normalize_background(source_path, output_path, width, height, frame_rate):
+    """
+    Transcodes a background video once into the exact format the renders
+    output: the canvas size (scaled to fill, then center-cropped), a fixed
+    frame rate, yuv420p and a closed one-second GOP. It is encoded for fast
+    decoding and without audio, since it is decoded again on every render.
+
+    Args:
+        source_path (str): The uploaded background video.
+        output_path (str): Where to write the normalized video.
+        width (int), height (int): The output canvas.
+        frame_rate (int): The output frame rate; also the keyframe interval.
+
+    Returns:
+        bool: True if the background was normalized, False otherwise.
+    """
+    video_filter = (
+        f"scale={width}:{height}:force_original_aspect_ratio=increase,"
+        f"crop={width}:{height},fps={frame_rate},format=yuv420p,setsar=1"
+    )
+    command = [
+        'ffmpeg',
+        '-i', source_path,
+        '-an', '-sn', '-dn',
+        '-vf', video_filter,
+        '-c:v', 'libx264', '-preset', 'medium', '-crf', '18',
+        '-tune', 'fastdecode', # No CABAC or deblocking: cheaper to decode on every render
+        # A keyframe every second and no scene-cut keyframes, so segment
+        # renders can seek into the loop without decoding from far back.
+        '-g', str(frame_rate), '-keyint_min', str(frame_rate), '-sc_threshold', '0', '-flags', '+cgop',
+        '-movflags', '+faststart',
+        '-f', 'mp4',
+        '-y', output_path
+    ]
+    try:
+        run_ffmpeg(command, 'background')
+        return True
+    except FileNotFoundError:
+        print("ERROR: ffmpeg command not found. Make sure FFmpeg is installed and in your system's PATH.")
+        return False
+    except subprocess.CalledProcessError as e:
+        print("Error while normalizing the background video with FFmpeg.")
+        print("FFmpeg stderr:", e.stderr)
+        return False
+
+class BackgroundAssets:
+    """
+    Normalized copies of the background videos, so the renders only have
+    to decode, loop and burn subtitles onto a background that already has
+    the output's size, frame rate and pixel format.
+
+    Each background is normalized once per variant (see VARIANTS) and
+    stored on disk under its content hash, so the same small set of
+    backgrounds is shared by all jobs and worker processes, and a replaced
+    background file gets new assets.
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir
+        # (path, size, mtime) -> content hash, so a background is hashed once per process.
+        self._hashes = {}
+        self._lock = threading.Lock()
+        self._asset_locks = {}
+
+    def configure(self, cache_dir):
+        """Sets the folder the normalized assets are kept in, see job_queue._init_worker."""
+        self.cache_dir = cache_dir
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def content_hash(self, path):
+        """
+        Returns the SHA-256 of a background file, remembered for as long as
+        the file's size and modification time stay the same.
+        """
+        stat = os.stat(path)
+        identity = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            if identity in self._hashes:
+                return self._hashes[identity]
+        content_hash = file_sha256(path)
+        with self._lock:
+            self._hashes[identity] = content_hash
+        return content_hash
+
+    def asset_path(self, path, variant):
+        """Returns where the normalized variant of a background is stored."""
+        spec = VARIANTS[variant]
+        key = cache_key('background', self.content_hash(path), spec, ASSET_VERSION)
+        return os.path.join(self.cache_dir, f"{key}_{variant}.mp4")
+
+    def get(self, path, variant='video'):
+        """
+        Returns the normalized variant of a background, creating it first if
+        it doesn't exist yet.
+
+        Args:
+            path (str): The background video.
+            variant (str): A key of VARIANTS.
+
+        Returns:
+            str: The normalized video, or None if there is no asset folder or
+                 normalizing failed (the caller then uses the original file).
+        """
+        if not (self.cache_dir and path and os.path.exists(path)):
+            return None
+        try:
+            asset_path = self.asset_path(path, variant)
+            if os.path.exists(asset_path):
+                return asset_path
+
+            with self._lock:
+                asset_lock = self._asset_locks.setdefault(asset_path, threading.Lock())
+            with asset_lock, _file_lock(asset_path + '.lock'):
+                # Another thread or worker may have finished it while we waited.
+                if os.path.exists(asset_path):
+                    return asset_path
+                spec = VARIANTS[variant]
+                print(f"  -> Normalizing background '{os.path.basename(path)}' for {variant} "
+                      f"({spec['width']}x{spec['height']} at {spec['frame_rate']} fps)...")
+                start = time.perf_counter()
+                partial_path = f"{asset_path}.{os.getpid()}.part"
+                if not normalize_background(path, partial_path, **spec):
+                    if os.path.exists(partial_path):
+                        os.remove(partial_path)
+                    return None
+                os.replace(partial_path, asset_path)
+                log_event('background_normalized', background=os.path.basename(path), variant=variant,
+                          seconds=round(time.perf_counter() - start, 3), bytes=os.path.getsize(asset_path))
+                return asset_path
+        except Exception as e:
+            print(f"Error preparing background '{path}': {e}")
+            return None
+
+    def preload(self, folder, variants=None):
+        """
+        Normalizes every background video in a folder, so the first job
+        using one doesn't pay for it.
+
+        Args:
+            folder (str): The folder users pick backgrounds from.
+            variants (list, optional): Keys of VARIANTS; defaults to all of them.
+
+        Returns:
+            int: How many assets are ready.
+        """
+        if not (self.cache_dir and folder and os.path.isdir(folder)):
+            return 0
+        ready = 0
+        for name in sorted(os.listdir(folder)):
+            path = os.path.join(folder, name)
+            if not (os.path.isfile(path) and os.path.splitext(name)[1].lower() in BACKGROUND_EXTENSIONS):
+                continue
+            for variant in variants or VARIANTS:
+                if self.get(path, variant):
+                    ready += 1
+        return ready
+
+# The process-wide background assets, configured in worker processes.
+backgrounds = BackgroundAssets()
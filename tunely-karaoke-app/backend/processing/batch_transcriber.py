@@ -0,0 +1,251 @@
+import queue
+import time
+import numpy as np
+from processing.audio_io import MODEL_SAMPLE_RATE, to_model_audio
+from processing.model_registry import registry
+from processing.transcriber import (
+    DEFAULT_LANGUAGE, DEFAULT_WHISPER_MODEL, STREAM_OVERLAP_SECONDS, STREAM_WINDOW_SECONDS,
+    load_vocal_samples, plan_windows, whisper_model_key
+)
+
+# Defaults for the batching service: the most windows decoded together, and
+# how long to wait for more windows once the first one has arrived.
+DEFAULT_BATCH_SIZE = 8
+DEFAULT_MAX_WAIT_SECONDS = 0.2
+
+# How long a job waits for a window before assuming the service is gone.
+REPLY_TIMEOUT_SECONDS = 600
+
+# Whisper's own rule for windows without singing: likely silence, and the
+# decoded text is not trusted either.
+NO_SPEECH_THRESHOLD = 0.6
+LOGPROB_THRESHOLD = -1.0
+
+def transcribe_window_batch(model, windows, language=DEFAULT_LANGUAGE):
+    """
+    Transcribes up to 30 second windows of 16 kHz audio in one batched
+    Whisper decode, then aligns each window's words with its audio.
+
+    Args:
+        model: A loaded Whisper model.
+        windows (list): 1-D float32 arrays of at most 30 seconds each.
+        language (str, optional): The language to force. None detects it per window.
+
+    Returns:
+        list: One list of {'text', 'start', 'end'} word dicts per window,
+              with times relative to the start of the window.
+    """
+    import torch
+    import whisper
+    from whisper.audio import HOP_LENGTH, N_FRAMES, log_mel_spectrogram, pad_or_trim
+    from whisper.timing import find_alignment
+    from whisper.tokenizer import get_tokenizer
+
+    mels = torch.stack([
+        pad_or_trim(log_mel_spectrogram(torch.from_numpy(audio), n_mels=model.dims.n_mels), N_FRAMES)
+        for audio in windows
+    ]).to(model.device)
+    options = whisper.DecodingOptions(language=language, without_timestamps=True, fp16=False)
+    results = whisper.decode(model, mels, options)
+
+    batch_words = []
+    for audio, mel, result in zip(windows, mels, results):
+        if result.no_speech_prob > NO_SPEECH_THRESHOLD and result.avg_logprob < LOGPROB_THRESHOLD:
+            batch_words.append([])
+            continue
+        tokenizer = get_tokenizer(
+            model.is_multilingual, num_languages=model.num_languages,
+            language=result.language, task='transcribe'
+        )
+        text_tokens = [token for token in result.tokens if token < tokenizer.eot]
+        if not text_tokens:
+            batch_words.append([])
+            continue
+        timings = find_alignment(model, tokenizer, text_tokens, mel, len(audio) // HOP_LENGTH)
+        batch_words.append([
+            {'text': timing.word.strip(), 'start': float(timing.start), 'end': float(timing.end)}
+            for timing in timings if timing.word.strip()
+        ])
+    return batch_words
+
+def _collect_batch(requests, batch_size, max_wait_seconds):
+    """Blocks for one request, then gathers more until the batch is full or the wait is over."""
+    first = requests.get()
+    if first is None:
+        return None
+    batch = [first]
+    deadline = time.time() + max_wait_seconds
+    while len(batch) < batch_size:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        try:
+            request = requests.get(timeout=remaining)
+        except queue.Empty:
+            break
+        if request is None:
+            # Finish this batch first, then stop.
+            requests.put(None)
+            break
+        batch.append(request)
+    return batch
+
+def serve_transcription_batches(requests, model_name=DEFAULT_WHISPER_MODEL, batch_size=DEFAULT_BATCH_SIZE,
+                                max_wait_seconds=DEFAULT_MAX_WAIT_SECONDS, stats=None):
+    """
+    Runs the batching transcription service until None is put on `requests`.
+    Meant to be the target of its own process, which keeps one Whisper model
+    for all jobs.
+
+    Each request is a dict with the window's 'audio', its 'language', an
+    'index', a 'reply' queue and whether it is the 'last' window of its song.
+    Windows from any number of jobs are decoded together, grouped by language,
+    and every job gets (index, words, error) back on its reply queue.
+
+    Args:
+        requests: The queue jobs put their windows on.
+        model_name (str): The Whisper model to serve.
+        batch_size (int): The most windows decoded in one batch.
+        max_wait_seconds (float): How long to wait for a batch to fill up.
+        stats (dict, optional): Shared dict the throughput counters are kept in.
+    """
+    stats = stats if stats is not None else {}
+    for name in ('batches', 'windows', 'songs', 'audio_seconds', 'busy_seconds'):
+        stats.setdefault(name, 0)
+    stats['started_at'] = time.time()
+    key = whisper_model_key(model_name)
+    registry.preload([key])
+    print(f"Batch transcriber serving '{model_name}' (batch size {batch_size}, max wait {max_wait_seconds}s)")
+
+    while True:
+        batch = _collect_batch(requests, batch_size, max_wait_seconds)
+        if batch is None:
+            break
+
+        start = time.time()
+        songs = 0
+        by_language = {}
+        for request in batch:
+            by_language.setdefault(request['language'], []).append(request)
+        for language, group in by_language.items():
+            try:
+                with registry.acquire(key) as model:
+                    batch_words = transcribe_window_batch(model, [request['audio'] for request in group], language)
+                replies = [(words, None) for words in batch_words]
+            except Exception as e:
+                print(f"Error during batched transcription: {e}")
+                replies = [(None, str(e))] * len(group)
+            for request, (words, error) in zip(group, replies):
+                request['reply'].put((request['index'], words, error))
+                if request['last'] and not error:
+                    songs += 1
+
+        # Manager dicts hand out copies, so write every counter back.
+        stats['batches'] += 1
+        stats['windows'] += len(batch)
+        stats['songs'] += songs
+        stats['audio_seconds'] += sum(len(request['audio']) for request in batch) / MODEL_SAMPLE_RATE
+        stats['busy_seconds'] += time.time() - start
+
+    print("Batch transcriber stopped.")
+
+def throughput(stats):
+    """
+    Summarizes the service's counters.
+
+    Returns:
+        dict: The raw counters plus 'songs_per_minute' (while busy),
+              'mean_batch_size' and 'realtime_factor' (audio seconds per
+              second of decoding).
+    """
+    stats = dict(stats)
+    busy_seconds = stats.get('busy_seconds', 0)
+    batches = stats.get('batches', 0)
+    stats['songs_per_minute'] = round(stats.get('songs', 0) * 60 / busy_seconds, 2) if busy_seconds else None
+    stats['mean_batch_size'] = round(stats.get('windows', 0) / batches, 2) if batches else None
+    stats['realtime_factor'] = round(stats.get('audio_seconds', 0) / busy_seconds, 2) if busy_seconds else None
+    return stats
+
+class BatchTranscriberClient:
+    """
+    The job side of the batching service: cuts a vocal track into windows,
+    sends them to the service and yields the words back in song order.
+
+    Args:
+        requests: The service's request queue.
+        replies: A queue only this job reads from.
+        model_name (str): The model the service runs; other models are not served.
+        max_in_flight (int): The most windows of this job waiting at the service,
+                             which bounds the memory used for long songs.
+    """
+
+    def __init__(self, requests, replies, model_name=DEFAULT_WHISPER_MODEL, max_in_flight=DEFAULT_BATCH_SIZE):
+        self.requests = requests
+        self.replies = replies
+        self.model_name = model_name
+        self.max_in_flight = max_in_flight
+
+    def serves(self, model_name):
+        return model_name == self.model_name
+
+    def transcribe(self, vocal_track_path, language=DEFAULT_LANGUAGE, window_seconds=STREAM_WINDOW_SECONDS,
+                   overlap_seconds=STREAM_OVERLAP_SECONDS, progress=None):
+        """
+        Transcribes a vocal track through the service. Same windows, word
+        ownership and output as transcriber.transcribe_vocals_streaming(),
+        except that a language to detect is detected per window.
+
+        Yields:
+            dict: {'text': 'word', 'start': 1.23, 'end': 1.45}, in song time.
+
+        Raises:
+            RuntimeError: If the service fails a window or does not answer.
+        """
+        print(f"Starting batched transcription for: {vocal_track_path}")
+        samples, sample_rate = load_vocal_samples(vocal_track_path)
+        total_seconds = len(samples) / sample_rate
+        windows = plan_windows(total_seconds, window_seconds, overlap_seconds)
+
+        def send(index):
+            window_start, window_end, _, _ = windows[index]
+            audio = to_model_audio(
+                samples[int(window_start * sample_rate):int(window_end * sample_rate)], sample_rate
+            )
+            self.requests.put({
+                'reply': self.replies,
+                'index': index,
+                'audio': np.ascontiguousarray(audio),
+                'language': language,
+                'last': index == len(windows) - 1,
+            })
+
+        next_to_send = 0
+        next_to_yield = 0
+        finished = {}
+        word_count = 0
+        while next_to_yield < len(windows):
+            while next_to_send < len(windows) and next_to_send - next_to_yield < self.max_in_flight:
+                send(next_to_send)
+                next_to_send += 1
+
+            try:
+                index, words, error = self.replies.get(timeout=REPLY_TIMEOUT_SECONDS)
+            except queue.Empty:
+                raise RuntimeError("The batch transcriber did not answer in time.")
+            if error:
+                raise RuntimeError(f"Batched transcription failed: {error}")
+            finished[index] = words
+
+            # Windows can come back out of order; yield in song order.
+            while next_to_yield in finished:
+                window_start, window_end, owned_from, owned_until = windows[next_to_yield]
+                for word in finished.pop(next_to_yield):
+                    word = {**word, 'start': word['start'] + window_start, 'end': word['end'] + window_start}
+                    if owned_from <= word['start'] < owned_until:
+                        word_count += 1
+                        yield word
+                next_to_yield += 1
+                if progress:
+                    progress(window_end / total_seconds)
+
+        print(f"Batched transcription complete. Found {word_count} words.")
@@ -0,0 +1,225 @@
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+from processing.result_cache import link_or_copy
+
+MANIFEST_FILE = 'manifest.json'
+ENTRY_FILE = 'entry.json'
+
+# Job statuses a manifest can have. 'queued' and 'running' jobs were cut
+# short if they are found when the server starts.
+INCOMPLETE_STATUSES = ('queued', 'running')
+
+def _write_json(path, value):
+    # Written next to the target and renamed, so readers never see half a file.
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(value, f)
+    os.replace(tmp_path, path)
+
+class CheckpointStore:
+    """
+    Per-request checkpoints of the pipeline's stage outputs, so a failed or
+    interrupted job resumes from its last completed stage instead of
+    starting over.
+
+    Each request gets a directory holding a manifest.json (input, options,
+    job status and the completed stages) and one subdirectory per completed
+    stage with its files (hard linked, so no extra space on the same
+    filesystem) and an entry.json with its data. Unlike the ResultCache,
+    which is shared by content hash and can evict an entry at any time,
+    checkpoints belong to one request and are only removed by
+    collect_garbage(), once they are older than max_age_seconds or the
+    store outgrows max_bytes.
+    """
+
+    def __init__(self, root, max_bytes=5 * 1024**3, max_age_seconds=24 * 3600, min_age_seconds=600):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        # Checkpoints updated more recently than this are never collected,
+        # since their job may still be running.
+        self.min_age_seconds = min_age_seconds
+        # Stages finishing in parallel threads update the same manifest.
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _request_dir(self, request_id):
+        return os.path.join(self.root, request_id)
+
+    def manifest(self, request_id):
+        """Returns a request's manifest, or None if it has no checkpoints."""
+        try:
+            with open(os.path.join(self._request_dir(request_id), MANIFEST_FILE), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_manifest(self, request_id, manifest):
+        manifest['updated_at'] = time.time()
+        _write_json(os.path.join(self._request_dir(request_id), MANIFEST_FILE), manifest)
+
+    def begin(self, request_id, input_audio_path, options=None):
+        """
+        Records a queued job, keeping the stages it already completed if it
+        ran before (a retry or a resume after a restart).
+
+        Args:
+            request_id (str): The job's request ID.
+            input_audio_path (str): The uploaded audio file.
+            options (dict, optional): The job's pipeline options.
+
+        Returns:
+            dict: The manifest.
+        """
+        with self._lock:
+            request_dir = self._request_dir(request_id)
+            os.makedirs(request_dir, exist_ok=True)
+            manifest = self.manifest(request_id) or {
+                'request_id': request_id,
+                'created_at': time.time(),
+                'attempts': 0,
+                'stages': {},
+            }
+            manifest.update({
+                'input_audio_path': input_audio_path,
+                'options': options or {},
+                'status': 'queued',
+                'error': None,
+            })
+            self._write_manifest(request_id, manifest)
+            return manifest
+
+    def mark(self, request_id, status, error=None):
+        """Sets the job status ('running', 'done' or 'failed') of a request."""
+        with self._lock:
+            manifest = self.manifest(request_id)
+            if manifest is None:
+                return None
+            manifest.update({'status': status, 'error': error})
+            if status == 'running':
+                manifest['attempts'] += 1
+            self._write_manifest(request_id, manifest)
+            return manifest
+
+    def save(self, request_id, stage, entry):
+        """
+        Checkpoints a completed stage.
+
+        Args:
+            request_id (str): The job's request ID.
+            stage (str): The stage name.
+            entry (dict): The stage output, {'files': {name: path}, 'data': ...}.
+        """
+        request_dir = self._request_dir(request_id)
+        if not os.path.isdir(request_dir):
+            return
+        stage_dir = os.path.join(request_dir, stage)
+        tmp_dir = os.path.join(request_dir, f".{stage}.{uuid.uuid4().hex}")
+        try:
+            os.makedirs(tmp_dir)
+            stored = {}
+            for name, path in (entry.get('files') or {}).items():
+                filename = name + os.path.splitext(path)[1]
+                link_or_copy(path, os.path.join(tmp_dir, filename))
+                stored[name] = filename
+            _write_json(os.path.join(tmp_dir, ENTRY_FILE), {'files': stored, 'data': entry.get('data')})
+            shutil.rmtree(stage_dir, ignore_errors=True)
+            os.rename(tmp_dir, stage_dir)
+        except Exception as e:
+            # A missing checkpoint only costs a re-run of the stage.
+            print(f"Error saving the '{stage}' checkpoint of {request_id}: {e}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+        with self._lock:
+            manifest = self.manifest(request_id)
+            if manifest is not None:
+                manifest['stages'][stage] = {'completed_at': time.time(), 'files': sorted(stored)}
+                self._write_manifest(request_id, manifest)
+
+    def load(self, request_id, stage):
+        """
+        Looks up a completed stage of a request.
+
+        Returns:
+            dict: {'files': {name: path}, 'data': ...} like a stage output, or
+                  None if the stage has no complete checkpoint.
+        """
+        manifest = self.manifest(request_id)
+        if manifest is None or stage not in manifest['stages']:
+            return None
+        stage_dir = os.path.join(self._request_dir(request_id), stage)
+        try:
+            with open(os.path.join(stage_dir, ENTRY_FILE), encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        files = {name: os.path.join(stage_dir, filename) for name, filename in entry['files'].items()}
+        if not all(os.path.exists(path) for path in files.values()):
+            return None
+        return {'files': files, 'data': entry['data']}
+
+    def incomplete(self):
+        """Returns the manifests of the jobs that were queued or running, oldest first."""
+        manifests = []
+        for request_id in os.listdir(self.root):
+            manifest = self.manifest(request_id)
+            if manifest and manifest.get('status') in INCOMPLETE_STATUSES:
+                manifests.append(manifest)
+        return sorted(manifests, key=lambda manifest: manifest['created_at'])
+
+    def _requests(self):
+        """Yields (updated_at, size, request_dir) for every request in the store."""
+        for request_id in os.listdir(self.root):
+            request_dir = self._request_dir(request_id)
+            if not os.path.isdir(request_dir):
+                continue
+            try:
+                updated_at = os.path.getmtime(os.path.join(request_dir, MANIFEST_FILE))
+                size = sum(
+                    os.path.getsize(os.path.join(directory, filename))
+                    for directory, _, filenames in os.walk(request_dir) for filename in filenames
+                )
+            except OSError:
+                continue
+            yield updated_at, size, request_dir
+
+    def collect_garbage(self):
+        """
+        Removes the checkpoints of finished ('done' or 'failed') requests not
+        updated in max_age_seconds, then the least recently updated finished
+        ones until the store fits in max_bytes. Queued and running jobs keep
+        theirs however large the store gets, since they still write to them.
+
+        Returns:
+            int: The size of the store afterwards, in bytes.
+        """
+        requests = sorted(self._requests())
+        total = sum(size for _, size, _ in requests)
+        now = time.time()
+        for updated_at, size, request_dir in requests:
+            age = now - updated_at
+            if age < self.min_age_seconds:
+                continue
+            manifest = self.manifest(os.path.basename(request_dir))
+            if manifest and manifest.get('status') in INCOMPLETE_STATUSES:
+                continue
+            if age > self.max_age_seconds or total > self.max_bytes:
+                shutil.rmtree(request_dir, ignore_errors=True)
+                total -= size
+        return total
+
+    def stats(self):
+        """Returns the number of checkpointed requests by status and the store's size."""
+        statuses = {}
+        size = 0
+        for _, request_size, request_dir in self._requests():
+            manifest = self.manifest(os.path.basename(request_dir)) or {}
+            status = manifest.get('status', 'unknown')
+            statuses[status] = statuses.get(status, 0) + 1
+            size += request_size
+        return {'requests': statuses, 'size_bytes': size, 'max_bytes': self.max_bytes}
@@ -0,0 +1,78 @@
+import json
+import os
+from processing.subtitle_generator import DEFAULT_WORDS_PER_LINE, iter_lines, max_line_chars
+
+# Bump when the document layout changes, so the player can tell versions apart.
+LYRICS_FORMAT_VERSION = 1
+
+def _seconds(value):
+    # Centisecond precision is all the karaoke highlighting needs.
+    return round(value, 2)
+
+def build_lyrics_document(transcription_data, words_per_line=DEFAULT_WORDS_PER_LINE):
+    """
+    Builds a compact timed-lyrics document for in-browser karaoke playback.
+
+    Speakers are stored once and referenced by index, and each word is a
+    [text, start, end] list, which keeps the JSON small for long songs:
+
+        {"version": 1, "speakers": ["SPEAKER_00"],
+         "lines": [{"start": 1.0, "end": 3.5, "speaker": 0,
+                    "words": [["Hello", 1.0, 1.5], ...]}]}
+
+    Lines are broken like the subtitles (see subtitle_generator.iter_lines),
+    at the width of the default style.
+
+    Args:
+        transcription_data (list): The word dictionaries, including speaker info.
+        words_per_line (int): The maximum number of words per line.
+
+    Returns:
+        dict: The lyrics document.
+    """
+    speakers = []
+    speaker_index = {}
+    lines = []
+
+    for line_words in iter_lines(transcription_data, words_per_line, max_line_chars()):
+        # Lines end at speaker changes, so the first word's speaker is the line's.
+        speaker = line_words[0].get('speaker', 'UNKNOWN')
+        if speaker not in speaker_index:
+            speaker_index[speaker] = len(speakers)
+            speakers.append(speaker)
+        lines.append({
+            'start': _seconds(line_words[0]['start']),
+            'end': _seconds(line_words[-1]['end']),
+            'speaker': speaker_index[speaker],
+            'words': [[word['text'], _seconds(word['start']), _seconds(word['end'])] for word in line_words],
+        })
+
+    return {'version': LYRICS_FORMAT_VERSION, 'speakers': speakers, 'lines': lines}
+
+def generate_lyrics_file(transcription_data, output_dir, request_id, words_per_line=DEFAULT_WORDS_PER_LINE):
+    """
+    Writes the timed-lyrics document for a request to a .json file.
+
+    Args:
+        transcription_data (list): The final list of word dictionaries, including speaker info.
+        output_dir (str): The directory to save the .json file.
+        request_id (str): The unique ID for this processing request.
+        words_per_line (int): The maximum number of words per line.
+
+    Returns:
+        str: The full path to the generated .json file, or None if it fails.
+    """
+    print("Starting timed lyrics generation...")
+    lyrics_file_path = os.path.join(output_dir, f"{request_id}.json")
+
+    try:
+        document = build_lyrics_document(transcription_data, words_per_line)
+        with open(lyrics_file_path, 'w', encoding='utf-8') as f:
+            json.dump(document, f, ensure_ascii=False, separators=(',', ':'))
+
+        print(f"Successfully generated lyrics file: {lyrics_file_path}")
+        return lyrics_file_path
+
+    except Exception as e:
+        print(f"Error generating lyrics file: {e}")
+        return None
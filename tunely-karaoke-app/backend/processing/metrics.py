@@ -0,0 +1,252 @@
+import json
+import math
+import resource
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Histogram name -> (help text, label names, bucket upper bounds).
+HISTOGRAMS = {
+    'tunely_stage_seconds': (
+        "Wall time of a pipeline stage.", ('stage', 'model'),
+        (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800),
+    ),
+    'tunely_stage_cpu_seconds': (
+        "CPU time of the worker process and its FFmpeg children during a stage.", ('stage', 'model'),
+        (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600),
+    ),
+    'tunely_stage_peak_rss_megabytes': (
+        "Peak resident memory of the worker process during a stage.", ('stage', 'model'),
+        (256, 512, 1024, 2048, 4096, 8192, 16384),
+    ),
+    'tunely_stage_realtime_factor': (
+        "Stage wall time per second of input audio (below 1 is faster than real time).", ('stage', 'model'),
+        (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4),
+    ),
+    'tunely_stage_wait_seconds': (
+        "Time a stage waited for a CPU slot, by priority lane.", ('stage', 'lane'),
+        (0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600),
+    ),
+    'tunely_model_load_seconds': (
+        "Time to load a model into a worker process.", ('model',),
+        (1, 2.5, 5, 10, 30, 60, 120),
+    ),
+    'tunely_ffmpeg_encode_fps': (
+        "Frames encoded per second by an FFmpeg render.", ('kind',),
+        (5, 10, 25, 50, 100, 200, 400, 800),
+    ),
+    'tunely_ffmpeg_speed': (
+        "FFmpeg encode speed as a multiple of real time.", ('kind',),
+        (0.5, 1, 2, 5, 10, 25, 50, 100, 250),
+    ),
+}
+
+def log_event(event, **fields):
+    """Prints one structured log line: a JSON object with the event name and fields."""
+    print(json.dumps({'event': event, 'time': round(time.time(), 3), **fields}, default=str), flush=True)
+
+def _label_text(pairs):
+    if not pairs:
+        return ''
+    escaped = [(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for name, value in pairs]
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+class Metrics:
+    """
+    Histograms of the pipeline's stage timings, memory and throughput,
+    rendered in the Prometheus text format.
+
+    Observations are kept in `values`, which can be a Manager dict (with a
+    matching Manager lock) so that the worker processes record into the
+    same histograms the web process serves.
+    """
+
+    def __init__(self, values=None, lock=None):
+        self.values = values if values is not None else {}
+        self.lock = lock
+
+    def attach(self, values, lock=None):
+        """Records into shared storage from now on, see job_queue._init_worker."""
+        self.values = values
+        self.lock = lock
+
+    def observe(self, name, value, **labels):
+        """
+        Adds one observation to a histogram of HISTOGRAMS. Values that are
+        None or not finite (e.g. no input duration) are ignored.
+        """
+        if value is None or not math.isfinite(value):
+            return
+        _, label_names, buckets = HISTOGRAMS[name]
+        series = json.dumps([name] + [str(labels.get(label, '')) for label in label_names])
+
+        def update():
+            # Manager dicts hand out copies, so the series is written back whole.
+            histogram = self.values.get(series) or {'counts': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram['counts'][i] += 1
+                    break
+            histogram['sum'] += value
+            histogram['count'] += 1
+            self.values[series] = histogram
+
+        try:
+            if self.lock is not None:
+                with self.lock:
+                    update()
+            else:
+                update()
+        except Exception as e:
+            # Metrics must never fail a job (e.g. the manager shutting down).
+            print(f"Error recording metric '{name}': {e}")
+
+    def render(self):
+        """Returns every histogram in the Prometheus text exposition format."""
+        by_name = {}
+        for series, histogram in dict(self.values).items():
+            name, *label_values = json.loads(series)
+            by_name.setdefault(name, []).append((label_values, histogram))
+
+        lines = []
+        for name, (help_text, label_names, buckets) in HISTOGRAMS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for label_values, histogram in sorted(by_name.get(name, []), key=lambda item: item[0]):
+                pairs = list(zip(label_names, label_values))
+                cumulative = 0
+                for bound, count in zip(buckets, histogram['counts']):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_label_text(pairs + [('le', _format_value(bound))])} {cumulative}")
+                lines.append(f"{name}_bucket{_label_text(pairs + [('le', '+Inf')])} {histogram['count']}")
+                labels = _label_text(pairs)
+                lines.append(f"{name}_sum{labels} {_format_value(histogram['sum'])}")
+                lines.append(f"{name}_count{labels} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+# How often a stage samples the resident memory of its process.
+RSS_SAMPLE_SECONDS = 0.1
+
+def _process_peak_rss_mb():
+    # The peak over the process's whole life; ru_maxrss is in kilobytes on
+    # Linux and in bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def _current_rss_mb():
+    """Returns the current resident memory from /proc, or None where it is not available."""
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+class _RssSampler:
+    """
+    Tracks the peak resident memory of this process over a block of work by
+    reading /proc/self/statm on a background thread. Without /proc (e.g. on
+    macOS), it falls back to the process's lifetime peak.
+    """
+
+    def __init__(self, interval=RSS_SAMPLE_SECONDS):
+        self.interval = interval
+        self.peak_mb = _current_rss_mb()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        rss = _current_rss_mb()
+        if rss is not None and (self.peak_mb is None or rss > self.peak_mb):
+            self.peak_mb = rss
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        if self.peak_mb is not None:
+            self._thread = threading.Thread(target=self._run, name='rss-sampler', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops sampling and returns the peak in megabytes."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._sample()
+        return self.peak_mb if self.peak_mb is not None else _process_peak_rss_mb()
+
+def _children_cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+@contextmanager
+def stage_timer(stage, model='', audio_seconds=None, **fields):
+    """
+    Measures a block of pipeline work: wall time, CPU time (including
+    finished FFmpeg children), peak RSS during the block and the real-time
+    factor against the input's duration. The result is logged as a 'stage_metrics' event and
+    recorded into the tunely_stage_* histograms; failed blocks are only logged.
+
+    CPU time and RSS are per process, so stages running in parallel within
+    one job each see the other's CPU time and memory as well. FFmpeg
+    children's memory is not included.
+
+    Args:
+        stage (str): The stage name.
+        model (str): The model the stage runs, if any.
+        audio_seconds (float, optional): Duration of the input audio.
+        **fields: Extra fields for the log line, e.g. the job ID.
+
+    Yields:
+        dict: The measurements, filled in when the block ends.
+    """
+    sample = {'stage': stage, 'model': model, **fields}
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time() + _children_cpu_seconds()
+    rss = _RssSampler().start()
+    status = 'failed'
+    try:
+        yield sample
+        status = 'done'
+    finally:
+        wall_seconds = time.perf_counter() - start_wall
+        sample.update({
+            'status': status,
+            'wall_seconds': round(wall_seconds, 3),
+            'cpu_seconds': round(time.process_time() + _children_cpu_seconds() - start_cpu, 3),
+            'peak_rss_mb': round(rss.stop(), 1),
+            'audio_seconds': round(audio_seconds, 3) if audio_seconds else None,
+            'realtime_factor': round(wall_seconds / audio_seconds, 4) if audio_seconds else None,
+        })
+        log_event('stage_metrics', **sample)
+        if status == 'done':
+            metrics.observe('tunely_stage_seconds', sample['wall_seconds'], stage=stage, model=model)
+            metrics.observe('tunely_stage_cpu_seconds', sample['cpu_seconds'], stage=stage, model=model)
+            metrics.observe('tunely_stage_peak_rss_megabytes', sample['peak_rss_mb'], stage=stage, model=model)
+            metrics.observe('tunely_stage_realtime_factor', sample['realtime_factor'], stage=stage, model=model)
+
+def parse_ffmpeg_progress(output):
+    """
+    Reads the key=value blocks FFmpeg writes with `-progress pipe:1`.
+
+    Returns:
+        dict: The last block's values (e.g. 'frame', 'fps', 'out_time_us',
+              'speed', 'progress'), as strings.
+    """
+    progress = {}
+    for line in output.splitlines():
+        key, separator, value = line.strip().partition('=')
+        if separator:
+            progress[key] = value.strip()
+    return progress
+
+# The process-wide metrics, attached to shared storage in worker processes.
+metrics = Metrics()
@@ -0,0 +1,167 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from processing.metrics import metrics
+
+class _ModelEntry:
+    def __init__(self, loader, exclusive):
+        self.loader = loader
+        self.exclusive = exclusive
+        self.model = None
+        self.last_used = 0.0
+        self.in_use = 0
+        # Held while loading, and while in use for exclusive models.
+        self.lock = threading.RLock()
+
+class ModelRegistry:
+    """
+    Keeps the heavy ML models (Separator, Whisper, pyannote) resident so they
+    are loaded once per worker process instead of once per request.
+
+    Models are registered with a loader function and loaded lazily on first
+    use. Models marked as exclusive (those with per-call mutable state, like
+    the Separator's output directory) are only handed to one thread at a time.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, loader, exclusive=False):
+        """
+        Registers a model loader under a name. Registering the same name
+        again is a no-op, so modules can register their models at import time.
+
+        Args:
+            name (str): The registry key, e.g. 'whisper:base'.
+            loader (callable): Called with no arguments to load the model.
+            exclusive (bool): If True, only one thread can use the model at a time.
+        """
+        with self._lock:
+            if name not in self._entries:
+                self._entries[name] = _ModelEntry(loader, exclusive)
+
+    def _entry(self, name):
+        with self._lock:
+            if name not in self._entries:
+                raise KeyError(f"No model registered under '{name}'")
+            return self._entries[name]
+
+    def _load(self, name, entry):
+        with entry.lock:
+            if entry.model is None:
+                print(f"  -> Loading model '{name}'...")
+                start = time.time()
+                entry.model = entry.loader()
+                print(f"  -> Model '{name}' loaded in {time.time() - start:.1f}s")
+                metrics.observe('tunely_model_load_seconds', time.time() - start, model=name)
+        return entry.model
+
+    def get(self, name):
+        """Returns the model, loading it first if needed. Not for exclusive models."""
+        entry = self._entry(name)
+        model = self._load(name, entry)
+        entry.last_used = time.time()
+        return model
+
+    @contextmanager
+    def acquire(self, name):
+        """
+        Context manager that hands out the model and marks it as in use, so
+        it is not evicted mid-inference. Exclusive models are locked for the
+        duration of the block.
+        """
+        entry = self._entry(name)
+        model = self._load(name, entry)
+        if entry.exclusive:
+            entry.lock.acquire()
+        with self._lock:
+            entry.in_use += 1
+        try:
+            yield model
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+                entry.last_used = time.time()
+            if entry.exclusive:
+                entry.lock.release()
+
+    def preload(self, names=None):
+        """
+        Loads the given models (or every registered model) right away.
+        Meant to be called when a worker process starts. Failures are logged
+        and skipped, the model will be retried lazily on first use.
+        """
+        for name in names if names is not None else list(self._entries):
+            try:
+                self._load(name, self._entry(name))
+            except Exception as e:
+                print(f"Error preloading model '{name}': {e}")
+
+    def loaded(self):
+        """Returns the names of the models currently resident in memory."""
+        with self._lock:
+            return [name for name, entry in self._entries.items() if entry.model is not None]
+
+    def evict(self, name):
+        """Drops a model from memory unless it is currently in use. Returns True if evicted."""
+        entry = self._entry(name)
+        with self._lock:
+            if entry.model is None or entry.in_use:
+                return False
+            entry.model = None
+        print(f"  -> Evicted model '{name}'")
+        _release_memory()
+        return True
+
+    def evict_idle(self, max_idle_seconds):
+        """Evicts every model that has not been used for max_idle_seconds."""
+        now = time.time()
+        evicted = []
+        for name in self.loaded():
+            if now - self._entry(name).last_used > max_idle_seconds and self.evict(name):
+                evicted.append(name)
+        return evicted
+
+    def evict_under_pressure(self, min_available_mb=1024):
+        """
+        Evicts models, least recently used first, until at least
+        min_available_mb of system memory is available again.
+        """
+        evicted = []
+        by_last_use = sorted(self.loaded(), key=lambda name: self._entry(name).last_used)
+        for name in by_last_use:
+            available = available_memory_mb()
+            if available is None or available >= min_available_mb:
+                break
+            if self.evict(name):
+                evicted.append(name)
+        return evicted
+
+def available_memory_mb():
+    """Returns the available system memory in MB, or None if it can't be determined."""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') // (1024 * 1024)
+    except (ValueError, OSError, AttributeError):
+        return None
+
+def _release_memory():
+    import gc
+    gc.collect()
+    try:
+        import torch
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    except ImportError:
+        pass
+
+# The process-wide registry shared by all processing modules.
+registry = ModelRegistry()
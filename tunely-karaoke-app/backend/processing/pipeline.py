@@ -0,0 +1,512 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from processing.audio_separator import CHUNK_OVERLAP_SECONDS, SEPARATOR_MODEL, separate_audio, separate_audio_chunked
+from processing.transcriber import (
+    DEFAULT_LANGUAGE, DEFAULT_WHISPER_MODEL, transcribe_vocals, transcribe_vocals_streaming
+)
+from processing.speaker_diarizer import DIARIZATION_MODEL, assign_speakers, diarize
+from processing.subtitle_generator import DEFAULT_WORDS_PER_LINE, generate_ass_file
+from processing.lyrics_exporter import generate_lyrics_file
+from processing.vad import OffsetMap, trim_silence
+from processing.video_creator import AUDIO_CODECS, create_preview, create_video, get_media_duration, transcode_audio
+from processing.background_assets import ASSET_VERSION, backgrounds
+from processing.metrics import stage_timer
+from processing.scheduler import scheduler
+from processing.result_cache import cache_key, file_sha256, link_or_copy
+
+# The pipeline stages, in an order where every stage comes after its inputs.
+STAGES = [
+    'separation', 'vad', 'transcription', 'diarization', 'speakers',
+    'subtitles', 'preview', 'video', 'lyrics', 'audio'
+]
+
+# Rough share of the total processing time spent in each stage. Used to turn
+# per-stage progress into a single overall percentage for the frontend.
+STAGE_WEIGHTS = {
+    'separation': 0.28,
+    'vad': 0.02,
+    'transcription': 0.30,
+    'diarization': 0.15,
+    'speakers': 0.0,
+    'subtitles': 0.05,
+    'preview': 0.05,
+    'video': 0.15,
+    # Lyrics mode: both are cheap next to the video encode they replace.
+    'lyrics': 0.0,
+    'audio': 0.0,
+}
+
+# The stages each stage reads its input from. Transcription and diarization
+# only need the vocal track, so they run in parallel; 'speakers' joins them.
+# 'vad' turns the vocal stem into the 16 kHz mono track both of them read,
+# without the silent stretches when trim_silence is on.
+STAGE_INPUTS = {
+    'separation': [],
+    'vad': ['separation'],
+    'transcription': ['vad'],
+    'diarization': ['vad'],
+    'speakers': ['transcription', 'diarization'],
+    'subtitles': ['speakers'],
+    # The full encode waits for the preview so the two don't compete for the CPU.
+    'preview': ['separation', 'subtitles'],
+    'video': ['separation', 'subtitles', 'preview'],
+    'lyrics': ['speakers'],
+    'audio': ['separation'],
+}
+
+# Stages cheap enough that caching their output is not worth the disk space.
+UNCACHED_STAGES = {'speakers'}
+
+# Stages whose output file is published to the output folder under the request ID.
+PUBLISHED_STAGES = {
+    'preview': '{request_id}_preview.mp4',
+    'video': '{request_id}.mp4',
+    'lyrics': '{request_id}.json',
+    'audio': '{request_id}{audio_extension}',
+}
+
+# The final stages each output mode needs. 'lyrics' skips the video encode
+# entirely: the browser plays the instrumental and highlights the lyrics itself.
+OUTPUT_TARGETS = {
+    'video': ['video'],
+    'lyrics': ['lyrics', 'audio'],
+}
+
+# The most stages run at once within one job (transcription + diarization).
+MAX_PARALLEL_STAGES = 2
+
+# Per-request options and their defaults. All of them end up in the cache keys.
+DEFAULT_OPTIONS = {
+    # Separate in chunks of this many seconds with bounded memory; None
+    # separates the whole file at once.
+    'separation_chunk_seconds': None,
+    # Chunks separated in parallel, one model per process. Not cached on.
+    'separation_workers': 1,
+    'whisper_model': DEFAULT_WHISPER_MODEL,
+    'language': DEFAULT_LANGUAGE,
+    # Transcribe in overlapping windows with flat memory use and early lyrics.
+    'stream_transcription': True,
+    # Only transcribe and diarize the voiced parts of the vocal track.
+    'trim_silence': True,
+    # Set by run_pipeline when a batch transcriber serves the Whisper model.
+    'batch_transcription': False,
+    'words_per_line': DEFAULT_WORDS_PER_LINE,
+    'style': 'default',
+    'background_video_path': None,
+    # Parallel FFmpeg segment renders; does not change the output, so not cached on.
+    'render_workers': 1,
+    # Publish a fast low-resolution preview before the full-quality encode.
+    'preview': True,
+    # 'video' or 'lyrics', see OUTPUT_TARGETS. Picks stages, so not cached on.
+    'output_mode': 'video',
+    # Instrumental encoding in lyrics mode, see video_creator.AUDIO_CODECS.
+    'audio_codec': 'aac',
+}
+
+# Bump when the voice detection changes, so cached trims are not reused.
+VAD_VERSION = 2
+
+# Bump when line breaking or the .ass output changes, for the same reason.
+LINES_VERSION = 2
+
+# How many of the latest transcribed words are shown while streaming.
+LYRICS_PREVIEW_WORDS = 12
+
+# The 'model' label of the stage metrics for stages that don't run an ML model.
+FFMPEG_STAGES = {'preview', 'video', 'audio'}
+
+def _noop_report(stage, status, progress=0.0, **details):
+    pass
+
+def stage_keys(audio_hash, options):
+    """
+    Builds the cache key of every stage. Each key chains the key of the
+    stage before it with the parameters that affect the stage's output, so
+    changing e.g. the words per line only invalidates subtitles and video.
+
+    Args:
+        audio_hash (str): The content hash of the input audio.
+        options (dict): The request options, see DEFAULT_OPTIONS.
+
+    Returns:
+        dict: Stage name -> cache key.
+    """
+    background = options['background_video_path']
+    # Renders use the normalized background, so its format version is part of the key too.
+    background_hash = (
+        cache_key(backgrounds.content_hash(background), ASSET_VERSION)
+        if background and os.path.exists(background) else None
+    )
+
+    keys = {}
+    if options['separation_chunk_seconds']:
+        keys['separation'] = cache_key(
+            'separation', audio_hash, SEPARATOR_MODEL, options['separation_chunk_seconds'], CHUNK_OVERLAP_SECONDS
+        )
+    else:
+        keys['separation'] = cache_key('separation', audio_hash, SEPARATOR_MODEL)
+    keys['vad'] = cache_key('vad', keys['separation'], VAD_VERSION, options['trim_silence'])
+    vocals_key = keys['vad']
+    if options['batch_transcription']:
+        keys['transcription'] = cache_key(
+            'transcription', vocals_key, options['whisper_model'], options['language'], 'batched'
+        )
+    else:
+        keys['transcription'] = cache_key(
+            'transcription', vocals_key,
+            options['whisper_model'], options['language'], options['stream_transcription']
+        )
+    keys['diarization'] = cache_key('diarization', vocals_key, DIARIZATION_MODEL)
+    keys['speakers'] = cache_key('speakers', keys['transcription'], keys['diarization'])
+    keys['subtitles'] = cache_key(
+        'subtitles', keys['speakers'], LINES_VERSION, options['words_per_line'], options['style']
+    )
+    keys['preview'] = cache_key('preview', keys['subtitles'], background_hash)
+    keys['video'] = cache_key('video', keys['subtitles'], background_hash)
+    keys['lyrics'] = cache_key('lyrics', keys['speakers'], LINES_VERSION, options['words_per_line'])
+    keys['audio'] = cache_key('audio', keys['separation'], options['audio_codec'])
+    return keys
+
+def run_pipeline(input_audio_path, request_id, output_dir, work_dir, options=None, report=None, cache=None,
+                 transcriber=None, checkpoints=None):
+    """
+    Runs the full karaoke pipeline for a single uploaded song.
+
+    The stages form a small dependency graph (see STAGE_INPUTS); every stage
+    starts as soon as its inputs are ready, so transcription and diarization
+    run at the same time on the separated vocal track.
+
+    With a cache, stage outputs are looked up by content hash first, starting
+    from the final video and working backwards, so a repeat upload only runs
+    the stages whose outputs are missing.
+
+    With checkpoints, every completed stage is also saved under the request
+    ID, and a request that ran before (a retry, or a job cut short by a
+    restart) resumes from the stages it already completed, whether or not
+    the cache still has them.
+
+    Videos are published atomically: a preview first (if enabled), then the
+    full-quality video. Each is reported with a 'published' detail holding
+    its file name in output_dir as soon as it can be served. In the 'lyrics'
+    output mode, a timed-lyrics .json and the encoded instrumental are
+    published instead and no video is rendered.
+
+    Args:
+        input_audio_path (str): The path to the uploaded audio file.
+        request_id (str): The unique ID for this processing request.
+        output_dir (str): The directory the final video is written to.
+        work_dir (str): The directory for intermediate files (stems, subtitles).
+        options (dict, optional): Request options overriding DEFAULT_OPTIONS.
+        report (callable, optional): Called as report(stage, status, progress, **details)
+                                     whenever a stage starts, makes progress or
+                                     finishes. status is 'running', 'done',
+                                     'cached', 'resumed', 'skipped' or 'failed'. Must be
+                                     thread-safe, stages report while running.
+                                     details can carry e.g. 'lyrics_preview'
+                                     or 'bytes_written' (output files so far).
+        cache (ResultCache, optional): The stage output cache to use.
+        transcriber (BatchTranscriberClient, optional): Sends transcription
+                                     windows to the shared batching service
+                                     instead of running Whisper in this process.
+        checkpoints (CheckpointStore, optional): Per-request stage checkpoints
+                                     to resume from and save to.
+
+    Returns:
+        str: The path to the generated video file (the lyrics file in 'lyrics' mode).
+
+    Raises:
+        RuntimeError: If any of the stages fails.
+    """
+    report = report or _noop_report
+    options = {**DEFAULT_OPTIONS, **(options or {})}
+    options['batch_transcription'] = transcriber is not None and transcriber.serves(options['whisper_model'])
+    job_dir = os.path.join(work_dir, request_id)
+    os.makedirs(job_dir, exist_ok=True)
+    if options['output_mode'] not in OUTPUT_TARGETS:
+        raise RuntimeError(f"Unknown output mode: {options['output_mode']}")
+    targets = OUTPUT_TARGETS[options['output_mode']]
+    audio_extension = AUDIO_CODECS[options['audio_codec']][1]
+    published_paths = {
+        stage: os.path.join(output_dir, name.format(request_id=request_id, audio_extension=audio_extension))
+        for stage, name in PUBLISHED_STAGES.items()
+    }
+    keys = stage_keys(file_sha256(input_audio_path), options) if cache else {}
+
+    # The song's duration, for the stages' real-time factors.
+    try:
+        audio_seconds = get_media_duration(input_audio_path)
+    except Exception as e:
+        print(f"Could not read the duration of {input_audio_path}: {e}")
+        audio_seconds = None
+    stage_models = {
+        'separation': SEPARATOR_MODEL,
+        'transcription': options['whisper_model'],
+        'diarization': DIARIZATION_MODEL,
+        **{stage: 'ffmpeg' for stage in FFMPEG_STAGES},
+    }
+
+    # Stage name -> {'files': {name: path}, 'data': ...}
+    outputs = {}
+    # Stage name -> the threads the scheduler granted it (None: not limited).
+    stage_threads = {}
+
+    def run_separation():
+        # 1. --- Audio Separation (Vocals & Instrumental) ---
+        if options['separation_chunk_seconds']:
+            # No more chunk processes than the threads the scheduler granted.
+            workers = options['separation_workers']
+            if stage_threads.get('separation'):
+                workers = min(workers, stage_threads['separation'])
+            instrumental_track_path, vocal_track_path = separate_audio_chunked(
+                input_audio_path, job_dir,
+                chunk_seconds=options['separation_chunk_seconds'],
+                workers=workers
+            )
+        else:
+            instrumental_track_path, vocal_track_path = separate_audio(input_audio_path, job_dir)
+        if not instrumental_track_path or not vocal_track_path:
+            raise RuntimeError("Audio separation failed.")
+        return {'files': {'instrumental': instrumental_track_path, 'vocals': vocal_track_path}}
+
+    def run_vad():
+        # 1b. --- 16 kHz mono vocals for both models, without the instrumental-only stretches ---
+        model_vocals_path, regions = trim_silence(
+            outputs['separation']['files']['vocals'], os.path.join(job_dir, 'vocals_16k.wav'),
+            trim=options['trim_silence']
+        )
+        if not model_vocals_path:
+            raise RuntimeError("Vocal track preparation failed.")
+        return {'files': {'vocals': model_vocals_path}, 'data': {'regions': regions}}
+
+    def vocals_for_models():
+        # The model vocals and, if trimmed, the map back to song time.
+        offset_map = OffsetMap(outputs['vad']['data']['regions']) if options['trim_silence'] else None
+        return outputs['vad']['files']['vocals'], offset_map
+
+    def run_transcription():
+        # 2. --- Transcription (Word-level Timestamps) ---
+        vocal_track_path, offset_map = vocals_for_models()
+        if options['batch_transcription'] or options['stream_transcription']:
+            transcription_data = []
+
+            def on_progress(fraction):
+                preview = " ".join(word['text'] for word in transcription_data[-LYRICS_PREVIEW_WORDS:])
+                report('transcription', 'running', fraction, lyrics_preview=preview)
+
+            if options['batch_transcription']:
+                words = transcriber.transcribe(
+                    vocal_track_path, language=options['language'], progress=on_progress
+                )
+            else:
+                words = transcribe_vocals_streaming(
+                    vocal_track_path,
+                    model_name=options['whisper_model'],
+                    language=options['language'],
+                    progress=on_progress
+                )
+            try:
+                for word in words:
+                    transcription_data.append(word)
+            except Exception as e:
+                raise RuntimeError(f"Transcription failed: {e}")
+        else:
+            transcription_data = transcribe_vocals(
+                vocal_track_path,
+                model_name=options['whisper_model'],
+                language=options['language']
+            )
+        if not transcription_data:
+            raise RuntimeError("Transcription produced no words.")
+        if offset_map:
+            transcription_data = offset_map.map_intervals(transcription_data, within_region=True)
+        return {'data': transcription_data}
+
+    def run_diarization():
+        # 3. --- Speaker Diarization (in parallel with the transcription) ---
+        # A failed diarization does not fail the job; the words just get no
+        # speaker. Such results are not cached so a later run can retry.
+        vocal_track_path, offset_map = vocals_for_models()
+        try:
+            turns = diarize(vocal_track_path)
+        except Exception as e:
+            print(f"Error during speaker diarization: {e}")
+            return {'data': {'turns': None, 'missing_label': 'ERROR'}, 'uncached': True}
+        if turns is None:
+            return {'data': {'turns': None, 'missing_label': 'UNKNOWN'}, 'uncached': True}
+        if offset_map:
+            turns = offset_map.map_intervals(turns)
+        return {'data': {'turns': turns}}
+
+    def run_speakers():
+        # 4. --- Map words to speakers (joins transcription and diarization) ---
+        diarization = outputs['diarization']['data']
+        words = [dict(word) for word in outputs['transcription']['data']]
+        return {'data': assign_speakers(words, diarization['turns'], diarization.get('missing_label', 'UNKNOWN'))}
+
+    def run_subtitles():
+        # 5. --- Generate .ass Subtitle File ---
+        ass_subtitle_path = generate_ass_file(
+            outputs['speakers']['data'], job_dir, request_id,
+            words_per_line=options['words_per_line'],
+            style=options['style']
+        )
+        if not ass_subtitle_path:
+            raise RuntimeError("Subtitle generation failed.")
+        return {'files': {'subtitles': ass_subtitle_path}}
+
+    def write_and_publish(stage, write):
+        # Write to a temporary name next to the final file, then swap it in,
+        # so the URL never serves a half-written file.
+        final_path = published_paths[stage]
+        name, extension = os.path.splitext(os.path.basename(final_path))
+        partial_path = os.path.join(output_dir, f".{name}.part{extension}")
+        if not write(partial_path):
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise RuntimeError(f"{stage.capitalize()} creation failed.")
+        os.replace(partial_path, final_path)
+        return {'files': {stage: final_path}}
+
+    def render_and_publish(stage, render, **kwargs):
+        # The background transcoded once to this render's size and frame rate
+        # (see processing/background_assets.py), or the original if that fails.
+        background = options['background_video_path']
+        normalized_background = backgrounds.get(background, stage) if background else None
+        return write_and_publish(stage, lambda partial_path: render(
+            outputs['separation']['files']['instrumental'],
+            outputs['subtitles']['files']['subtitles'],
+            partial_path,
+            background_video_path=normalized_background or background,
+            background_normalized=normalized_background is not None,
+            threads=stage_threads.get(stage),
+            **kwargs
+        ))
+
+    def run_preview():
+        # 6. --- Fast low-resolution preview ---
+        return render_and_publish('preview', create_preview)
+
+    def run_video():
+        # 7. --- Burn Subtitles into Video using FFmpeg ---
+        return render_and_publish('video', create_video, render_workers=options['render_workers'])
+
+    def run_lyrics():
+        # 6. (lyrics mode) --- Timed lyrics for in-browser highlighting ---
+        lyrics_file_path = generate_lyrics_file(
+            outputs['speakers']['data'], job_dir, request_id,
+            words_per_line=options['words_per_line']
+        )
+        if not lyrics_file_path:
+            raise RuntimeError("Lyrics generation failed.")
+        return {'files': {'lyrics': lyrics_file_path}}
+
+    def run_audio():
+        # 7. (lyrics mode) --- Encode the instrumental once for the browser ---
+        return write_and_publish('audio', lambda partial_path: transcode_audio(
+            outputs['separation']['files']['instrumental'], partial_path, codec=options['audio_codec'],
+            threads=stage_threads.get('audio')
+        ))
+
+    runners = {
+        'separation': run_separation,
+        'vad': run_vad,
+        'transcription': run_transcription,
+        'diarization': run_diarization,
+        'speakers': run_speakers,
+        'subtitles': run_subtitles,
+        'preview': run_preview,
+        'video': run_video,
+        'lyrics': run_lyrics,
+        'audio': run_audio,
+    }
+
+    def run_timed(stage):
+        # Waits for a CPU slot (see processing/scheduler.py), then records wall/CPU
+        # time, peak memory and real-time factor of the stage, see processing/metrics.py.
+        # Batched transcription runs in the shared service, this stage only waits for it.
+        scheduled = None if stage == 'transcription' and options['batch_transcription'] else stage
+        with scheduler.slot(scheduled, audio_seconds=audio_seconds, job_id=request_id) as threads:
+            stage_threads[stage] = threads
+            with stage_timer(stage, model=stage_models.get(stage, ''), audio_seconds=audio_seconds, job_id=request_id):
+                return runners[stage]()
+
+    def inputs_of(stage):
+        if stage == 'video' and not options['preview']:
+            return [input_stage for input_stage in STAGE_INPUTS[stage] if input_stage != 'preview']
+        return STAGE_INPUTS[stage]
+
+    def publish(stage):
+        # Makes a (possibly cached) output available under this request's name.
+        if stage in PUBLISHED_STAGES:
+            link_or_copy(outputs[stage]['files'][stage], published_paths[stage])
+            return {'published': os.path.basename(published_paths[stage])}
+        return {}
+
+    # --- Plan: find the stages that have to run ---
+    # Working backwards from the final outputs, a cached stage output means
+    # none of the stages before it are needed.
+    pending = set()
+
+    def plan(stage):
+        if stage in outputs or stage in pending:
+            return
+        entry = checkpoints.load(request_id, stage) if checkpoints else None
+        if entry is not None:
+            outputs[stage] = entry
+            report(stage, 'resumed', 1.0, **publish(stage))
+            return
+        entry = cache.get(stage, keys[stage]) if cache and stage not in UNCACHED_STAGES else None
+        if entry is not None:
+            outputs[stage] = entry
+            report(stage, 'cached', 1.0, **publish(stage))
+            return
+        pending.add(stage)
+        for input_stage in inputs_of(stage):
+            plan(input_stage)
+
+    for target in targets:
+        plan(target)
+
+    # --- Run: start every stage as soon as its inputs are ready ---
+    # Size of the files the stages wrote, reported as 'bytes_written'.
+    bytes_written = 0
+    with ThreadPoolExecutor(max_workers=MAX_PARALLEL_STAGES) as executor:
+        running = {}
+        while pending or running:
+            for stage in STAGES:
+                if stage in pending and all(input_stage in outputs for input_stage in inputs_of(stage)):
+                    pending.remove(stage)
+                    report(stage, 'running')
+                    running[executor.submit(run_timed, stage)] = stage
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage = running.pop(future)
+                try:
+                    entry = future.result()
+                except Exception:
+                    report(stage, 'failed')
+                    for other_future in running:
+                        other_future.cancel()
+                    raise
+                stage_bytes = sum(os.path.getsize(path) for path in (entry.get('files') or {}).values())
+                bytes_written += stage_bytes
+                print(f"  -> Stage '{stage}' wrote {stage_bytes / 1024**2:.1f} MB")
+                if cache and stage not in UNCACHED_STAGES and not entry.get('uncached'):
+                    # Intermediate files move into the cache; published outputs stay in place.
+                    entry = cache.put(
+                        stage, keys[stage], files=entry.get('files'), data=entry.get('data'),
+                        move=stage not in PUBLISHED_STAGES
+                    )
+                if checkpoints and not entry.get('uncached'):
+                    checkpoints.save(request_id, stage, entry)
+                outputs[stage] = entry
+                report(stage, 'done', 1.0, bytes_written=bytes_written, **publish(stage))
+
+    # Stages whose outputs were not needed because a later stage was cached.
+    for stage in STAGES:
+        if stage not in outputs:
+            report(stage, 'skipped', 1.0)
+
+    return published_paths[targets[0]]
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+
+ENTRY_FILE = 'entry.json'
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """Returns the hex SHA-256 digest of a file's contents, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def cache_key(*parts):
+    """Builds a cache key from any JSON-serializable parts (hashes, model names, options)."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+class ResultCache:
+    """
+    A content-addressed, on-disk cache for pipeline stage outputs.
+
+    Each entry is a directory holding the stage's output files plus an
+    entry.json with its JSON data. Entries are written to a temporary
+    directory and renamed into place, so worker processes can share the
+    cache safely. When the cache grows past max_bytes, the least recently
+    used entries are evicted.
+
+    Hit/miss counters are kept in `counters`, which can be a Manager dict
+    (with a matching Manager lock) to aggregate them across processes.
+    """
+
+    def __init__(self, root, max_bytes=10 * 1024**3, min_age_seconds=600, counters=None, counters_lock=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        # Entries used more recently than this are never evicted, since a
+        # running job may still be reading from them.
+        self.min_age_seconds = min_age_seconds
+        self.counters = counters if counters is not None else {}
+        self.counters_lock = counters_lock
+        os.makedirs(root, exist_ok=True)
+
+    def _entry_dir(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def _count(self, stage, outcome):
+        name = f"{stage}_{outcome}"
+        if self.counters_lock is not None:
+            with self.counters_lock:
+                self.counters[name] = self.counters.get(name, 0) + 1
+        else:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def get(self, stage, key):
+        """
+        Looks up a stage output.
+
+        Returns:
+            dict: {'files': {name: path}, 'data': ...} if the entry exists, else None.
+        """
+        entry_dir = self._entry_dir(key)
+        try:
+            with open(os.path.join(entry_dir, ENTRY_FILE), encoding='utf-8') as f:
+                entry = json.load(f)
+            files = {name: os.path.join(entry_dir, filename) for name, filename in entry['files'].items()}
+            if not all(os.path.exists(path) for path in files.values()):
+                raise FileNotFoundError(entry_dir)
+            # Touch the entry so the LRU eviction sees it as recently used.
+            os.utime(os.path.join(entry_dir, ENTRY_FILE))
+        except (OSError, ValueError, KeyError):
+            self._count(stage, 'misses')
+            return None
+        self._count(stage, 'hits')
+        return {'files': files, 'data': entry.get('data')}
+
+    def put(self, stage, key, files=None, data=None, move=False):
+        """
+        Stores a stage output.
+
+        Args:
+            stage (str): The pipeline stage the output belongs to.
+            key (str): The cache key, see cache_key().
+            files (dict, optional): Logical name -> path of the output files.
+            data (optional): JSON-serializable data to store with the entry.
+            move (bool): Move the files into the cache instead of copying them.
+
+        Returns:
+            dict: The stored entry, in the same shape as get() returns.
+        """
+        files = files or {}
+        entry_dir = self._entry_dir(key)
+        tmp_dir = os.path.join(self.root, f".tmp-{uuid.uuid4().hex}")
+        os.makedirs(tmp_dir)
+        try:
+            stored = {}
+            for name, path in files.items():
+                filename = name + os.path.splitext(path)[1]
+                target = os.path.join(tmp_dir, filename)
+                if move:
+                    shutil.move(path, target)
+                else:
+                    link_or_copy(path, target)
+                stored[name] = filename
+            with open(os.path.join(tmp_dir, ENTRY_FILE), 'w', encoding='utf-8') as f:
+                json.dump({'stage': stage, 'files': stored, 'data': data, 'created_at': time.time()}, f)
+
+            os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+            try:
+                os.rename(tmp_dir, entry_dir)
+            except OSError:
+                if os.path.exists(os.path.join(entry_dir, ENTRY_FILE)):
+                    # Another worker stored the same entry first; keep theirs.
+                    shutil.rmtree(tmp_dir, ignore_errors=True)
+                else:
+                    # A broken leftover entry; replace it.
+                    shutil.rmtree(entry_dir, ignore_errors=True)
+                    os.rename(tmp_dir, entry_dir)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        self.evict()
+        return {
+            'files': {name: os.path.join(entry_dir, filename) for name, filename in stored.items()},
+            'data': data,
+        }
+
+    def _entries(self):
+        """Yields (last_used, size, entry_dir) for every entry in the cache."""
+        for prefix in os.listdir(self.root):
+            prefix_dir = os.path.join(self.root, prefix)
+            if prefix.startswith('.') or not os.path.isdir(prefix_dir):
+                continue
+            for key in os.listdir(prefix_dir):
+                entry_dir = os.path.join(prefix_dir, key)
+                try:
+                    last_used = os.path.getmtime(os.path.join(entry_dir, ENTRY_FILE))
+                    size = sum(entry.stat().st_size for entry in os.scandir(entry_dir))
+                except OSError:
+                    continue
+                yield last_used, size, entry_dir
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits in max_bytes."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        now = time.time()
+        for last_used, size, entry_dir in entries:
+            if total <= self.max_bytes:
+                break
+            if now - last_used < self.min_age_seconds:
+                continue
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+        return total
+
+    def stats(self):
+        """Returns the hit/miss counters and the current size of the cache."""
+        entries = list(self._entries())
+        return {
+            'entries': len(entries),
+            'size_bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self.max_bytes,
+            'counters': dict(self.counters),
+        }
+
+def link_or_copy(source, target):
+    """Hard links source to target (no extra space), copying across filesystems."""
+    if os.path.exists(target):
+        if os.path.samefile(source, target):
+            return
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
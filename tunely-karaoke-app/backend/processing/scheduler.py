@@ -0,0 +1,241 @@
+import itertools
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from processing.metrics import log_event, metrics
+
+# The pipeline stages that compete for the CPU, by the kind of work they
+# do. Stages not listed here (VAD, subtitles, lyrics) are cheap and never wait.
+STAGE_KINDS = {
+    'separation': 'separation',
+    'transcription': 'transcription',
+    'diarization': 'diarization',
+    'preview': 'render',
+    'video': 'render',
+    'audio': 'render',
+}
+
+# Kinds whose models run on torch, which sizes its thread pool per process.
+TORCH_KINDS = {'transcription', 'diarization', 'separation'}
+
+# Priority lanes, most urgent first. Preview renders let a user start
+# playing, and short tracks finish quickly, so both go ahead of the rest.
+LANES = {'preview': 0, 'short': 1, 'normal': 2}
+
+# Tracks up to this long get the 'short' lane.
+SHORT_TRACK_SECONDS = 240.0
+
+# How long a waiting stage sleeps between checks when nobody wakes it up,
+# e.g. after a worker holding a slot died.
+WAIT_POLL_SECONDS = 5.0
+
+def default_budgets(cores):
+    """
+    The default slots (stages of a kind running at once) and threads per
+    slot for a machine with the given number of cores.
+
+    Returns:
+        dict: Stage kind -> {'slots': int, 'threads': int}.
+    """
+    return {
+        'separation': {'slots': max(1, cores // 4), 'threads': min(cores, 4)},
+        'transcription': {'slots': max(1, cores // 4), 'threads': min(cores, 4)},
+        'diarization': {'slots': max(1, cores // 4), 'threads': min(cores, 2)},
+        # libx264 scales well to a few threads; more renders at once beat one wide one.
+        'render': {'slots': max(1, cores // 2), 'threads': min(cores, 2)},
+    }
+
+def parse_budgets(text, cores):
+    """
+    Reads budget overrides like 'separation=1x4,render=3x2' (slots x threads)
+    on top of default_budgets(cores).
+
+    Raises:
+        ValueError: If an entry is malformed or names an unknown kind.
+    """
+    budgets = default_budgets(cores)
+    for entry in filter(None, (part.strip() for part in (text or '').split(','))):
+        kind, _, budget = entry.partition('=')
+        slots, _, threads = budget.partition('x')
+        if kind not in budgets:
+            raise ValueError(f"Unknown stage kind '{kind}' in the stage budgets")
+        budgets[kind] = {'slots': max(1, int(slots)), 'threads': max(1, int(threads or budgets[kind]['threads']))}
+    return budgets
+
+def stage_lane(stage, audio_seconds=None, short_track_seconds=SHORT_TRACK_SECONDS):
+    """Returns the priority lane (a key of LANES) of a stage of a job."""
+    if stage == 'preview':
+        return 'preview'
+    if audio_seconds and audio_seconds <= short_track_seconds:
+        return 'short'
+    return 'normal'
+
+def limit_torch_threads(threads):
+    """Sizes torch's CPU thread pool, if this process has loaded torch at all."""
+    torch = sys.modules.get('torch')
+    if torch is None:
+        return
+    try:
+        if torch.get_num_threads() != threads:
+            torch.set_num_threads(threads)
+    except Exception as e:
+        print(f"Could not set the torch thread count: {e}")
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+class StageScheduler:
+    """
+    Admission control for the CPU-heavy pipeline stages of all jobs.
+
+    Every stage kind (see STAGE_KINDS) has a number of slots and a thread
+    count per slot, and all running stages together hold at most `cores`
+    threads. A stage waits until its kind has a free slot and enough cores
+    are free, then runs with its kind's thread count: torch and FFmpeg are
+    sized to it, so a burst of jobs queues up instead of oversubscribing
+    the machine.
+
+    Waiting stages are served by lane (see LANES), then in arrival order. A
+    stage also waits while a more urgent one of another kind is only
+    short of cores, so small stages can't starve a larger one.
+
+    The state lives in `state` and is guarded by `condition`. These can be a
+    Manager dict and Condition (see job_queue), so that the stages of all
+    worker processes share one budget. Without budgets, stages never wait.
+    """
+
+    def __init__(self, budgets=None, cores=None, state=None, condition=None,
+                 short_track_seconds=SHORT_TRACK_SECONDS):
+        self.attach(budgets, cores, state, condition, short_track_seconds)
+
+    def attach(self, budgets, cores, state=None, condition=None, short_track_seconds=SHORT_TRACK_SECONDS):
+        """Uses shared budgets and state from now on, see job_queue._init_worker."""
+        self.budgets = budgets
+        self.cores = cores or os.cpu_count() or 1
+        self.state = state if state is not None else {}
+        self.condition = condition if condition is not None else threading.Condition()
+        self.short_track_seconds = short_track_seconds
+        self._sequence = itertools.count()
+
+    def _read(self):
+        # Manager dicts hand out copies, so the state is read and written back whole.
+        return self.state.get('scheduler') or {'running': {}, 'waiting': []}
+
+    def _write(self, scheduler_state):
+        self.state['scheduler'] = scheduler_state
+
+    def _threads(self, kind):
+        return min(self.budgets[kind]['threads'], self.cores)
+
+    def _can_start(self, ticket, scheduler_state):
+        kind = ticket['kind']
+        running = scheduler_state['running']
+
+        def has_slot(some_kind):
+            used = sum(1 for holder in running.values() if holder['kind'] == some_kind)
+            return used < self.budgets[some_kind]['slots']
+
+        cores_free = self.cores - sum(holder['threads'] for holder in running.values())
+        if not has_slot(kind) or cores_free < ticket['threads']:
+            return False
+        for other in scheduler_state['waiting']:
+            if other['rank'] < ticket['rank'] and (other['kind'] == kind or has_slot(other['kind'])):
+                return False
+        return True
+
+    def _drop_dead(self, scheduler_state):
+        # Slots and places in line of worker processes that died would
+        # otherwise be held forever.
+        scheduler_state['running'] = {
+            ticket_id: holder for ticket_id, holder in scheduler_state['running'].items()
+            if _process_alive(holder['pid'])
+        }
+        scheduler_state['waiting'] = [ticket for ticket in scheduler_state['waiting'] if _process_alive(ticket['pid'])]
+
+    @contextmanager
+    def slot(self, stage, audio_seconds=None, job_id=None):
+        """
+        Waits for a slot to run a stage in and holds it for the block.
+
+        Args:
+            stage (str): The pipeline stage.
+            audio_seconds (float, optional): The track's duration, for its lane.
+            job_id (str, optional): The job, for the log line.
+
+        Yields:
+            int: The threads the stage may use, or None if it isn't limited.
+        """
+        kind = STAGE_KINDS.get(stage)
+        if not self.budgets or kind not in self.budgets:
+            yield None
+            return
+
+        lane = stage_lane(stage, audio_seconds, self.short_track_seconds)
+        ticket = {
+            'id': uuid.uuid4().hex,
+            'kind': kind,
+            'threads': self._threads(kind),
+            'pid': os.getpid(),
+            # Lane first, then arrival; the counter orders tickets taken in the same instant.
+            'rank': [LANES[lane], time.time(), next(self._sequence)],
+        }
+        start = time.perf_counter()
+        with self.condition:
+            scheduler_state = self._read()
+            scheduler_state['waiting'].append(ticket)
+            self._write(scheduler_state)
+            while True:
+                scheduler_state = self._read()
+                if self._can_start(ticket, scheduler_state):
+                    break
+                if not self.condition.wait(WAIT_POLL_SECONDS):
+                    self._drop_dead(scheduler_state)
+                    self._write(scheduler_state)
+            scheduler_state['waiting'] = [other for other in scheduler_state['waiting'] if other['id'] != ticket['id']]
+            scheduler_state['running'][ticket['id']] = {'kind': kind, 'threads': ticket['threads'], 'pid': ticket['pid']}
+            self._write(scheduler_state)
+
+        wait_seconds = time.perf_counter() - start
+        metrics.observe('tunely_stage_wait_seconds', wait_seconds, stage=stage, lane=lane)
+        log_event('stage_admitted', stage=stage, lane=lane, threads=ticket['threads'],
+                  wait_seconds=round(wait_seconds, 3), job_id=job_id)
+        if kind in TORCH_KINDS:
+            # torch has one pool per process, so with transcription and
+            # diarization of one job running side by side, the last one wins.
+            limit_torch_threads(ticket['threads'])
+        try:
+            yield ticket['threads']
+        finally:
+            with self.condition:
+                scheduler_state = self._read()
+                scheduler_state['running'].pop(ticket['id'], None)
+                self._write(scheduler_state)
+                self.condition.notify_all()
+
+    def stats(self):
+        """Returns the budgets and how many stages of each kind are running and waiting."""
+        scheduler_state = self._read()
+        kinds = sorted(self.budgets or {})
+        return {
+            'cores': self.cores,
+            'cores_in_use': sum(holder['threads'] for holder in scheduler_state['running'].values()),
+            'budgets': self.budgets or {},
+            'running': {
+                kind: sum(1 for holder in scheduler_state['running'].values() if holder['kind'] == kind)
+                for kind in kinds
+            },
+            'waiting': {kind: sum(1 for ticket in scheduler_state['waiting'] if ticket['kind'] == kind) for kind in kinds},
+        }
+
+# The process-wide scheduler, attached to shared budgets in worker processes.
+scheduler = StageScheduler()
@@ -1,61 +1,208 @@
 import os
+import numpy as np
 from pyannote.audio import Pipeline
 import torch
+from processing.audio_io import open_wav, to_float32
+from processing.model_registry import registry
 
 # --- IMPORTANT ---
 # Replace "YOUR_HUGGING_FACE_TOKEN" with your actual token.
 # It's better to load this from an environment variable in a real application.
 HF_TOKEN = "YOUR_HUGGING_FACE_TOKEN" 
 
-def detect_speakers(vocal_track_path, transcription_data):
+DIARIZATION_MODEL = "pyannote/speaker-diarization-3.1"
+
+def _load_diarization_pipeline():
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    return Pipeline.from_pretrained(
+        DIARIZATION_MODEL,
+        use_auth_token=HF_TOKEN
+    ).to(torch.device(device))
+
+registry.register('diarization', _load_diarization_pipeline, exclusive=True)
+
+def hf_token_is_set():
+    return bool(HF_TOKEN) and "hf_bNYQyDkKFVeyThAqbqNLsUCTnSxMqOEWovTOKEN" not in HF_TOKEN
+
+def diarize(vocal_track_path):
     """
-    Detects different speakers in a vocal track and assigns a speaker ID to each word.
+    Runs speaker diarization on a vocal track. Only needs the audio, so it
+    can run at the same time as the transcription.
 
     Args:
         vocal_track_path (str): The path to the vocal audio file.
-        transcription_data (list): The list of word timestamp dictionaries from the transcriber.
 
     Returns:
-        list: The updated transcription_data list, with each word dictionary now
-              containing a 'speaker' key (e.g., 'SPEAKER_00', 'SPEAKER_01').
+        list: The speaker turns as dictionaries, sorted by start time:
+              {'start': 1.0, 'end': 4.2, 'speaker': 'SPEAKER_00'}
+              Returns None if the Hugging Face token is not set.
+
+    Raises:
+        Exception: Whatever the diarization pipeline raises.
     """
     print(f"Starting speaker diarization for: {vocal_track_path}")
-    
-    if not HF_TOKEN or "hf_bNYQyDkKFVeyThAqbqNLsUCTnSxMqOEWovTOKEN" in HF_TOKEN:
+
+    if not hf_token_is_set():
         print("ERROR: Hugging Face token is not set. Please add your token to speaker_diarizer.py")
-        # Add speaker 'UNKNOWN' to all words and return
-        for word in transcription_data:
-            word['speaker'] = 'UNKNOWN'
-        return transcription_data
+        return None
 
+    # Hand pyannote the samples of a WAV directly (the pipeline's 16 kHz
+    # vocal track), so it doesn't decode the file a second time.
     try:
-        # 1. --- Load the pre-trained diarization pipeline ---
-        print("  -> Loading speaker diarization pipeline...")
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        pipeline = Pipeline.from_pretrained(
-            "pyannote/speaker-diarization-3.1",
-            use_auth_token=HF_TOKEN
-        ).to(torch.device(device))
-
-        # 2. --- Apply the pipeline to the audio file ---
+        samples, sample_rate = open_wav(vocal_track_path)
+        audio = {
+            'waveform': torch.from_numpy(to_float32(np.asarray(samples)).T.copy()),
+            'sample_rate': sample_rate,
+        }
+    except ValueError:
+        audio = vocal_track_path
+
+    # The pre-trained diarization pipeline is loaded once per worker by the
+    # model registry and reused.
+    with registry.acquire('diarization') as pipeline:
         print("  -> Applying pipeline to audio...")
-        diarization = pipeline(vocal_track_path)
+        diarization = pipeline(audio)
+
+    turns = [
+        {'start': turn.start, 'end': turn.end, 'speaker': speaker}
+        for turn, _, speaker in diarization.itertracks(yield_label=True)
+    ]
+    turns.sort(key=lambda turn: turn['start'])
+    print(f"Speaker diarization complete. Found {len(turns)} speaker turns.")
+    return turns
+
+def build_turn_index(turns):
+    """
+    Turns the speaker turns into sorted NumPy arrays for fast lookups.
+
+    Args:
+        turns (list): The speaker turns from diarize().
+
+    Returns:
+        dict: 'starts', 'ends' and 'labels' arrays sorted by start time, plus
+              'reach' (the latest end of any turn up to each index), so a
+              lookup also finds an earlier, longer turn that overlaps later ones.
+    """
+    starts = np.array([turn['start'] for turn in turns], dtype=np.float64)
+    order = np.argsort(starts, kind='stable')
+    starts = starts[order]
+    ends = np.array([turn['end'] for turn in turns], dtype=np.float64)[order]
+    labels = np.array([turn['speaker'] for turn in turns], dtype=object)[order]
+
+    reach = np.maximum.accumulate(ends)
+    return {'starts': starts, 'ends': ends, 'labels': labels, 'reach': reach}
+
+def lookup_speakers(index, word_starts, word_ends):
+    """
+    Finds the speaker for many words at once with a single searchsorted pass.
+
+    A word goes to the earliest-starting turn active at its center, as the
+    old per-word scan did. Words that fall between turns go to the turn they
+    overlap the most, or to the nearest one if they overlap none. Ties go to
+    the turn closer to the word's center, then to the earlier turn.
+
+    Args:
+        index (dict): The turn index from build_turn_index(). Must not be empty.
+        word_starts (np.ndarray): The word start times.
+        word_ends (np.ndarray): The word end times.
+
+    Returns:
+        np.ndarray: The speaker label of every word.
+    """
+    starts, ends, reach = index['starts'], index['ends'], index['reach']
+    centers = (word_starts + word_ends) / 2
 
-        # 3. --- Map words to speakers ---
-        print("  -> Mapping words to speakers...")
+    # The last turn starting at or before each word's center (-1 if none).
+    last = np.searchsorted(starts, centers, side='right') - 1
+    # The first turn still running at each word's center: reach only grows,
+    # so it is the first index whose reach passes the center.
+    first_running = np.searchsorted(reach, centers, side='right')
+    chosen = first_running.copy()
+    between = np.flatnonzero(first_running > last)
+    if not len(between):
+        return index['labels'][chosen]
+
+    # --- Words between turns: the nearest previous and next turn ---
+    b_starts, b_ends, b_centers, b_last = word_starts[between], word_ends[between], centers[between], last[between]
+    has_prev = b_last >= 0
+    prev_reach = reach[np.maximum(b_last, 0)]
+    prev_turn = np.searchsorted(reach, prev_reach, side='left')
+    has_next = b_last + 1 < len(starts)
+    next_turn = np.minimum(b_last + 1, len(starts) - 1)
+    gap_prev = np.where(has_prev, b_centers - prev_reach, np.inf)
+    gap_next = np.where(has_next, starts[next_turn] - b_centers, np.inf)
+    nearest = np.where(gap_next < gap_prev, next_turn, prev_turn)
+
+    # --- Turns that overlap each word: those starting before it ends,
+    # from the first one whose reach passes its start ---
+    lo = np.searchsorted(reach, b_starts, side='right')
+    hi = np.searchsorted(starts, b_ends, side='left')
+    counts = np.clip(hi - lo, 0, None)
+    owner = np.repeat(np.arange(len(between)), counts)
+    candidate = np.repeat(lo, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    c_starts, c_ends, c_centers = starts[candidate], ends[candidate], b_centers[owner]
+    overlap = np.clip(np.minimum(b_ends[owner], c_ends) - np.maximum(b_starts[owner], c_starts), 0, None)
+    gap = np.maximum(np.maximum(c_starts - c_centers, c_centers - c_ends), 0)
+
+    # The best candidate of each word comes first within its group.
+    order = np.lexsort((candidate, gap, -overlap, owner))
+    firsts = order[np.r_[True, owner[order][1:] != owner[order][:-1]]] if len(order) else order
+    best = nearest.copy()
+    overlapping = overlap[firsts] > 0
+    best[owner[firsts][overlapping]] = candidate[firsts][overlapping]
+
+    chosen[between] = best
+    return index['labels'][chosen]
+
+def assign_speakers(transcription_data, turns, missing_label='UNKNOWN'):
+    """
+    Assigns a speaker to each word, using the speaker active at the center of
+    the word. Words between turns go to the turn they overlap the most.
+
+    Args:
+        transcription_data (list): The list of word timestamp dictionaries from the transcriber.
+        turns (list): The speaker turns from diarize(), or None if diarization was not available.
+        missing_label (str): The speaker given to every word when turns is None.
+
+    Returns:
+        list: The updated transcription_data list, with each word dictionary now
+              containing a 'speaker' key (e.g., 'SPEAKER_00', 'SPEAKER_01').
+    """
+    if turns is None or not turns:
+        # No diarization, or no speech found at all.
         for word in transcription_data:
-            word_center = word['start'] + (word['end'] - word['start']) / 2
-            
-            # Find which speaker was active at the center of the word's duration
-            try:
-                speaker = diarization.get_labels(word_center)[0]
-                word['speaker'] = speaker
-            except IndexError:
-                # If no speaker is found at that exact moment (e.g., silence)
-                word['speaker'] = 'UNKNOWN'
-        
-        print("Speaker diarization complete.")
+            word['speaker'] = missing_label if turns is None else 'UNKNOWN'
         return transcription_data
+    if not transcription_data:
+        return transcription_data
+
+    print("  -> Mapping words to speakers...")
+    word_starts = np.fromiter((word['start'] for word in transcription_data), dtype=np.float64, count=len(transcription_data))
+    word_ends = np.fromiter((word['end'] for word in transcription_data), dtype=np.float64, count=len(transcription_data))
+    speakers = lookup_speakers(build_turn_index(turns), word_starts, word_ends)
+    for word, speaker in zip(transcription_data, speakers):
+        word['speaker'] = speaker
+    return transcription_data
+
+def detect_speakers(vocal_track_path, transcription_data):
+    """
+    Detects different speakers in a vocal track and assigns a speaker ID to each word.
+
+    Args:
+        vocal_track_path (str): The path to the vocal audio file.
+        transcription_data (list): The list of word timestamp dictionaries from the transcriber.
+
+    Returns:
+        list: The updated transcription_data list, with each word dictionary now
+              containing a 'speaker' key (e.g., 'SPEAKER_00', 'SPEAKER_01').
+    """
+    try:
+        # 1. --- Find the speaker turns ---
+        turns = diarize(vocal_track_path)
+
+        # 2. --- Map words to speakers ---
+        # Without a token every word gets speaker 'UNKNOWN'.
+        return assign_speakers(transcription_data, turns)
 
     except Exception as e:
         print(f"Error during speaker diarization: {e}")
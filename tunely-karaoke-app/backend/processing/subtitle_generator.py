@@ -1,15 +1,144 @@
 import os
-import ass
-from datetime import timedelta
 
-def generate_ass_file(transcription_data, output_dir, request_id):
+# Font settings for the base subtitle style, selectable per request.
+SUBTITLE_STYLES = {
+    'default': {'fontname': 'Arial', 'fontsize': 28, 'margin_v': 20},
+    'large': {'fontname': 'Arial', 'fontsize': 40, 'margin_v': 40},
+    'compact': {'fontname': 'Arial', 'fontsize': 22, 'margin_v': 15},
+}
+DEFAULT_WORDS_PER_LINE = 8
+
+# --- Line breaking ---
+# A new line starts after a pause this long, or when the speaker changes.
+PAUSE_SECONDS = 0.8
+
+# The script's coordinate space (16:9, like the rendered videos); font sizes
+# and margins are in these units.
+PLAY_RES_X = 512
+PLAY_RES_Y = 288
+# Average advance of a glyph as a fraction of the font size, a bit on the
+# wide side for bold Arial, so estimated widths rarely underestimate.
+AVERAGE_CHAR_WIDTH = 0.55
+
+# Diarization labels with a style of their own (a different color).
+SPEAKER_STYLES = {
+    'SPEAKER_00': 'Speaker1',
+    'SPEAKER_01': 'Speaker2',
+    # Add more mappings as needed
+}
+
+def max_line_chars(style='default', margin_h=10):
+    """
+    Returns how many characters of a style fit on one rendered line, so
+    lines don't get wrapped by the renderer in the middle of a phrase.
+    """
+    usable_width = PLAY_RES_X - 2 * margin_h
+    return max(1, int(usable_width / (SUBTITLE_STYLES[style]['fontsize'] * AVERAGE_CHAR_WIDTH)))
+
+def iter_lines(transcription_data, words_per_line=DEFAULT_WORDS_PER_LINE, max_chars=None,
+               pause_seconds=PAUSE_SECONDS, split_speakers=True):
+    """
+    Breaks words into subtitle lines in one pass.
+
+    A line ends before a word that follows a pause, that is sung by another
+    speaker, or that would make the line longer than max_chars or
+    words_per_line.
+
+    Args:
+        transcription_data (list): The list of word dictionaries.
+        words_per_line (int): The maximum number of words per line.
+        max_chars (int, optional): The maximum characters per line, see max_line_chars().
+        pause_seconds (float): The silence between two words that ends a line.
+        split_speakers (bool): End a line when the speaker changes.
+
+    Yields:
+        list: The word dictionaries of each line.
+    """
+    max_chars = max_chars or float('inf')
+    line_start = 0
+    line_chars = 0
+    previous = None
+    for i, word in enumerate(transcription_data):
+        chars = len(word['text'])
+        if previous is not None and (
+            i - line_start >= words_per_line
+            or line_chars + 1 + chars > max_chars
+            or word['start'] - previous['end'] >= pause_seconds
+            or (split_speakers and word.get('speaker') != previous.get('speaker'))
+        ):
+            yield transcription_data[line_start:i]
+            line_start = i
+            line_chars = chars
+        else:
+            line_chars += chars + (1 if i > line_start else 0)
+        previous = word
+    if line_start < len(transcription_data):
+        yield transcription_data[line_start:]
+
+def group_lines(transcription_data, words_per_line=DEFAULT_WORDS_PER_LINE, max_chars=None,
+                pause_seconds=PAUSE_SECONDS, split_speakers=True):
+    """
+    Groups words into subtitle lines, see iter_lines().
+
+    Returns:
+        list: A list of lines, each a list of word dictionaries.
+    """
+    return list(iter_lines(transcription_data, words_per_line, max_chars, pause_seconds, split_speakers))
+
+# --- .ass writing ---
+
+def format_ass_time(seconds):
+    """Formats seconds as an .ass timestamp (H:MM:SS.cc)."""
+    centiseconds = max(0, int(round(seconds * 100)))
+    hours, centiseconds = divmod(centiseconds, 360000)
+    minutes, centiseconds = divmod(centiseconds, 6000)
+    return f"{hours}:{minutes:02d}:{centiseconds // 100:02d}.{centiseconds % 100:02d}"
+
+def _ass_color(r, g, b, a=0):
+    # .ass colors are &HAABBGGRR.
+    return f"&H{a:02X}{b:02X}{g:02X}{r:02X}"
+
+# Override tags start with '{' and line breaks with '\'; neither may come from the lyrics.
+_TEXT_ESCAPES = str.maketrans({'{': '(', '}': ')', '\\': '/', '\n': ' ', '\r': ' '})
+
+_STYLE_FORMAT = (
+    "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, "
+    "Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, "
+    "Alignment, MarginL, MarginR, MarginV, Encoding"
+)
+
+def _style_line(name, fontname='Arial', fontsize=20, primary_color=(0xff, 0xff, 0xff), secondary_color=(0xff, 0x00, 0x00),
+                outline_color=(0x00, 0x00, 0x00), back_color=(0x00, 0x00, 0x00), bold=False, alignment=2, margin_v=10):
+    return (
+        f"Style: {name},{fontname},{fontsize},{_ass_color(*primary_color)},{_ass_color(*secondary_color)},"
+        f"{_ass_color(*outline_color)},{_ass_color(*back_color)},{-1 if bold else 0},0,0,0,100,100,0,0,1,2,2,"
+        f"{alignment},10,10,{margin_v},1\n"
+    )
+
+def _karaoke_text(line_words):
+    # Each \k lasts until the next word starts, so the highlight stays in
+    # sync across the gaps between words. Times are rounded once, so the
+    # durations add up exactly to the line's length.
+    parts = []
+    positions = [int(round(word['start'] * 100)) for word in line_words]
+    positions.append(max(positions[-1], int(round(line_words[-1]['end'] * 100))))
+    for i, word in enumerate(line_words):
+        parts.append(f"{{\\k{max(0, positions[i + 1] - positions[i])}}}{word['text'].translate(_TEXT_ESCAPES)}")
+    return " ".join(parts)
+
+def generate_ass_file(transcription_data, output_dir, request_id, words_per_line=DEFAULT_WORDS_PER_LINE, style='default'):
     """
     Generates an .ass subtitle file with word-by-word karaoke effects.
 
+    The file is streamed line by line through a buffered writer, without
+    building a document in memory, so very long transcripts stay cheap.
+
     Args:
         transcription_data (list): The final list of word dictionaries, including speaker info.
         output_dir (str): The directory to save the .ass file.
         request_id (str): The unique ID for this processing request.
+        words_per_line (int): The maximum number of words shown per subtitle line.
+        style (str): The name of the base style, a key of SUBTITLE_STYLES.
 
     Returns:
         str: The full path to the generated .ass file, or None if it fails.
@@ -18,78 +147,49 @@ def generate_ass_file(transcription_data, output_dir, request_id):
     ass_file_path = os.path.join(output_dir, f"{request_id}.ass")
 
     try:
-        doc = ass.Document()
-
-        # --- Define Styles ---
-        # This section defines the look of the subtitles. We'll create a base style
-        # and then one for each potential speaker with different colors.
-        # Colors are in &HBBGGRR format (Blue, Green, Red).
-        doc.styles.append(ass.Style(
-            name="Default", fontname="Arial", fontsize=28,
-            primary_color=ass.Color(r=0xff, g=0xff, b=0xff), # White
-            secondary_color=ass.Color(r=0x00, g=0xff, b=0xff), # Yellow for karaoke effect
-            outline_color=ass.Color(r=0x00, g=0x00, b=0x00), # Black outline
-            back_color=ass.Color(r=0x00, g=0x00, b=0x00, a=0x80), # Semi-transparent black box
-            bold=True, alignment=2, # Center alignment
-            margin_v=20 # Margin from the bottom
-        ))
-        
-        # You can define more styles for more speakers if needed
-        speaker_styles = {
-            'SPEAKER_00': 'Speaker1',
-            'SPEAKER_01': 'Speaker2',
-            # Add more mappings as needed
-        }
-
-        doc.styles.append(ass.Style(name="Speaker1", primary_color=ass.Color(r=0x00, g=0xff, b=0xff))) # Yellow
-        doc.styles.append(ass.Style(name="Speaker2", primary_color=ass.Color(r=0xff, g=0xcc, b=0xda))) # Light Pink
-
-        # --- Group words into lines ---
-        # Logic to group words into reasonable subtitle lines (e.g., max 10 words per line)
-        lines = []
-        current_line = []
-        words_per_line = 8 # Adjust as needed
-        
-        for i, word_data in enumerate(transcription_data):
-            current_line.append(word_data)
-            if len(current_line) >= words_per_line or i == len(transcription_data) - 1:
-                lines.append(current_line)
-                current_line = []
-
-        # --- Create Events (Subtitle Lines) ---
-        for line_words in lines:
-            if not line_words:
-                continue
-
-            start_time = line_words[0]['start']
-            end_time = line_words[-1]['end']
-            
-            # Determine the style for the line based on the first speaker
-            first_speaker = line_words[0].get('speaker', 'SPEAKER_00')
-            style_name = speaker_styles.get(first_speaker, "Default")
-
-            # Build the text with karaoke tags
-            text_parts = []
-            for word_data in line_words:
-                duration = int((word_data['end'] - word_data['start']) * 100) # Duration in centiseconds
-                if duration <= 0: continue # Skip zero-duration words
-                text_parts.append(f"{{\\k{duration}}}{word_data['text']}")
-            
-            line_text = " ".join(text_parts)
-
-            event = ass.Event(
-                start=timedelta(seconds=start_time),
-                end=timedelta(seconds=end_time),
-                text=line_text,
-                style=style_name
+        style_settings = SUBTITLE_STYLES[style]
+        with open(ass_file_path, "w", encoding="utf-8-sig", buffering=256 * 1024) as f:
+            f.write(
+                "[Script Info]\n"
+                "ScriptType: v4.00+\n"
+                f"PlayResX: {PLAY_RES_X}\n"
+                f"PlayResY: {PLAY_RES_Y}\n"
+                "WrapStyle: 0\n"
+                "\n[V4+ Styles]\n"
             )
-            doc.events.append(event)
+            f.write(_STYLE_FORMAT + "\n")
+
+            # --- Define Styles ---
+            # A base style and one for each potential speaker, which only
+            # differ in color, so the chosen style applies to every line.
+            base_style = {
+                'fontname': style_settings['fontname'],
+                'fontsize': style_settings['fontsize'],
+                'secondary_color': (0x00, 0xff, 0xff), # Yellow for karaoke effect
+                'outline_color': (0x00, 0x00, 0x00), # Black outline
+                'back_color': (0x00, 0x00, 0x00, 0x80), # Semi-transparent black box
+                'bold': True,
+                'alignment': 2, # Center alignment
+                'margin_v': style_settings['margin_v'], # Margin from the bottom
+            }
+            f.write(_style_line("Default", primary_color=(0xff, 0xff, 0xff), **base_style)) # White
+            f.write(_style_line("Speaker1", primary_color=(0x00, 0xff, 0xff), **base_style)) # Yellow
+            f.write(_style_line("Speaker2", primary_color=(0xff, 0xcc, 0xda), **base_style)) # Light Pink
+
+            f.write("\n[Events]\nFormat: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n")
 
-        # --- Save the file ---
-        with open(ass_file_path, "w", encoding="utf-8-sig") as f:
-            doc.dump(f)
+            # --- Create Events (Subtitle Lines) ---
+            line_count = 0
+            for line_words in iter_lines(transcription_data, words_per_line, max_line_chars(style)):
+                # The style of the line follows its speaker.
+                style_name = SPEAKER_STYLES.get(line_words[0].get('speaker', 'SPEAKER_00'), "Default")
+                f.write(
+                    f"Dialogue: 0,{format_ass_time(line_words[0]['start'])},{format_ass_time(line_words[-1]['end'])},"
+                    f"{style_name},,0,0,0,,{_karaoke_text(line_words)}\n"
+                )
+                line_count += 1
 
-        print(f"Successfully generated subtitle file: {ass_file_path}")
+        print(f"Successfully generated subtitle file with {line_count} lines: {ass_file_path}")
         return ass_file_path
 
     except Exception as e:
@@ -1,12 +1,36 @@
 import whisper_timestamped as whisper
 import os
+from processing.audio_io import MODEL_SAMPLE_RATE, open_wav, to_model_audio
+from processing.model_registry import registry
 
-def transcribe_vocals(vocal_track_path):
+# The model used when the request does not ask for another one.
+DEFAULT_WHISPER_MODEL = "base"
+# Forcing Hindi gives better accuracy for our songs. None detects the language.
+DEFAULT_LANGUAGE = "hi"
+
+# Streaming mode: Whisper natively works on 30 second windows. Consecutive
+# windows overlap so words cut at a window edge are heard whole in one of them.
+STREAM_WINDOW_SECONDS = 30.0
+STREAM_OVERLAP_SECONDS = 5.0
+
+def whisper_model_key(model_name):
+    """Registers the Whisper model with the model registry and returns its key."""
+    key = f"whisper:{model_name}"
+    # Use "cuda" if you have a compatible GPU
+    registry.register(key, lambda: whisper.load_model(model_name, device="cpu"), exclusive=True)
+    return key
+
+# 'base' is a good starting point for speed and accuracy.
+whisper_model_key(DEFAULT_WHISPER_MODEL)
+
+def transcribe_vocals(vocal_track_path, model_name=DEFAULT_WHISPER_MODEL, language=DEFAULT_LANGUAGE):
     """
     Transcribes a vocal audio file to get word-level timestamps.
 
     Args:
         vocal_track_path (str): The full path to the vocal audio file (e.g., a .wav file).
+        model_name (str): The Whisper model to use, e.g. 'base' or 'medium'.
+        language (str, optional): The language to force, e.g. 'hi'. None detects it automatically.
 
     Returns:
         list: A list of dictionaries, where each dictionary represents a word and contains:
@@ -16,29 +40,23 @@ def transcribe_vocals(vocal_track_path):
     print(f"Starting transcription for: {vocal_track_path}")
 
     try:
-        # Load the Whisper model. 'base' is a good starting point for speed and accuracy.
-        # For higher accuracy with Hindi/Marathi, 'medium' might be better, but it's slower
-        # and requires more resources. The model will be downloaded on first use.
-        print("  -> Loading Whisper model...")
         audio = whisper.load_audio(vocal_track_path)
-        model = whisper.load_model("base", device="cpu") # Use "cuda" if you have a compatible GPU
 
-        # Transcribe the audio, detecting the language automatically.
-        # Forcing the language can sometimes improve results if you know it beforehand.
-        # e.g., result = whisper.transcribe(model, audio, language="hi")
-        print("  -> Performing transcription...")
-        result = whisper.transcribe(model, audio, language="hi") # Forcing Hindi for better accuracy
+        # The Whisper model is loaded once per worker by the model registry.
+        # For higher accuracy with Hindi/Marathi, 'medium' might be better, but it's slower
+        # and requires more resources. The model will be downloaded on first use.
+        # whisper_timestamped hooks into the model while transcribing, so the
+        # model is used by one thread at a time.
+        with registry.acquire(whisper_model_key(model_name)) as model:
+            # Transcribe the audio, detecting the language automatically.
+            # Forcing the language can sometimes improve results if you know it beforehand.
+            # e.g., result = whisper.transcribe(model, audio, language="hi")
+            print("  -> Performing transcription...")
+            result = whisper.transcribe(model, audio, language=language)
 
         # --- Data Structuring ---
         # We will re-structure the output to be a simple list of word objects.
-        word_timestamps = []
-        for segment in result["segments"]:
-            for word in segment["words"]:
-                word_timestamps.append({
-                    'text': word['text'].strip(),
-                    'start': word['start'],
-                    'end': word['end']
-                })
+        word_timestamps = _extract_words(result)
         
         print(f"Transcription complete. Found {len(word_timestamps)} words.")
         return word_timestamps
@@ -47,6 +65,109 @@ def transcribe_vocals(vocal_track_path):
         print(f"Error during transcription: {e}")
         return []
 
+def _extract_words(result, offset=0.0):
+    """Flattens a whisper_timestamped result into word dicts, shifted by offset seconds."""
+    words = []
+    for segment in result["segments"]:
+        for word in segment["words"]:
+            words.append({
+                'text': word['text'].strip(),
+                'start': word['start'] + offset,
+                'end': word['end'] + offset
+            })
+    return words
+
+def load_vocal_samples(vocal_track_path):
+    """
+    Opens a vocal track for window-by-window reading.
+
+    Returns:
+        tuple: (samples, sample_rate). WAV files are memory-mapped; anything
+               else (e.g. a FLAC stem) is decoded fully at MODEL_SAMPLE_RATE.
+    """
+    try:
+        return open_wav(vocal_track_path)
+    except ValueError:
+        return whisper.load_audio(vocal_track_path), MODEL_SAMPLE_RATE
+
+def plan_windows(total_seconds, window_seconds=STREAM_WINDOW_SECONDS, overlap_seconds=STREAM_OVERLAP_SECONDS):
+    """
+    Splits a song into overlapping transcription windows.
+
+    Words in the overlap between two windows are kept from only one of them:
+    each window owns the words that start before the middle of its overlap
+    with the next window.
+
+    Returns:
+        list: (window_start, window_end, owned_from, owned_until) tuples in seconds.
+    """
+    windows = []
+    step_seconds = window_seconds - overlap_seconds
+    window_start = 0.0
+    owned_from = 0.0 # Words starting before this belong to the previous window
+
+    while window_start < total_seconds:
+        window_end = min(window_start + window_seconds, total_seconds)
+        is_last = window_end >= total_seconds
+        owned_until = float('inf') if is_last else window_end - overlap_seconds / 2
+        windows.append((window_start, window_end, owned_from, owned_until))
+        if is_last:
+            break
+        owned_from = owned_until
+        window_start += step_seconds
+    return windows
+
+def transcribe_vocals_streaming(vocal_track_path, model_name=DEFAULT_WHISPER_MODEL, language=DEFAULT_LANGUAGE,
+                                window_seconds=STREAM_WINDOW_SECONDS, overlap_seconds=STREAM_OVERLAP_SECONDS,
+                                progress=None):
+    """
+    Transcribes a vocal track window by window, yielding words as soon as
+    each window is done.
+
+    The WAV file is memory-mapped, so only the current window is ever held in
+    memory no matter how long the song is. Words in the overlap between two
+    windows are kept from only one of them, see plan_windows().
+
+    Args:
+        vocal_track_path (str): The full path to the vocal audio file.
+        model_name (str): The Whisper model to use, e.g. 'base' or 'medium'.
+        language (str, optional): The language to force. None detects it on the
+                                  first window and keeps it for the rest.
+        window_seconds (float): The length of each window.
+        overlap_seconds (float): How much consecutive windows overlap.
+        progress (callable, optional): Called with the fraction of the song done
+                                       after each window.
+
+    Yields:
+        dict: {'text': 'word', 'start': 1.23, 'end': 1.45}, in song time.
+
+    Raises:
+        Exception: Whatever Whisper raises; words yielded so far stay valid.
+    """
+    print(f"Starting streaming transcription for: {vocal_track_path}")
+    samples, sample_rate = load_vocal_samples(vocal_track_path)
+    total_seconds = len(samples) / sample_rate
+    word_count = 0
+
+    for window_start, window_end, owned_from, owned_until in plan_windows(total_seconds, window_seconds, overlap_seconds):
+        audio = to_model_audio(
+            samples[int(window_start * sample_rate):int(window_end * sample_rate)], sample_rate
+        )
+        with registry.acquire(whisper_model_key(model_name)) as model:
+            result = whisper.transcribe(model, audio, language=language)
+        # Keep the detected language so every window is transcribed the same way.
+        language = language or result.get("language")
+
+        for word in _extract_words(result, offset=window_start):
+            if owned_from <= word['start'] < owned_until:
+                word_count += 1
+                yield word
+
+        if progress:
+            progress(window_end / total_seconds)
+
+    print(f"Streaming transcription complete. Found {word_count} words.")
+
 if __name__ == '__main__':
     # This is for testing the module directly
     # Assumes you have already run the audio_separator and have a vocal track
@@ -0,0 +1,243 @@
+import os
+import subprocess
+import tempfile
+import time
+import uuid
+import wave
+
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+
+from processing.metrics import log_event
+
+# The format uploads are decoded to: 16-bit stereo PCM at the rate the
+# separator works at (audio_separator.CHUNK_SAMPLE_RATE, which the web
+# process doesn't import because it loads the separation library).
+INGEST_SAMPLE_RATE = 44100
+INGEST_CHANNELS = 2
+
+# Enough of the file to tell the containers in probe_format() apart.
+PROBE_BYTES = 12
+
+# Container -> FFmpeg demuxer. Naming it lets FFmpeg start decoding right
+# away instead of buffering the input to probe it itself.
+DEMUXERS = {
+    'wav': 'wav',
+    'flac': 'flac',
+    'mp3': 'mp3',
+    'aac': 'aac',
+    'mp4': 'mov',
+}
+
+# MP4/M4A files often keep their index (moov atom) at the end, which a
+# decoder reading from a pipe can't seek to. Those are decoded again from
+# the saved upload if decoding from the pipe fails.
+SEEKABLE_CONTAINERS = {'mp4'}
+
+def probe_format(header):
+    """
+    Identifies the container of an audio upload from its first bytes.
+
+    Args:
+        header (bytes): At least PROBE_BYTES bytes from the start of the file.
+
+    Returns:
+        str: A key of DEMUXERS, or None if it isn't a supported audio file.
+    """
+    if header[:4] == b'RIFF' and header[8:12] == b'WAVE':
+        return 'wav'
+    if header[:4] == b'fLaC':
+        return 'flac'
+    if header[:3] == b'ID3':
+        return 'mp3'
+    if header[4:8] == b'ftyp':
+        return 'mp4'
+    if len(header) >= 2 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0:
+        # An MPEG audio frame sync: layer bits 00 are AAC in ADTS, anything else is MP1-3.
+        return 'aac' if header[1] & 0x06 == 0 else 'mp3'
+    return None
+
+def _decode_command(input_path, output_path, demuxer=None):
+    command = ['ffmpeg', '-v', 'error']
+    if demuxer:
+        command += ['-f', demuxer]
+    return command + [
+        '-i', input_path,
+        '-vn', '-ac', str(INGEST_CHANNELS), '-ar', str(INGEST_SAMPLE_RATE), '-c:a', 'pcm_s16le',
+        '-f', 'wav', '-y', output_path
+    ]
+
+def _decoded_frames(path):
+    try:
+        with wave.open(path, 'rb') as decoded:
+            return decoded.getnframes()
+    except (OSError, wave.Error, EOFError):
+        return 0
+
+class UploadIngest:
+    """
+    A write-only file object the multipart parser streams an audio upload
+    into (see UploadRequest in app.py), instead of a temporary file.
+
+    Chunks are written to disk as they arrive, never held in memory. The
+    first bytes are probed, so a file that isn't audio is rejected before
+    the rest of it is read, and an FFmpeg decoder turns the upload into the
+    pipeline's working format (INGEST_SAMPLE_RATE 16-bit stereo WAV) while
+    it is still arriving. Call finish() once the request is parsed.
+    """
+
+    def __init__(self, upload_dir, filename=None, max_bytes=None):
+        self.upload_dir = upload_dir
+        self.filename = filename
+        self.max_bytes = max_bytes
+        name = f".upload-{uuid.uuid4().hex}"
+        self.raw_path = os.path.join(upload_dir, name + '.part')
+        self.decoded_path = os.path.join(upload_dir, name + '.wav.part')
+        self.container = None
+        self.bytes_received = 0
+        self.started = time.perf_counter()
+        self._raw = open(self.raw_path, 'wb')
+        self._header = b''
+        self._decoder = None
+        self._decoder_log = None
+        self._decoder_failed = False
+        self._finished = False
+
+    # --- File object interface used by the multipart parser ---
+
+    def write(self, data):
+        size = len(data)
+        try:
+            self.bytes_received += size
+            if self.max_bytes and self.bytes_received > self.max_bytes:
+                raise RequestEntityTooLarge(f"Uploads are limited to {self.max_bytes // 1024**2} MB.")
+            self._raw.write(data)
+            if self.container is None:
+                self._header += data
+                if len(self._header) < PROBE_BYTES:
+                    return size
+                self._start_decoder()
+                data, self._header = self._header, b''
+            self._feed(data)
+            return size
+        except Exception:
+            self.discard()
+            raise
+
+    def seek(self, offset, whence=0):
+        # The parser rewinds the file once the part is complete; nothing to do.
+        return 0
+
+    def tell(self):
+        return self.bytes_received
+
+    def read(self, size=-1):
+        return b''
+
+    def close(self):
+        # Werkzeug closes uploaded files when the request ends; an upload
+        # that was never finished (e.g. a failed request) is removed then.
+        if not self._finished:
+            self.discard()
+
+    # --- Ingest ---
+
+    def _start_decoder(self):
+        self.container = probe_format(self._header)
+        if self.container is None:
+            raise UnsupportedMediaType("The file is not a supported audio format (MP3, WAV, M4A or FLAC).")
+        # Errors go to a file: a pipe could fill up on a corrupt upload and
+        # stall the decoder while we are blocked writing to it.
+        self._decoder_log = tempfile.TemporaryFile()
+        self._decoder = subprocess.Popen(
+            _decode_command('pipe:0', self.decoded_path, DEMUXERS[self.container]),
+            stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=self._decoder_log
+        )
+
+    def _close_decoder(self):
+        # Ends the decoder's input and returns (exit code, error output).
+        try:
+            self._decoder.stdin.close()
+        except OSError:
+            pass # It already stopped reading
+        returncode = self._decoder.wait()
+        self._decoder_log.seek(0)
+        return returncode, self._decoder_log.read().decode('utf-8', 'replace').strip()
+
+    def _feed(self, data):
+        if self._decoder_failed:
+            return
+        try:
+            self._decoder.stdin.write(data)
+        except OSError:
+            # The decoder gave up on the stream. Only containers that may
+            # need seeking get a second chance from the saved file.
+            _, error = self._close_decoder()
+            if self.container not in SEEKABLE_CONTAINERS:
+                raise UnsupportedMediaType(f"The audio could not be decoded: {error}")
+            self._decoder_failed = True
+
+    def finish(self, output_path):
+        """
+        Completes the upload: waits for the decoder (or decodes the saved
+        upload if decoding from the stream failed) and moves the decoded
+        audio into place.
+
+        Args:
+            output_path (str): Where the decoded WAV goes.
+
+        Returns:
+            str: output_path.
+
+        Raises:
+            UnsupportedMediaType: If the upload is empty or can't be decoded.
+        """
+        try:
+            self._raw.close()
+            if self.container is None:
+                raise UnsupportedMediaType("The file is too short to be audio.")
+            decoded_from = 'stream'
+            if not self._decoder_failed:
+                returncode, error = self._close_decoder()
+                # A decoder that can't find the index may also stop "cleanly",
+                # with nothing decoded.
+                if returncode != 0 or _decoded_frames(self.decoded_path) == 0:
+                    if self.container not in SEEKABLE_CONTAINERS:
+                        raise UnsupportedMediaType(
+                            f"The audio could not be decoded: {error}" if error else "The file contains no audio."
+                        )
+                    self._decoder_failed = True
+            if self._decoder_failed:
+                decoded_from = 'file'
+                result = subprocess.run(
+                    _decode_command(self.raw_path, self.decoded_path), capture_output=True, text=True
+                )
+                if result.returncode != 0:
+                    raise UnsupportedMediaType(f"The audio could not be decoded: {result.stderr.strip()}")
+                if _decoded_frames(self.decoded_path) == 0:
+                    raise UnsupportedMediaType("The file contains no audio.")
+            os.replace(self.decoded_path, output_path)
+            self._finished = True
+            os.remove(self.raw_path)
+        except Exception:
+            self.discard()
+            raise
+
+        log_event(
+            'upload_ingested', filename=self.filename, container=self.container, bytes=self.bytes_received,
+            decoded_bytes=os.path.getsize(output_path), decoded_from=decoded_from,
+            seconds=round(time.perf_counter() - self.started, 3)
+        )
+        return output_path
+
+    def discard(self):
+        """Stops the decoder and removes the partial files."""
+        if not self._raw.closed:
+            self._raw.close()
+        if self._decoder is not None and self._decoder.poll() is None:
+            self._decoder.kill()
+            self._decoder.wait()
+        if self._decoder_log is not None:
+            self._decoder_log.close()
+        for path in (self.raw_path, self.decoded_path):
+            if os.path.exists(path):
+                os.remove(path)
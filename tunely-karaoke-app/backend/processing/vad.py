@@ -0,0 +1,195 @@
+import os
+import wave
+import numpy as np
+from processing.audio_io import open_wav, to_float32, write_model_wav
+
+# Frames the energy is measured over, and how much audio is read at a time.
+FRAME_SECONDS = 0.05
+BLOCK_SECONDS = 60.0
+
+# A frame is voiced if it is at most this far below the loudest frame of the
+# track and above the absolute floor. Separated vocal stems bleed a little
+# of the instrumental, so "silent" stretches are quiet rather than zero.
+RELATIVE_THRESHOLD_DB = -35.0
+ABSOLUTE_THRESHOLD_DB = -60.0
+
+# Silences shorter than this stay in (breaths, pauses between lines), and
+# every voiced region keeps this much audio on both sides so word onsets and
+# tails are not clipped.
+MIN_SILENCE_SECONDS = 2.0
+PADDING_SECONDS = 0.3
+
+# Silence put between the joined regions, so Whisper hears a break there.
+JOIN_GAP_SECONDS = 0.5
+
+def frame_energy_db(samples, sample_rate, frame_seconds=FRAME_SECONDS, block_seconds=BLOCK_SECONDS):
+    """
+    Measures the RMS level of every frame of a track, in dBFS.
+
+    The samples are read block by block, so a memory-mapped stem is never
+    loaded into memory as a whole.
+
+    Args:
+        samples (np.ndarray): Samples of shape (frames, channels) or (frames,).
+        sample_rate (int): The sample rate of the samples.
+        frame_seconds (float): The length of each measured frame.
+
+    Returns:
+        np.ndarray: The level of each frame in dB (-inf for digital silence).
+    """
+    frame_length = max(1, int(frame_seconds * sample_rate))
+    block_length = max(1, int(block_seconds / frame_seconds)) * frame_length
+    levels = []
+    for block_start in range(0, len(samples), block_length):
+        block = to_float32(np.asarray(samples[block_start:block_start + block_length]))
+        if block.ndim == 2:
+            block = block.mean(axis=1)
+        frames = len(block) // frame_length
+        if frames == 0:
+            break
+        power = np.square(block[:frames * frame_length].reshape(frames, frame_length)).mean(axis=1)
+        with np.errstate(divide='ignore'):
+            levels.append(10 * np.log10(power))
+    return np.concatenate(levels) if levels else np.zeros(0)
+
+def find_voiced_regions(levels_db, frame_seconds=FRAME_SECONDS, relative_threshold_db=RELATIVE_THRESHOLD_DB,
+                        absolute_threshold_db=ABSOLUTE_THRESHOLD_DB, min_silence_seconds=MIN_SILENCE_SECONDS,
+                        padding_seconds=PADDING_SECONDS):
+    """
+    Turns per-frame levels into the time ranges where someone is singing.
+
+    Args:
+        levels_db (np.ndarray): Per-frame levels, see frame_energy_db().
+        frame_seconds (float): The length of each frame.
+
+    Returns:
+        list: Sorted, non-overlapping [start, end] ranges in seconds.
+    """
+    if len(levels_db) == 0 or not np.isfinite(levels_db).any():
+        return []
+    threshold = max(np.max(levels_db) + relative_threshold_db, absolute_threshold_db)
+    voiced = levels_db > threshold
+    if not voiced.any():
+        return []
+
+    # Start/end frame of every run of voiced frames.
+    edges = np.diff(np.concatenate(([0], voiced.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1) * frame_seconds - padding_seconds
+    ends = np.flatnonzero(edges == -1) * frame_seconds + padding_seconds
+
+    # Merge runs separated by less than the minimum silence.
+    keep = np.concatenate(([True], starts[1:] - ends[:-1] >= min_silence_seconds))
+    region_starts = np.maximum(starts[keep], 0.0)
+    region_ends = np.minimum(np.maximum.reduceat(ends, np.flatnonzero(keep)), len(levels_db) * frame_seconds)
+    return [[round(float(start), 3), round(float(end), 3)] for start, end in zip(region_starts, region_ends)]
+
+class OffsetMap:
+    """
+    Maps times in the trimmed vocal track (the voiced regions joined with
+    JOIN_GAP_SECONDS of silence between them) back to song time.
+
+    Args:
+        regions (list): The [start, end] song-time ranges that were kept, in order.
+        gap_seconds (float): The silence inserted between two regions.
+    """
+
+    def __init__(self, regions, gap_seconds=JOIN_GAP_SECONDS):
+        regions = np.asarray(regions, dtype=np.float64).reshape(-1, 2)
+        self.song_starts = regions[:, 0]
+        self.lengths = regions[:, 1] - regions[:, 0]
+        # Where each region starts in the trimmed track.
+        self.trimmed_starts = np.concatenate(([0.0], np.cumsum(self.lengths + gap_seconds)[:-1]))
+
+    def region_of(self, times):
+        """Returns the index of the region each trimmed-track time falls in (or follows)."""
+        index = np.searchsorted(self.trimmed_starts, np.asarray(times, dtype=np.float64), side='right') - 1
+        return np.clip(index, 0, len(self.song_starts) - 1)
+
+    def to_song_time(self, times, regions=None):
+        """
+        Converts trimmed-track times to song times (vectorized).
+
+        A time inside a join gap is clamped to the end of the region before
+        it. With `regions`, each time is mapped within the given region
+        instead of the one it falls in, clamped to that region's bounds.
+        """
+        times = np.asarray(times, dtype=np.float64)
+        if len(self.song_starts) == 0:
+            return times
+        index = self.region_of(times) if regions is None else regions
+        within = np.clip(times - self.trimmed_starts[index], 0.0, self.lengths[index])
+        return self.song_starts[index] + within
+
+    def map_intervals(self, items, within_region=False):
+        """
+        Returns copies of dicts with 'start'/'end' keys shifted into song time.
+
+        Args:
+            items (list): Dicts with 'start' and 'end' in trimmed-track time.
+            within_region (bool): Keep each end in the region of its start.
+                                  Words can't span the silence cut out at a
+                                  join, but speaker turns can.
+        """
+        if not items:
+            return []
+        starts = np.array([item['start'] for item in items], dtype=np.float64)
+        ends = np.array([item['end'] for item in items], dtype=np.float64)
+        song_starts = self.to_song_time(starts)
+        song_ends = self.to_song_time(ends, regions=self.region_of(starts) if within_region else None)
+        return [
+            {**item, 'start': float(start), 'end': float(max(end, start))}
+            for item, start, end in zip(items, song_starts, song_ends)
+        ]
+
+def trim_silence(vocal_track_path, output_path, gap_seconds=JOIN_GAP_SECONDS, trim=True):
+    """
+    Builds the 16 kHz mono 16-bit PCM vocal track that both Whisper and
+    pyannote read, so the stem is decoded and resampled only once. With
+    trim, only the voiced parts are kept, joined by short gaps.
+
+    Args:
+        vocal_track_path (str): Path to the separated vocal stem (any format).
+        output_path (str): The desired path for the 16 kHz WAV.
+        gap_seconds (float): The silence put between two regions.
+        trim (bool): Cut out the silent stretches.
+
+    Returns:
+        tuple: (output_path, regions), with regions as for OffsetMap, or
+               (None, None) if the track could not be converted. Without
+               trim, or if no frame is voiced, the full track is one region.
+    """
+    print(f"Preparing the 16 kHz vocal track from: {vocal_track_path}")
+    view_path = os.path.splitext(output_path)[0] + '_full.wav'
+    try:
+        write_model_wav(vocal_track_path, view_path)
+        samples, sample_rate = open_wav(view_path)
+        total_seconds = len(samples) / sample_rate
+        regions = find_voiced_regions(frame_energy_db(samples, sample_rate)) if trim else []
+        if not regions:
+            os.replace(view_path, output_path)
+            return output_path, [[0.0, round(total_seconds, 3)]]
+
+        # The view is already at the model rate, so regions are copied as is.
+        gap = np.zeros((int(gap_seconds * sample_rate), samples.shape[1]), dtype=samples.dtype)
+        with wave.open(output_path, 'wb') as out:
+            out.setnchannels(samples.shape[1])
+            out.setsampwidth(samples.dtype.itemsize)
+            out.setframerate(sample_rate)
+            for i, (start, end) in enumerate(regions):
+                if i > 0:
+                    out.writeframes(gap.tobytes())
+                out.writeframes(np.ascontiguousarray(samples[int(start * sample_rate):int(end * sample_rate)]).tobytes())
+        del samples
+
+        voiced_seconds = sum(end - start for start, end in regions)
+        print(f"Kept {voiced_seconds:.0f}s of {total_seconds:.0f}s in {len(regions)} voiced regions.")
+        return output_path, regions
+
+    except Exception as e:
+        print(f"Error preparing the vocal track: {e}")
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        return None, None
+    finally:
+        if os.path.exists(view_path):
+            os.remove(view_path)
@@ -1,7 +1,70 @@
 import subprocess
 import os
+import re
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from processing.metrics import log_event, metrics, parse_ffmpeg_progress
+from processing.subtitle_generator import format_ass_time
 
-def create_video(instrumental_track_path, ass_subtitle_path, output_video_path, background_video_path=None):
+# Output canvas used for the plain black background.
+VIDEO_SIZE = '1280x720'
+# Fixed frame rate for segment-parallel rendering, so segments cut on frame boundaries.
+FRAME_RATE = 25
+# Segments shorter than this are not worth their own FFmpeg process.
+MIN_SEGMENT_SECONDS = 10.0
+
+# Preview renders trade quality for speed: small canvas, low frame rate, ultrafast preset.
+PREVIEW_WIDTH = 640
+PREVIEW_HEIGHT = 360
+PREVIEW_FRAME_RATE = 12
+
+def _progress_number(value):
+    # FFmpeg reports e.g. 'speed=12.3x', and 'N/A' before the first frame.
+    try:
+        return float((value or '').rstrip('x'))
+    except ValueError:
+        return None
+
+def run_ffmpeg(command, kind):
+    """
+    Runs an FFmpeg command with `-progress` output and records its encode
+    fps and speed (as a multiple of real time) in the metrics.
+
+    Args:
+        command (list): The FFmpeg command, starting with 'ffmpeg'.
+        kind (str): What is encoded, e.g. 'video' or 'preview'; the metrics label.
+
+    Returns:
+        subprocess.CompletedProcess: The finished process, with stderr captured.
+
+    Raises:
+        subprocess.CalledProcessError, FileNotFoundError: As subprocess.run.
+    """
+    command = command[:1] + ['-progress', 'pipe:1', '-nostats'] + command[1:]
+    start = time.perf_counter()
+    result = subprocess.run(command, check=True, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    progress = parse_ffmpeg_progress(result.stdout)
+    fps = _progress_number(progress.get('fps'))
+    frames = _progress_number(progress.get('frame'))
+    if not fps and frames:
+        # FFmpeg leaves fps at 0 for encodes shorter than about a second.
+        fps = round(frames / elapsed, 2)
+    speed = _progress_number(progress.get('speed'))
+    if fps:
+        metrics.observe('tunely_ffmpeg_encode_fps', fps, kind=kind)
+    if speed:
+        metrics.observe('tunely_ffmpeg_speed', speed, kind=kind)
+    log_event('ffmpeg_encode', kind=kind, frames=int(frames) if frames else None, fps=fps, speed=speed, seconds=round(elapsed, 3))
+    return result
+
+def _thread_args(threads):
+    # FFmpeg sizes its encoder threads to the machine unless told otherwise.
+    return ['-threads', str(threads)] if threads else []
+
+def create_video(instrumental_track_path, ass_subtitle_path, output_video_path, background_video_path=None, render_workers=1,
+                 background_normalized=False, threads=None):
     """
     Creates the final karaoke video by combining audio, subtitles, and a background.
 
@@ -11,24 +74,40 @@ def create_video(instrumental_track_path, ass_subtitle_path, output_video_path,
         output_video_path (str): The desired path for the final output video.
         background_video_path (str, optional): Path to a background video. 
                                                If None, a plain black background is used.
+        render_workers (int): With more than one worker, the video is rendered
+                              in parallel segments, see create_video_parallel().
+        background_normalized (bool): The background already has the output's
+                                      size and frame rate, see processing/background_assets.py.
+        threads (int, optional): The CPU threads FFmpeg may use; all cores if None.
 
     Returns:
         bool: True if video creation was successful, False otherwise.
     """
+    if render_workers > 1:
+        return create_video_parallel(
+            instrumental_track_path, ass_subtitle_path, output_video_path,
+            background_video_path=background_video_path, workers=render_workers,
+            background_normalized=background_normalized, threads=threads
+        )
+
     print("Starting final video creation...")
 
     try:
         # --- Build the FFmpeg Command ---
+        subtitles_filter = f"subtitles='{_escape_filter_path(ass_subtitle_path)}'"
         if background_video_path and os.path.exists(background_video_path):
             # Command with a background video (complex filter)
             # This command is more complex as it needs to loop the background video
             # to match the duration of the audio.
+            # A normalized background is already at FRAME_RATE; any other one is
+            # converted to it, like the segments of create_video_parallel().
+            video_filter = subtitles_filter if background_normalized else f"fps={FRAME_RATE},{subtitles_filter}"
             command = [
                 'ffmpeg',
                 '-stream_loop', '-1',  # Loop the video input indefinitely
                 '-i', background_video_path, # Input 0: Background video
                 '-i', instrumental_track_path, # Input 1: Instrumental audio
-                '-vf', f"subtitles='{ass_subtitle_path}'", # Video filter to burn subtitles
+                '-vf', video_filter, # Video filter to burn subtitles
                 '-map', '0:v', # Map video from input 0
                 '-map', '1:a', # Map audio from input 1
                 '-c:v', 'libx264', # Video codec
@@ -37,6 +116,8 @@ def create_video(instrumental_track_path, ass_subtitle_path, output_video_path,
                 '-c:a', 'aac', # Audio codec
                 '-b:a', '192k', # Audio bitrate
                 '-shortest', # Finish encoding when the shortest input (audio) ends
+                '-movflags', '+faststart', # Index first, so playback starts while downloading
+            ] + _thread_args(threads) + [
                 '-y', # Overwrite output file if it exists
                 output_video_path
             ]
@@ -46,13 +127,15 @@ def create_video(instrumental_track_path, ass_subtitle_path, output_video_path,
                 'ffmpeg',
                 '-f', 'lavfi', '-i', 'color=c=black:s=1280x720', # Generate a black background
                 '-i', instrumental_track_path, # Input audio
-                '-vf', f"subtitles='{ass_subtitle_path}'", # Burn subtitles
+                '-vf', subtitles_filter, # Burn subtitles
                 '-c:a', 'aac', # Audio codec
                 '-b:a', '192k', # Audio bitrate
                 '-c:v', 'libx264', # Video codec
                 '-preset', 'fast',
                 '-crf', '23',
                 '-shortest', # Finish when audio ends
+                '-movflags', '+faststart', # Index first, so playback starts while downloading
+            ] + _thread_args(threads) + [
                 '-y', # Overwrite
                 output_video_path
             ]
@@ -60,12 +143,10 @@ def create_video(instrumental_track_path, ass_subtitle_path, output_video_path,
         print(f"  -> Executing FFmpeg command: {' '.join(command)}")
 
         # --- Run the Command ---
-        # We use subprocess.run to execute the command.
-        # capture_output=True will store stdout and stderr.
-        # text=True decodes them as text.
-        result = subprocess.run(command, check=True, capture_output=True, text=True)
+        # run_ffmpeg() executes the command with subprocess.run, capturing
+        # stdout (FFmpeg's progress report) and stderr as text.
+        result = run_ffmpeg(command, 'video')
 
-        print("  -> FFmpeg stdout:", result.stdout)
         print("  -> FFmpeg stderr:", result.stderr)
         print(f"Successfully created video: {output_video_path}")
         return True
@@ -81,6 +162,316 @@ def create_video(instrumental_track_path, ass_subtitle_path, output_video_path,
         print(f"An unexpected error occurred in video creation: {e}")
         return False
 
+def create_preview(instrumental_track_path, ass_subtitle_path, output_video_path, background_video_path=None,
+                   background_normalized=False, threads=None):
+    """
+    Quickly renders a low-resolution preview of the karaoke video, so users
+    can start playing while the full-quality video is still encoding.
+
+    Args:
+        instrumental_track_path (str): Path to the instrumental audio file.
+        ass_subtitle_path (str): Path to the generated .ass subtitle file.
+        output_video_path (str): The desired path for the preview video.
+        background_video_path (str, optional): Path to a background video.
+        background_normalized (bool): The background is already at the preview's
+                                      size and frame rate, so it isn't scaled again.
+        threads (int, optional): The CPU threads FFmpeg may use; all cores if None.
+
+    Returns:
+        bool: True if the preview was created, False otherwise.
+    """
+    print("Starting preview video creation...")
+
+    try:
+        subtitles_filter = f"subtitles='{_escape_filter_path(ass_subtitle_path)}'"
+        if background_video_path and os.path.exists(background_video_path):
+            if background_normalized:
+                video_filter = subtitles_filter
+            else:
+                video_filter = f"scale={PREVIEW_WIDTH}:{PREVIEW_HEIGHT},fps={PREVIEW_FRAME_RATE},{subtitles_filter}"
+            command = [
+                'ffmpeg',
+                '-stream_loop', '-1', '-i', background_video_path,
+                '-i', instrumental_track_path,
+                '-vf', video_filter,
+                '-map', '0:v', '-map', '1:a',
+            ]
+        else:
+            command = [
+                'ffmpeg',
+                '-f', 'lavfi', '-i', f"color=c=black:s={PREVIEW_WIDTH}x{PREVIEW_HEIGHT}:r={PREVIEW_FRAME_RATE}",
+                '-i', instrumental_track_path,
+                '-vf', subtitles_filter,
+            ]
+        command += [
+            '-c:v', 'libx264', '-preset', 'ultrafast', '-crf', '30', '-pix_fmt', 'yuv420p',
+            '-c:a', 'aac', '-b:a', '96k',
+            '-shortest',
+            '-movflags', '+faststart',
+        ] + _thread_args(threads) + [
+            '-y', output_video_path
+        ]
+        run_ffmpeg(command, 'preview')
+        print(f"Successfully created preview video: {output_video_path}")
+        return True
+
+    except FileNotFoundError:
+        print("ERROR: ffmpeg command not found. Make sure FFmpeg is installed and in your system's PATH.")
+        return False
+    except subprocess.CalledProcessError as e:
+        print("Error during preview creation with FFmpeg.")
+        print("FFmpeg stderr:", e.stderr)
+        return False
+    except Exception as e:
+        print(f"An unexpected error occurred in preview creation: {e}")
+        return False
+
+# Audio-only output for in-browser karaoke: codec -> (FFmpeg encoder args, file extension)
+AUDIO_CODECS = {
+    'aac': (['-c:a', 'aac', '-b:a', '160k', '-movflags', '+faststart'], '.m4a'),
+    'opus': (['-c:a', 'libopus', '-b:a', '128k'], '.webm'),
+}
+
+def transcode_audio(instrumental_track_path, output_audio_path, codec='aac', threads=None):
+    """
+    Encodes the instrumental track once into a compact, streamable format
+    for playback in the browser, without rendering any video.
+
+    Args:
+        instrumental_track_path (str): Path to the instrumental audio file.
+        output_audio_path (str): The desired path for the encoded audio.
+        codec (str): A key of AUDIO_CODECS.
+        threads (int, optional): The CPU threads FFmpeg may use; all cores if None.
+
+    Returns:
+        bool: True if the audio was encoded, False otherwise.
+    """
+    print(f"Encoding instrumental audio as {codec}...")
+
+    try:
+        encoder_args, _ = AUDIO_CODECS[codec]
+        command = ['ffmpeg', '-i', instrumental_track_path, '-vn'] + encoder_args + _thread_args(threads) + ['-y', output_audio_path]
+        run_ffmpeg(command, f"audio_{codec}")
+        print(f"Successfully encoded audio: {output_audio_path}")
+        return True
+    except FileNotFoundError:
+        print("ERROR: ffmpeg command not found. Make sure FFmpeg is installed and in your system's PATH.")
+        return False
+    except subprocess.CalledProcessError as e:
+        print("Error during audio encoding with FFmpeg.")
+        print("FFmpeg stderr:", e.stderr)
+        return False
+    except Exception as e:
+        print(f"An unexpected error occurred in audio encoding: {e}")
+        return False
+
+# --- Segment-parallel rendering ---
+
+def get_media_duration(path):
+    """Returns the duration of a media file in seconds, using ffprobe."""
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'csv=p=0', path],
+        check=True, capture_output=True, text=True
+    )
+    return float(result.stdout.strip())
+
+_DIALOGUE_RE = re.compile(r'^(Dialogue:\s*[^,]*,)(\d+:\d{2}:\d{2}\.\d{2}),(\d+:\d{2}:\d{2}\.\d{2}),(.*)$')
+
+def _parse_ass_time(value):
+    hours, minutes, seconds = value.split(':')
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+def read_ass_events(ass_subtitle_path):
+    """
+    Splits an .ass file into its header and its dialogue events.
+
+    Returns:
+        tuple: (header_lines, events). events is a list of
+               (start, end, prefix, rest) with times in seconds, where the
+               event line is prefix + start + ',' + end + ',' + rest.
+    """
+    header_lines, events = [], []
+    with open(ass_subtitle_path, encoding='utf-8-sig') as f:
+        for line in f.read().splitlines():
+            match = _DIALOGUE_RE.match(line)
+            if match:
+                prefix, start, end, rest = match.groups()
+                events.append((_parse_ass_time(start), _parse_ass_time(end), prefix, rest))
+            else:
+                header_lines.append(line)
+    return header_lines, events
+
+def plan_segments(events, duration, count, frame_rate=FRAME_RATE):
+    """
+    Picks up to `count` segments covering [0, duration], cutting only in the
+    gaps between subtitle lines so that no line is split across two segments.
+    Cut points are snapped to frame boundaries.
+
+    Returns:
+        list: (start, end) tuples in seconds.
+    """
+    count = max(1, min(count, int(duration // MIN_SEGMENT_SECONDS)))
+
+    # Free gaps between lines, where a cut does not split any event.
+    gaps = []
+    covered_until = 0.0
+    for start, end, _, _ in sorted(events):
+        if start > covered_until:
+            gaps.append((covered_until, start))
+        covered_until = max(covered_until, end)
+    gaps.append((covered_until, duration))
+
+    # One candidate cut per gap, on a frame boundary in the middle of it.
+    candidates = []
+    for gap_start, gap_end in gaps:
+        first_frame = int(gap_start * frame_rate) + 1
+        last_frame = int(gap_end * frame_rate) - 1
+        if first_frame <= last_frame:
+            candidates.append(round((first_frame + last_frame) / 2) / frame_rate)
+
+    cuts = []
+    for i in range(1, count):
+        ideal = duration * i / count
+        best = min(candidates, key=lambda cut: abs(cut - ideal), default=None)
+        if best is not None and 0 < best < duration and best not in cuts:
+            cuts.append(best)
+    cuts.sort()
+
+    boundaries = [0.0] + cuts + [duration]
+    return list(zip(boundaries, boundaries[1:]))
+
+def _write_segment_ass(header_lines, events, start, end, path):
+    # Keeps the events inside the segment and shifts them to segment time.
+    lines = list(header_lines)
+    for event_start, event_end, prefix, rest in events:
+        if event_end > start and event_start < end:
+            lines.append(f"{prefix}{format_ass_time(event_start - start)},{format_ass_time(event_end - start)},{rest}")
+    with open(path, 'w', encoding='utf-8-sig') as f:
+        f.write("\n".join(lines) + "\n")
+
+def _escape_filter_path(path):
+    # Paths inside an FFmpeg filter graph need ':' and quotes escaped.
+    return path.replace('\\', '/').replace(':', '\\:').replace("'", "\\'")
+
+def _render_segment(index, start, end, ass_path, segment_path, background_video_path, background_duration, threads,
+                    background_normalized=False):
+    duration = end - start
+    subtitles_filter = f"subtitles='{_escape_filter_path(ass_path)}'"
+    if background_video_path:
+        command = [
+            'ffmpeg',
+            '-stream_loop', '-1', # Loop the background, starting where this segment falls in it
+            '-ss', f"{start % background_duration:.3f}",
+            '-i', background_video_path,
+            '-t', f"{duration:.3f}",
+            # A normalized background is already at FRAME_RATE, with a keyframe every second to seek to.
+            '-vf', subtitles_filter if background_normalized else f"fps={FRAME_RATE},{subtitles_filter}",
+        ]
+    else:
+        command = [
+            'ffmpeg',
+            '-f', 'lavfi', '-i', f"color=c=black:s={VIDEO_SIZE}:r={FRAME_RATE}:d={duration:.3f}",
+            '-vf', subtitles_filter,
+        ]
+    command += [
+        '-an', # Audio is muxed once, after the segments are joined
+        '-c:v', 'libx264', '-preset', 'fast', '-crf', '23', '-pix_fmt', 'yuv420p',
+        '-threads', str(threads),
+        '-y', segment_path
+    ]
+    run_ffmpeg(command, 'segment')
+    print(f"  -> Rendered segment {index} ({start:.2f}s - {end:.2f}s)")
+    return segment_path
+
+def create_video_parallel(instrumental_track_path, ass_subtitle_path, output_video_path,
+                          background_video_path=None, workers=4, segments=None, background_normalized=False,
+                          threads=None):
+    """
+    Creates the karaoke video by rendering time segments in parallel FFmpeg
+    processes and joining them with the concat demuxer (no re-encode).
+
+    The timeline is cut in the gaps between subtitle lines, each segment gets
+    its own slice of the .ass events, and the instrumental audio is muxed in
+    once at the end.
+
+    Args:
+        instrumental_track_path (str): Path to the instrumental audio file.
+        ass_subtitle_path (str): Path to the generated .ass subtitle file.
+        output_video_path (str): The desired path for the final output video.
+        background_video_path (str, optional): Path to a background video.
+        workers (int): How many FFmpeg processes run at once.
+        segments (int, optional): How many segments to cut; defaults to workers.
+        background_normalized (bool): The background is already at FRAME_RATE.
+        threads (int, optional): The CPU threads all segment encoders share; all cores if None.
+            Also caps workers, since every encoder needs a thread of its own.
+
+    Returns:
+        bool: True if video creation was successful, False otherwise.
+    """
+    if threads:
+        workers = max(1, min(workers, threads))
+    print(f"Starting parallel video creation with {workers} workers...")
+    segment_dir = output_video_path + '.segments'
+
+    try:
+        if not (background_video_path and os.path.exists(background_video_path)):
+            background_video_path = None
+        duration = get_media_duration(instrumental_track_path)
+        background_duration = get_media_duration(background_video_path) if background_video_path else None
+
+        header_lines, events = read_ass_events(ass_subtitle_path)
+        plan = plan_segments(events, duration, segments or workers)
+        os.makedirs(segment_dir, exist_ok=True)
+        # Share the cores between the parallel encoders instead of oversubscribing.
+        threads = max(1, (threads or os.cpu_count() or 1) // min(workers, len(plan)))
+
+        jobs = []
+        for index, (start, end) in enumerate(plan):
+            ass_path = os.path.join(segment_dir, f"segment_{index:03d}.ass")
+            _write_segment_ass(header_lines, events, start, end, ass_path)
+            segment_path = os.path.join(segment_dir, f"segment_{index:03d}.mp4")
+            jobs.append((index, start, end, ass_path, segment_path, background_video_path, background_duration, threads,
+                         background_normalized))
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            segment_paths = list(executor.map(lambda job: _render_segment(*job), jobs))
+
+        # --- Join the segments and mux the audio once ---
+        list_path = os.path.join(segment_dir, 'segments.txt')
+        with open(list_path, 'w', encoding='utf-8') as f:
+            for segment_path in segment_paths:
+                f.write(f"file '{os.path.abspath(segment_path)}'\n")
+        command = [
+            'ffmpeg',
+            '-f', 'concat', '-safe', '0', '-i', list_path, # Input 0: joined video segments
+            '-i', instrumental_track_path, # Input 1: Instrumental audio
+            '-map', '0:v', '-map', '1:a',
+            '-c:v', 'copy', # No re-encode, the segments are already H.264
+            '-c:a', 'aac', '-b:a', '192k',
+            '-shortest',
+            '-movflags', '+faststart',
+            '-y', output_video_path
+        ]
+        # Logged and recorded like the renders, under its own 'concat' label
+        # since copying the video is far faster than encoding it.
+        run_ffmpeg(command, 'concat')
+
+        print(f"Successfully created video from {len(plan)} segments: {output_video_path}")
+        return True
+
+    except FileNotFoundError:
+        print("ERROR: ffmpeg command not found. Make sure FFmpeg is installed and in your system's PATH.")
+        return False
+    except subprocess.CalledProcessError as e:
+        print("Error during parallel video creation with FFmpeg.")
+        print("FFmpeg stderr:", e.stderr)
+        return False
+    except Exception as e:
+        print(f"An unexpected error occurred in parallel video creation: {e}")
+        return False
+    finally:
+        shutil.rmtree(segment_dir, ignore_errors=True)
+
 if __name__ == '__main__':
     # For testing this module directly
     test_instrumental = '../outputs/test_run_(Instrumental)_UVR-MDX-NET-Inst-HQ-3.wav'
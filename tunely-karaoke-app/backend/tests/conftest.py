@@ -0,0 +1,12 @@
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# The tests cover the pure-Python helpers, but some of them live in modules
+# that import the ML libraries; the benchmarks' stand-ins keep those imports
+# fast and let the tests run without the models installed.
+from benchmarks import stubs
+
+stubs.install()
@@ -0,0 +1,76 @@
+import os
+import time
+
+from processing.checkpoints import MANIFEST_FILE, CheckpointStore
+
+def write_file(path, size):
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    return str(path)
+
+def checkpointed_request(store, tmp_path, request_id, status, age_seconds, size=1000):
+    store.begin(request_id, 'uploads/song.wav', {'output_mode': 'video'})
+    store.save(request_id, 'separation', {
+        'files': {'vocals': write_file(tmp_path / f"{request_id}.flac", size)}, 'data': None
+    })
+    if status != 'queued':
+        store.mark(request_id, status)
+    then = time.time() - age_seconds
+    os.utime(os.path.join(store.root, request_id, MANIFEST_FILE), (then, then))
+
+def test_save_and_load_a_stage(tmp_path):
+    store = CheckpointStore(str(tmp_path / 'checkpoints'))
+    store.begin('r1', 'uploads/song.wav')
+    store.save('r1', 'speakers', {'files': {'vocals': write_file(tmp_path / 'v.wav', 10)}, 'data': [{'w': 1}]})
+    entry = store.load('r1', 'speakers')
+    assert entry['data'] == [{'w': 1}]
+    assert os.path.getsize(entry['files']['vocals']) == 10
+    assert store.load('r1', 'video') is None
+    assert store.load('r2', 'speakers') is None
+
+def test_begin_keeps_completed_stages_and_running_counts_attempts(tmp_path):
+    store = CheckpointStore(str(tmp_path / 'checkpoints'))
+    store.begin('r1', 'uploads/song.wav')
+    store.save('r1', 'separation', {'files': {}, 'data': None})
+    store.mark('r1', 'running')
+    store.mark('r1', 'failed', 'boom')
+    manifest = store.begin('r1', 'uploads/song.wav')
+    assert manifest['status'] == 'queued' and manifest['error'] is None
+    assert 'separation' in manifest['stages']
+    assert store.mark('r1', 'running')['attempts'] == 2
+
+def test_incomplete_lists_queued_and_running_jobs_oldest_first(tmp_path):
+    store = CheckpointStore(str(tmp_path / 'checkpoints'))
+    for request_id, status in (('a', 'running'), ('b', 'done'), ('c', 'queued'), ('d', 'failed')):
+        store.begin(request_id, 'uploads/song.wav')
+        store.mark(request_id, status)
+    assert [manifest['request_id'] for manifest in store.incomplete()] == ['a', 'c']
+
+def test_collect_garbage_removes_expired_finished_requests(tmp_path):
+    store = CheckpointStore(str(tmp_path / 'checkpoints'), max_age_seconds=3600, min_age_seconds=60)
+    checkpointed_request(store, tmp_path, 'old-done', 'done', 7200)
+    checkpointed_request(store, tmp_path, 'new-done', 'done', 120)
+    store.collect_garbage()
+    assert store.manifest('old-done') is None
+    assert store.manifest('new-done') is not None
+
+def test_collect_garbage_evicts_least_recently_updated_finished_requests_over_the_limit(tmp_path):
+    store = CheckpointStore(str(tmp_path / 'checkpoints'), max_bytes=10**9, min_age_seconds=60)
+    checkpointed_request(store, tmp_path, 'oldest', 'failed', 3000)
+    checkpointed_request(store, tmp_path, 'older', 'done', 2000)
+    checkpointed_request(store, tmp_path, 'recent', 'done', 30)
+    store.max_bytes = store.collect_garbage() - 1
+    store.collect_garbage()
+    assert store.manifest('oldest') is None
+    assert store.manifest('older') is not None
+    assert store.manifest('recent') is not None
+
+def test_collect_garbage_never_removes_queued_or_running_jobs(tmp_path):
+    store = CheckpointStore(str(tmp_path / 'checkpoints'), max_bytes=0, max_age_seconds=60, min_age_seconds=60)
+    checkpointed_request(store, tmp_path, 'queued', 'queued', 7200)
+    checkpointed_request(store, tmp_path, 'running', 'running', 7200)
+    checkpointed_request(store, tmp_path, 'done', 'done', 7200)
+    store.collect_garbage()
+    assert store.manifest('queued') is not None
+    assert store.manifest('running') is not None
+    assert store.manifest('done') is None
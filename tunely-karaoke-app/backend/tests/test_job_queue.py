@@ -0,0 +1,49 @@
+import shutil
+import time
+import wave
+
+import numpy as np
+import pytest
+
+from job_queue import JobQueue
+
+pytestmark = pytest.mark.skipif(shutil.which('ffmpeg') is None, reason="The pipeline needs FFmpeg")
+
+def write_song(path, seconds=6.0, sample_rate=44100):
+    # A tone in bursts, so the stand-in models find words and turns in it.
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    tone = 0.3 * np.sin(2 * np.pi * 440 * t) * (np.sin(2 * np.pi * 0.5 * t) > 0)
+    samples = (np.repeat(tone[:, None], 2, axis=1) * 32767).astype('<i2')
+    with wave.open(str(path), 'wb') as out:
+        out.setnchannels(2)
+        out.setsampwidth(2)
+        out.setframerate(sample_rate)
+        out.writeframes(samples.tobytes())
+    return str(path)
+
+def wait_for(queue, job_id, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id)
+        if job['status'] in ('done', 'failed'):
+            return job
+        time.sleep(0.2)
+    raise AssertionError(f"Job {job_id} did not finish in {timeout}s")
+
+def test_a_job_runs_with_batch_transcription(tmp_path):
+    # The app creates these folders before it starts the queue.
+    (tmp_path / 'outputs').mkdir()
+    (tmp_path / 'work').mkdir()
+    queue = JobQueue(
+        str(tmp_path / 'outputs'), str(tmp_path / 'work'), max_workers=1,
+        cache_dir=str(tmp_path / 'cache'), batch_transcription=True
+    )
+    try:
+        song = write_song(tmp_path / 'song.wav')
+        queue.submit('job', song, {'output_mode': 'lyrics'})
+        job = wait_for(queue, 'job')
+        assert job['status'] == 'done', job['error']
+        assert job['lyrics_url'] and job['audio_url']
+        assert queue.transcriber_stats()['songs'] == 1
+    finally:
+        queue.shutdown()
@@ -0,0 +1,25 @@
+import time
+
+import numpy as np
+
+from processing.metrics import Metrics, stage_timer
+
+def test_stage_peak_rss_covers_only_the_stage():
+    with stage_timer('allocate') as big:
+        block = np.ones(200 * 1024 * 1024 // 8)
+        time.sleep(0.3)
+        del block
+    with stage_timer('idle') as small:
+        time.sleep(0.2)
+    # The lifetime peak would report the first stage's memory again.
+    assert big['peak_rss_mb'] - small['peak_rss_mb'] > 150
+
+def test_render_accumulates_buckets():
+    metrics = Metrics()
+    metrics.observe('tunely_model_load_seconds', 3, model='whisper')
+    metrics.observe('tunely_model_load_seconds', 100, model='whisper')
+    metrics.observe('tunely_model_load_seconds', None, model='whisper')
+    text = metrics.render()
+    assert 'tunely_model_load_seconds_bucket{model="whisper",le="5"} 1' in text
+    assert 'tunely_model_load_seconds_bucket{model="whisper",le="+Inf"} 2' in text
+    assert 'tunely_model_load_seconds_count{model="whisper"} 2' in text
@@ -0,0 +1,55 @@
+import os
+import time
+
+from processing.result_cache import ENTRY_FILE, ResultCache, cache_key
+
+def write_file(path, size):
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    return path
+
+def age(cache, key, seconds):
+    entry_path = os.path.join(cache._entry_dir(key), ENTRY_FILE)
+    then = time.time() - seconds
+    os.utime(entry_path, (then, then))
+
+def test_cache_key_is_stable_and_order_sensitive():
+    assert cache_key('a', {'x': 1, 'y': 2}) == cache_key('a', {'y': 2, 'x': 1})
+    assert cache_key('a', 'b') != cache_key('b', 'a')
+
+def test_put_and_get_round_trip(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'))
+    source = write_file(tmp_path / 'stem.flac', 10)
+    cache.put('separation', 'k' * 64, files={'vocals': str(source)}, data={'speakers': 2})
+    entry = cache.get('separation', 'k' * 64)
+    assert entry['data'] == {'speakers': 2}
+    assert os.path.getsize(entry['files']['vocals']) == 10
+    assert cache.get('separation', 'm' * 64) is None
+    assert cache.stats()['counters'] == {'separation_hits': 1, 'separation_misses': 1}
+
+def test_an_entry_with_missing_files_is_a_miss(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'))
+    entry = cache.put('vad', 'k' * 64, files={'vocals': str(write_file(tmp_path / 'v.wav', 10))})
+    os.remove(entry['files']['vocals'])
+    assert cache.get('vad', 'k' * 64) is None
+
+def test_evicts_least_recently_used_entries_first(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'), max_bytes=10**9, min_age_seconds=60)
+    for key, seconds in (('a', 3000), ('b', 2000), ('c', 1000)):
+        cache.put('stage', key * 64, files={'out': str(write_file(tmp_path / f"{key}.bin", 1000))})
+        age(cache, key * 64, seconds)
+    # Using 'a' makes 'b' the least recently used.
+    assert cache.get('stage', 'a' * 64)
+
+    cache.max_bytes = 2500
+    cache.evict()
+    assert cache.get('stage', 'a' * 64)
+    assert cache.get('stage', 'b' * 64) is None
+    assert cache.get('stage', 'c' * 64)
+
+def test_never_evicts_recently_used_entries(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'), max_bytes=10**9, min_age_seconds=60)
+    cache.put('stage', 'a' * 64, files={'out': str(write_file(tmp_path / 'a.bin', 1000))})
+    cache.max_bytes = 0
+    cache.evict()
+    assert cache.get('stage', 'a' * 64)
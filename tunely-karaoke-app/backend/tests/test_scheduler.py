@@ -0,0 +1,92 @@
+import threading
+
+import pytest
+
+from processing.scheduler import StageScheduler, default_budgets, parse_budgets, stage_lane
+
+def test_default_budgets_scale_with_the_cores():
+    assert default_budgets(1)['render'] == {'slots': 1, 'threads': 1}
+    assert default_budgets(8)['render'] == {'slots': 4, 'threads': 2}
+    assert default_budgets(8)['separation'] == {'slots': 2, 'threads': 4}
+
+def test_parse_budgets_overrides_the_defaults():
+    budgets = parse_budgets('separation=1x6, render=3', 8)
+    assert budgets['separation'] == {'slots': 1, 'threads': 6}
+    assert budgets['render'] == {'slots': 3, 'threads': 2}
+    assert budgets['transcription'] == default_budgets(8)['transcription']
+    assert parse_budgets('', 8) == default_budgets(8)
+
+def test_parse_budgets_rejects_unknown_kinds():
+    with pytest.raises(ValueError):
+        parse_budgets('upscaling=1x2', 8)
+
+def test_stage_lanes():
+    assert stage_lane('preview', 600) == 'preview'
+    assert stage_lane('video', 120) == 'short'
+    assert stage_lane('video', 600) == 'normal'
+    assert stage_lane('separation', None) == 'normal'
+
+def ticket(kind, threads, rank):
+    return {'id': f"{kind}-{rank}", 'kind': kind, 'threads': threads, 'pid': 1, 'rank': [rank, 0.0, 0]}
+
+def holder(kind, threads):
+    return {'kind': kind, 'threads': threads, 'pid': 1}
+
+def make_scheduler(cores=4):
+    budgets = {
+        'separation': {'slots': 1, 'threads': 2},
+        'transcription': {'slots': 1, 'threads': 2},
+        'diarization': {'slots': 1, 'threads': 1},
+        'render': {'slots': 2, 'threads': 2},
+    }
+    return StageScheduler(budgets, cores)
+
+def test_a_stage_waits_for_a_slot_of_its_kind():
+    scheduler = make_scheduler()
+    state = {'running': {'a': holder('separation', 2)}, 'waiting': []}
+    assert not scheduler._can_start(ticket('separation', 2, 2), state)
+    assert scheduler._can_start(ticket('transcription', 2, 2), state)
+
+def test_running_stages_never_hold_more_than_the_cores():
+    scheduler = make_scheduler(cores=4)
+    state = {'running': {'a': holder('separation', 2), 'b': holder('render', 2)}, 'waiting': []}
+    assert not scheduler._can_start(ticket('diarization', 1, 2), state)
+
+def test_a_more_urgent_stage_goes_first():
+    scheduler = make_scheduler()
+    preview = ticket('render', 2, 0)
+    video = ticket('render', 2, 2)
+    state = {'running': {'a': holder('render', 2)}, 'waiting': [preview, video]}
+    assert scheduler._can_start(preview, state)
+    assert not scheduler._can_start(video, state)
+
+def test_a_stage_does_not_wait_for_a_more_urgent_one_that_has_no_slot():
+    scheduler = make_scheduler()
+    waiting_separation = ticket('separation', 2, 0)
+    render = ticket('render', 2, 2)
+    state = {'running': {'a': holder('separation', 2)}, 'waiting': [waiting_separation, render]}
+    assert scheduler._can_start(render, state)
+
+def test_slot_blocks_until_a_slot_is_released():
+    scheduler = make_scheduler()
+    admitted = threading.Event()
+
+    def second_separation():
+        with scheduler.slot('separation', audio_seconds=600):
+            admitted.set()
+
+    with scheduler.slot('separation', audio_seconds=600) as threads:
+        assert threads == 2
+        thread = threading.Thread(target=second_separation)
+        thread.start()
+        assert not admitted.wait(0.2)
+        assert scheduler.stats()['waiting']['separation'] == 1
+    assert admitted.wait(5)
+    thread.join()
+    assert scheduler.stats()['running']['separation'] == 0
+
+def test_cheap_stages_and_a_scheduler_without_budgets_never_wait():
+    with make_scheduler().slot('subtitles') as threads:
+        assert threads is None
+    with StageScheduler().slot('separation') as threads:
+        assert threads is None
@@ -0,0 +1,82 @@
+import random
+
+from processing.speaker_diarizer import assign_speakers, build_turn_index
+
+def word(start, end):
+    return {'text': 'la', 'start': start, 'end': end}
+
+def turn(start, end, speaker):
+    return {'start': start, 'end': end, 'speaker': speaker}
+
+def speakers(words):
+    return [w['speaker'] for w in words]
+
+def test_build_turn_index_sorts_turns_and_tracks_the_longest_reach():
+    index = build_turn_index([turn(5, 6, 'B'), turn(0, 10, 'A'), turn(2, 3, 'C')])
+    assert list(index['starts']) == [0, 2, 5]
+    assert list(index['labels']) == ['A', 'C', 'B']
+    assert list(index['reach']) == [10, 10, 10]
+
+def test_words_go_to_the_turn_active_at_their_center():
+    words = [word(0.1, 0.5), word(1.2, 1.6), word(2.5, 2.9)]
+    turns = [turn(0, 1, 'A'), turn(1, 2, 'B'), turn(2, 3, 'A')]
+    assert speakers(assign_speakers(words, turns)) == ['A', 'B', 'A']
+
+def test_overlapping_turns_go_to_the_earliest_running_one():
+    # Like the old scan over turns sorted by start.
+    words = [word(3.0, 3.2), word(5.0, 5.2), word(7.0, 7.2)]
+    turns = [turn(0, 10, 'A'), turn(2, 4, 'B'), turn(4.5, 12, 'C')]
+    assert speakers(assign_speakers(words, turns)) == ['A', 'A', 'A']
+
+def test_words_between_turns_go_to_the_turn_they_overlap_most():
+    # Centered in the gap, but mostly inside the next turn.
+    words = [word(1.5, 2.9)]
+    turns = [turn(0, 1.8, 'A'), turn(2.5, 4, 'B')]
+    assert speakers(assign_speakers(words, turns)) == ['B']
+
+def test_words_between_turns_can_overlap_an_earlier_turn_most():
+    # A ends before B, but started earlier and overlaps the word more.
+    words = [word(4.0, 5.0)]
+    turns = [turn(0, 4.4, 'A'), turn(4.1, 4.45, 'B'), turn(4.9, 6, 'C')]
+    assert speakers(assign_speakers(words, turns)) == ['A']
+
+def test_words_overlapping_no_turn_go_to_the_nearest_one():
+    words = [word(1.1, 1.3), word(3.6, 3.8), word(9, 9.5)]
+    turns = [turn(0, 1, 'A'), turn(4, 5, 'B')]
+    assert speakers(assign_speakers(words, turns)) == ['A', 'B', 'B']
+
+def test_words_before_the_first_turn_go_to_it():
+    assert speakers(assign_speakers([word(0, 0.2)], [turn(1, 2, 'A')])) == ['A']
+
+def test_missing_and_empty_diarization():
+    assert speakers(assign_speakers([word(0, 1)], None, missing_label='SPEAKER_00')) == ['SPEAKER_00']
+    assert speakers(assign_speakers([word(0, 1)], [])) == ['UNKNOWN']
+    assert assign_speakers([], [turn(0, 1, 'A')]) == []
+
+def reference_speaker(w, turns):
+    """Scans every turn: the earliest one running at the center, else the most overlap, else the nearest."""
+    turns = sorted(turns, key=lambda t: t['start'])
+    center = (w['start'] + w['end']) / 2
+    for t in turns:
+        if t['start'] <= center < t['end']:
+            return t['speaker']
+    def key(item):
+        i, t = item
+        overlap = max(min(w['end'], t['end']) - max(w['start'], t['start']), 0)
+        gap = max(t['start'] - center, center - t['end'], 0)
+        return (-overlap, gap, i) if overlap > 0 else (0, gap, i)
+    return min(enumerate(turns), key=key)[1]['speaker']
+
+def test_matches_a_scan_over_every_turn_with_overlapping_turns():
+    rng = random.Random(0)
+    for _ in range(200):
+        turns = []
+        for i in range(rng.randint(1, 12)):
+            start = round(rng.uniform(0, 30), 1)
+            turns.append(turn(start, start + round(rng.uniform(0.1, 6), 1), f"S{i}"))
+        words = []
+        for _ in range(30):
+            start = round(rng.uniform(-2, 38), 1)
+            words.append(word(start, start + round(rng.uniform(0, 1.5), 1)))
+        expected = [reference_speaker(w, turns) for w in words]
+        assert speakers(assign_speakers(words, turns)) == expected
@@ -0,0 +1,29 @@
+from processing.subtitle_generator import SUBTITLE_STYLES, generate_ass_file, group_lines, max_line_chars
+
+def word(text, start, end, speaker='SPEAKER_00'):
+    return {'text': text, 'start': start, 'end': end, 'speaker': speaker}
+
+def style_lines(path):
+    with open(path, encoding='utf-8-sig') as f:
+        return {line.split(',')[0][len('Style: '):]: line.split(',') for line in f if line.startswith('Style: ')}
+
+def test_every_speaker_style_uses_the_chosen_font_and_margin(tmp_path):
+    path = generate_ass_file([word('la', 0.0, 0.5)], str(tmp_path), 'song', style='large')
+    styles = style_lines(path)
+    assert set(styles) == {'Default', 'Speaker1', 'Speaker2'}
+    for fields in styles.values():
+        assert fields[1] == SUBTITLE_STYLES['large']['fontname']
+        assert int(fields[2]) == SUBTITLE_STYLES['large']['fontsize']
+        assert int(fields[21]) == SUBTITLE_STYLES['large']['margin_v']
+    # Speakers differ from the base style in color only.
+    assert styles['Speaker1'][3] != styles['Default'][3]
+    assert styles['Speaker1'][4:] == styles['Default'][4:]
+
+def test_lines_break_on_pauses_speakers_and_width():
+    words = [word('a', 0, 0.2), word('b', 0.3, 0.5), word('c', 2.0, 2.2), word('d', 2.3, 2.5, 'SPEAKER_01')]
+    assert [[w['text'] for w in line] for line in group_lines(words)] == [['a', 'b'], ['c'], ['d']]
+    long_words = [word('x' * 10, i, i + 0.5) for i in range(6)]
+    assert all(len(' '.join(w['text'] for w in line)) <= 22 for line in group_lines(long_words, max_chars=22))
+
+def test_larger_fonts_fit_fewer_characters():
+    assert max_line_chars('large') < max_line_chars('default') < max_line_chars('compact')
@@ -0,0 +1,23 @@
+import math
+
+from processing.transcriber import plan_windows
+
+def test_a_short_song_is_one_window_owning_everything():
+    assert plan_windows(20.0, window_seconds=30.0, overlap_seconds=5.0) == [(0.0, 20.0, 0.0, math.inf)]
+
+def test_windows_overlap_and_split_ownership_in_the_middle_of_the_overlap():
+    windows = plan_windows(70.0, window_seconds=30.0, overlap_seconds=5.0)
+    assert [(start, end) for start, end, _, _ in windows] == [(0.0, 30.0), (25.0, 55.0), (50.0, 70.0)]
+    assert [(owned_from, owned_until) for _, _, owned_from, owned_until in windows] == [
+        (0.0, 27.5), (27.5, 52.5), (52.5, math.inf)
+    ]
+
+def test_ownership_covers_the_song_without_gaps():
+    windows = plan_windows(301.0)
+    assert windows[0][2] == 0.0 and windows[-1][3] == math.inf
+    for (_, _, _, owned_until), (_, _, next_owned_from, _) in zip(windows, windows[1:]):
+        assert owned_until == next_owned_from
+    assert windows[-1][1] == 301.0
+
+def test_an_empty_song_has_no_windows():
+    assert plan_windows(0.0) == []
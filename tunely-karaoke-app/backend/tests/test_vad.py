@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from processing.vad import OffsetMap
+
+# Song time [2, 5] and [10, 12], joined with a 0.5 s gap: trimmed time
+# [0, 3] is the first region, [3, 3.5] the gap, [3.5, 5.5] the second.
+REGIONS = [[2.0, 5.0], [10.0, 12.0]]
+
+def test_times_map_into_their_region():
+    offsets = OffsetMap(REGIONS, gap_seconds=0.5)
+    assert list(offsets.trimmed_starts) == [0.0, 3.5]
+    assert offsets.to_song_time([0.0, 1.5, 3.5, 4.0, 5.5]) == pytest.approx([2.0, 3.5, 10.0, 10.5, 12.0])
+
+def test_times_in_a_join_gap_clamp_to_the_end_of_the_region_before():
+    offsets = OffsetMap(REGIONS, gap_seconds=0.5)
+    assert offsets.to_song_time([3.2]) == pytest.approx([5.0])
+
+def test_without_regions_times_are_unchanged():
+    assert list(OffsetMap([]).to_song_time(np.array([1.0, 2.0]))) == [1.0, 2.0]
+
+def test_map_intervals_keeps_words_in_the_region_they_start_in():
+    offsets = OffsetMap(REGIONS, gap_seconds=0.5)
+    word = {'text': 'la', 'start': 2.8, 'end': 3.8}
+    assert offsets.map_intervals([word], within_region=True) == [{'text': 'la', 'start': pytest.approx(4.8), 'end': 5.0}]
+    # Speaker turns may span the silence that was cut out.
+    assert offsets.map_intervals([word])[0]['end'] == pytest.approx(10.3)
+
+def test_map_intervals_never_ends_before_the_start():
+    offsets = OffsetMap(REGIONS, gap_seconds=0.5)
+    interval = offsets.map_intervals([{'start': 3.6, 'end': 3.4}])[0]
+    assert interval['end'] >= interval['start']
@@ -0,0 +1,27 @@
+from processing.video_creator import FRAME_RATE, plan_segments, transcode_audio
+
+def event(start, end):
+    return (start, end, 'header', 'text')
+
+def test_segments_cover_the_whole_duration_in_order():
+    events = [event(t, t + 3.0) for t in range(0, 120, 4)]
+    plan = plan_segments(events, 120.0, 4)
+    assert plan[0][0] == 0.0 and plan[-1][1] == 120.0
+    for (_, end), (next_start, _) in zip(plan, plan[1:]):
+        assert end == next_start
+
+def test_cuts_fall_between_lines_on_frame_boundaries():
+    events = [event(t, t + 3.0) for t in range(0, 120, 4)]
+    for start, _ in plan_segments(events, 120.0, 4)[1:]:
+        assert not any(event_start < start < event_end for event_start, event_end, _, _ in events)
+        assert abs(start * FRAME_RATE - round(start * FRAME_RATE)) < 1e-9
+
+def test_no_more_segments_than_min_segment_length_allows():
+    assert len(plan_segments([], 25.0, 8)) == 2
+    assert plan_segments([], 5.0, 4) == [(0.0, 5.0)]
+
+def test_a_line_spanning_the_song_leaves_no_place_to_cut():
+    assert plan_segments([event(0.0, 60.0)], 60.0, 4) == [(0.0, 60.0)]
+
+def test_transcode_audio_reports_failure_instead_of_raising(tmp_path):
+    assert transcode_audio(str(tmp_path / 'missing.wav'), str(tmp_path / 'out.m4a'), codec='no-such-codec') is False